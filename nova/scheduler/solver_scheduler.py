@@ -20,16 +20,23 @@ cost metrics. The solution is designed to work with pluggable solvers.
 A default solver implementation that uses PULP is included.
 """
 
+import collections
 import copy
 
+from eventlet import event
+from eventlet import greenthread
+from eventlet import timeout
 from oslo.config import cfg
 
+from nova import db
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.scheduler import driver
 from nova.scheduler import filter_scheduler
+from nova.scheduler.solvers import utils as solver_utils
 from nova.scheduler import weights
 from nova import solver_scheduler_exception
 
@@ -52,10 +59,134 @@ solver_opts = [
                   help='Whether to use a fallback scheduler in case the '
                        'solver scheduler fails to get a solution because '
                        'of a solver failure.'),
+    cfg.IntOpt('request_coalescing_window_ms',
+               default=0,
+               help='How long in milliseconds select_destinations waits '
+                    'for other requests with the same placement '
+                    'requirements, so that they are placed by a single '
+                    'solve. Requests which only differ in flavor are '
+                    'placed together if the solver supports multiple '
+                    'flavors. Set to 0 to disable request coalescing.'),
+    cfg.IntOpt('num_alternate_hosts',
+               default=3,
+               help='How many alternate hosts the solver ranks for the '
+                    'instances of a request. When the chosen host of an '
+                    'instance fails, it is rescheduled to the best '
+                    'alternate whose state has not changed since and whose '
+                    'compute service is up and enabled, without solving '
+                    'again. Set to 0 to disable alternates.'),
+    cfg.IntOpt('speculative_fallback_deadline_ms',
+               default=0,
+               help='If the fallback scheduler is enabled, run it side by '
+                    'side with the solver on the same hosts, and use its '
+                    'result when the solver does not finish within this '
+                    'many milliseconds. Set to 0 to only run the fallback '
+                    'scheduler after the solver failed.'),
+    cfg.IntOpt('solver_circuit_breaker_window',
+               default=20,
+               help='How many recent solves the solver circuit breaker '
+                    'looks at. When enough of them failed or were slow, '
+                    'requests go straight to the fallback scheduler for '
+                    'a while. Set to 0 to disable the circuit breaker.'),
+    cfg.FloatOpt('solver_circuit_breaker_failure_ratio',
+                 default=0.5,
+                 help='The ratio of failed or slow solves among the recent '
+                      'solves from which the solver circuit breaker '
+                      'opens.'),
+    cfg.IntOpt('solver_circuit_breaker_slow_solve_ms',
+               default=0,
+               help='Solves taking longer than this many milliseconds '
+                    'count as failures for the solver circuit breaker. '
+                    'Set to 0 to only count solver failures.'),
+    cfg.IntOpt('solver_circuit_breaker_cooldown_seconds',
+               default=30,
+               help='How long in seconds the solver circuit breaker sends '
+                    'requests to the fallback scheduler once open, before '
+                    'letting a probe request through to the solver.'),
 ]
 
 CONF.register_opts(solver_opts, group='solver_scheduler')
 
+# How many instances the alternate hosts are remembered for.
+_ALTERNATES_CACHE_SIZE = 1024
+
+
+class SolverCircuitBreaker(object):
+    """Track recent solver outcomes, to stop using a failing solver.
+
+    The breaker is closed while solves mostly succeed. Once the window of
+    recent solves is full and the ratio of failed or slow ones reaches
+    solver_circuit_breaker_failure_ratio, it opens and no request is let
+    through for solver_circuit_breaker_cooldown_seconds. It is then half
+    open: one probe request at a time is let through, and the breaker
+    closes if the probe succeeds or opens again if it fails.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self):
+        self.window = CONF.solver_scheduler.solver_circuit_breaker_window
+        self.outcomes = collections.deque(maxlen=max(self.window, 1))
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.probing = False
+
+    def allow_request(self):
+        """Whether a request may be sent to the solver."""
+        if self.window <= 0 or self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            cooldown = (
+                CONF.solver_scheduler.solver_circuit_breaker_cooldown_seconds)
+            if timeutils.is_older_than(self.opened_at, cooldown):
+                LOG.info(_("Solver circuit breaker is half open."))
+                self.state = self.HALF_OPEN
+                self.probing = False
+            else:
+                return False
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def record(self, success, duration_ms):
+        """Record the outcome of a solve and how long it took."""
+        if self.window <= 0:
+            return
+        slow_solve_ms = (
+                CONF.solver_scheduler.solver_circuit_breaker_slow_solve_ms)
+        if slow_solve_ms > 0 and duration_ms > slow_solve_ms:
+            success = False
+
+        if self.state == self.CLOSED:
+            self.outcomes.append(success)
+            failure_ratio = (float(self.outcomes.count(False)) /
+                             len(self.outcomes))
+            max_failure_ratio = (
+                CONF.solver_scheduler.solver_circuit_breaker_failure_ratio)
+            if (len(self.outcomes) >= self.window and
+                    failure_ratio >= max_failure_ratio):
+                LOG.warn(_("Solver circuit breaker is open, %(failures)s of "
+                           "the last %(solves)s solves failed or were "
+                           "slow."),
+                         {'failures': self.outcomes.count(False),
+                          'solves': len(self.outcomes)})
+                self._open()
+        elif self.state == self.HALF_OPEN and self.probing:
+            self.probing = False
+            if success:
+                LOG.info(_("Solver circuit breaker is closed."))
+                self.state = self.CLOSED
+                self.outcomes.clear()
+            else:
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = timeutils.utcnow()
+
 
 class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
     """Scheduler that picks hosts using a Constraint Solver
@@ -68,6 +199,9 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
                 CONF.solver_scheduler.scheduler_host_solver)
         self.fallback_scheduler = importutils.import_object(
                 CONF.solver_scheduler.fallback_scheduler)
+        self._coalescing_batches = {}
+        self._alternates = solver_utils.LRUCache(_ALTERNATES_CACHE_SIZE)
+        self.solver_circuit_breaker = SolverCircuitBreaker()
 
     def schedule_run_instance(self, context, request_spec,
                               admin_password, injected_files,
@@ -89,18 +223,11 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
                    'instance_uuids': instance_uuids})
         LOG.debug(_("Request Spec: %s") % request_spec)
 
-        orig_filter_properties = copy.deepcopy(filter_properties)
         try:
             weighed_hosts = self._schedule(context, request_spec,
                                             filter_properties, instance_uuids)
         except solver_scheduler_exception.SolverFailed:
-            if CONF.solver_scheduler.enable_fallback_scheduler:
-                LOG.warn(_("Fallback scheduler used."))
-                filter_properties = orig_filter_properties
-                weighed_hosts = self.fallback_scheduler._schedule(context,
-                            request_spec, filter_properties, instance_uuids)
-            else:
-                weighed_hosts = []
+            weighed_hosts = []
 
         # NOTE: Pop instance_uuids as individual creates do not need the
         # set of uuids. Do not pop before here as the upper exception
@@ -147,20 +274,122 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
 
     def select_destinations(self, context, request_spec, filter_properties):
         """Selects a filtered set of hosts and nodes."""
+        if CONF.solver_scheduler.request_coalescing_window_ms > 0:
+            return self._select_destinations_coalesced(context, request_spec,
+                                                       filter_properties)
+        return self._select_destinations(context, request_spec,
+                                         filter_properties)
+
+    def _select_destinations_coalesced(self, context, request_spec,
+                                       filter_properties):
+        """Place compatible requests which arrive within the coalescing
+        window with one solve, and give each caller its own part of the
+        result. If the solver supports multiple flavors, requests which
+        only differ in flavor are compatible. If the joint request cannot
+        be placed, every request is placed on its own.
+        """
+        key = solver_utils.get_request_signature(request_spec,
+                filter_properties,
+                ignore_flavor=self.hosts_solver.supports_multiple_flavors)
+
+        batch = self._coalescing_batches.get(key)
+        if batch is not None:
+            index = len(batch['requests'])
+            batch['requests'].append((request_spec, filter_properties))
+            results = batch['done'].wait()
+        else:
+            batch = {'requests': [(request_spec, filter_properties)],
+                     'done': event.Event()}
+            self._coalescing_batches[key] = batch
+            index = 0
+            greenthread.sleep(
+                    CONF.solver_scheduler.request_coalescing_window_ms /
+                    1000.0)
+            del self._coalescing_batches[key]
+            results = None
+            try:
+                if len(batch['requests']) > 1:
+                    LOG.debug(_("Coalesced %d requests into one solve."),
+                              len(batch['requests']))
+                    results = self._select_destinations_batch(context,
+                                                        batch['requests'])
+            finally:
+                batch['done'].send(results)
+
+        if results is None:
+            return self._select_destinations(context, request_spec,
+                                             filter_properties)
+        return results[index]
+
+    def _select_destinations_batch(self, context, requests):
+        """Place a list of (request_spec, filter_properties) requests with
+        one solve. Requests of the same flavor are merged into one request,
+        and requests of different flavors are placed together by the
+        solver. Returns the destinations of each request, or None if the
+        requests cannot be placed together.
+        """
+        groups = []
+        group_indexes = {}
+        for index, (request_spec, filter_properties) in enumerate(requests):
+            key = solver_utils.get_request_signature(request_spec,
+                                                     filter_properties)
+            if key not in group_indexes:
+                group_indexes[key] = len(groups)
+                groups.append([])
+            groups[group_indexes[key]].append(index)
+
+        request_specs = [self._merge_request_specs(
+                                [requests[index][0] for index in group])
+                         for group in groups]
+        filter_properties_list = [copy.deepcopy(requests[group[0]][1])
+                                  for group in groups]
+        try:
+            if len(groups) == 1:
+                dests_list = [self._select_destinations(context,
+                        request_specs[0], filter_properties_list[0])]
+            else:
+                LOG.debug(_("Placing %d flavors with one solve."),
+                          len(groups))
+                dests_list = self._select_destinations_multi(context,
+                        request_specs, filter_properties_list)
+        except (exception.NoValidHost,
+                solver_scheduler_exception.SolverFailed):
+            return None
+
+        results = [None for request in requests]
+        for group, dests in zip(groups, dests_list):
+            offset = 0
+            for index in group:
+                num_instances = requests[index][0]['num_instances']
+                results[index] = dests[offset:offset + num_instances]
+                offset += num_instances
+        return results
+
+    def _merge_request_specs(self, request_specs):
+        request_spec = dict(request_specs[0])
+        request_spec['num_instances'] = sum(spec['num_instances']
+                                            for spec in request_specs)
+        if all(spec.get('instance_uuids') for spec in request_specs):
+            request_spec['instance_uuids'] = sum(
+                    [spec['instance_uuids'] for spec in request_specs], [])
+        else:
+            request_spec.pop('instance_uuids', None)
+        return request_spec
+
+    def _select_destinations(self, context, request_spec, filter_properties):
         num_instances = request_spec['num_instances']
         instance_uuids = request_spec.get('instance_uuids')
-        orig_filter_properties = copy.deepcopy(filter_properties)
+
+        dests = self._select_alternate_destinations(context, request_spec,
+                                                    filter_properties)
+        if dests:
+            return dests
+
         try:
             selected_hosts = self._schedule(context, request_spec,
                                             filter_properties, instance_uuids)
         except solver_scheduler_exception.SolverFailed:
-            if CONF.solver_scheduler.enable_fallback_scheduler:
-                LOG.warn(_("Fallback scheduler used."))
-                filter_properties = orig_filter_properties
-                selected_hosts = self.fallback_scheduler._schedule(context,
-                            request_spec, filter_properties, instance_uuids)
-            else:
-                selected_hosts = []
+            selected_hosts = []
 
         # Couldn't fulfill the request_spec
         if len(selected_hosts) < num_instances:
@@ -170,11 +399,156 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
                       limits=host.obj.limits) for host in selected_hosts]
         return dests
 
+    def _record_alternates(self, alternates, filter_properties):
+        """Remember the alternate hosts ranked for the instances of a
+        request, along with the generations of their host states.
+        """
+        instance_uuids = filter_properties.get('instance_uuids')
+        if not alternates or not instance_uuids:
+            return
+        request_spec = filter_properties.get('request_spec') or {}
+        entry = {'signature': solver_utils.get_request_signature(
+                                                    request_spec, {}),
+                 'hosts': [(host_state, host_state.generation)
+                           for host_state in alternates]}
+        for instance_uuid in instance_uuids:
+            self._alternates.put(instance_uuid, entry)
+
+    def _is_alternate_usable(self, context, host_state, generation):
+        """Whether an alternate host can still take an instance: its host
+        state is unchanged and still known to the host manager, and its
+        compute service is up and enabled.
+        """
+        if host_state.generation != generation:
+            return False
+        # NOTE: a compute node which died or was deleted stops reporting,
+        # so its generation no longer changes.
+        if (self.host_manager.host_state_map.get(
+                (host_state.host, host_state.nodename)) is not host_state):
+            return False
+        try:
+            service = db.service_get_by_compute_host(context.elevated(),
+                                                     host_state.host)
+        except exception.ComputeHostNotFound:
+            return False
+        return (not service['disabled'] and
+                self.servicegroup_api.service_is_up(service))
+
+    def _select_alternate_destinations(self, context, request_spec,
+                                       filter_properties):
+        """Serve the reschedule of an instance from the alternate hosts
+        ranked when it was placed, without fetching host states or solving
+        again. An alternate can only be used while its host state is
+        unchanged and its compute service is up and enabled. Returns None
+        if no alternate can be used.
+        """
+        retry = filter_properties.get('retry') or {}
+        instance_uuids = request_spec.get('instance_uuids') or []
+        if not retry.get('hosts') or len(instance_uuids) != 1:
+            return None
+        entry = self._alternates.get(instance_uuids[0])
+        if (entry is None or entry['signature'] !=
+                solver_utils.get_request_signature(request_spec, {})):
+            return None
+
+        failed_hosts = [tuple(host) for host in retry['hosts']]
+        for host_state, generation in entry['hosts']:
+            if ((host_state.host, host_state.nodename) not in failed_hosts
+                    and self._is_alternate_usable(context, host_state,
+                                                  generation)):
+                break
+        else:
+            return None
+
+        instance_properties = request_spec['instance_properties']
+        properties = instance_properties.copy()
+        properties['uuid'] = instance_uuids[0]
+        self._populate_retry(filter_properties, properties)
+
+        LOG.debug(_("Rescheduling instance %(instance_uuid)s to alternate "
+                    "host %(host)s."),
+                  {'instance_uuid': instance_uuids[0], 'host': host_state})
+        host_state.consume_from_instance(instance_properties)
+        return [dict(host=host_state.host, nodename=host_state.nodename,
+                     limits=host_state.limits)]
+
+    def _select_destinations_multi(self, context, request_specs,
+                                   filter_properties_list):
+        """Place requests of different flavors with one solve and return
+        the destinations of each request. Raises NoValidHost if any of
+        the requests cannot be fulfilled.
+        """
+        selected_hosts_list = self._schedule_multi(context, request_specs,
+                                                   filter_properties_list)
+
+        dests_list = []
+        for request_spec, selected_hosts in zip(request_specs,
+                                                selected_hosts_list):
+            if len(selected_hosts) < request_spec['num_instances']:
+                raise exception.NoValidHost(reason='')
+            dests_list.append([dict(host=host.obj.host,
+                                    nodename=host.obj.nodename,
+                                    limits=host.obj.limits)
+                               for host in selected_hosts])
+        return dests_list
+
     def _schedule(self, context, request_spec, filter_properties,
                   instance_uuids=None):
         """Returns a list of hosts that meet the required specs,
         ordered by their fitness.
         """
+        fallback_filter_properties = None
+        if CONF.solver_scheduler.enable_fallback_scheduler:
+            # NOTE: preparing the request only replaces filter properties,
+            # except for the retry state which it updates in place, so this
+            # keeps them as they were passed until the fallback scheduler
+            # needs a copy of them.
+            fallback_filter_properties = dict(filter_properties)
+            if filter_properties.get('retry'):
+                fallback_filter_properties['retry'] = dict(
+                        filter_properties['retry'])
+        self._prepare_filter_properties(context, request_spec,
+                                        filter_properties, instance_uuids)
+
+        # NOTE(Yathi): Moving the host selection logic to a new method so that
+        # the subclasses can override the behavior.
+        selected_hosts = self._get_selected_hosts(context, filter_properties,
+                fallback_filter_properties=fallback_filter_properties)
+        return selected_hosts
+
+    def _schedule_multi(self, context, request_specs,
+                        filter_properties_list):
+        """Returns, for each request, the list of hosts selected for its
+        instances, placing all the requests with one solve. The requests
+        may only differ in flavor.
+        """
+        for request_spec, filter_properties in zip(request_specs,
+                                                   filter_properties_list):
+            self._prepare_filter_properties(context, request_spec,
+                    filter_properties, request_spec.get('instance_uuids'))
+
+        elevated = context.elevated()
+        hosts = self._get_all_host_states(elevated)
+        hosts = self.host_manager.get_hosts_stripping_ignored_and_forced(
+                                      hosts, filter_properties_list[0])
+
+        host_instance_combinations_list = self.hosts_solver.solve_multi(
+                                    list(hosts), filter_properties_list)
+        LOG.debug(_("solver results: %(host_instance_tuples_list)s") %
+                    {"host_instance_tuples_list":
+                     host_instance_combinations_list})
+        selected_hosts_list = []
+        for host_instance_combinations, filter_properties in zip(
+                host_instance_combinations_list, filter_properties_list):
+            selected_hosts = [weights.WeighedHost(host, 1)
+                        for (host, instance) in host_instance_combinations]
+            self._consume_selected_hosts(selected_hosts, filter_properties)
+            selected_hosts_list.append(selected_hosts)
+        return selected_hosts_list
+
+    def _prepare_filter_properties(self, context, request_spec,
+                                   filter_properties, instance_uuids=None):
+        """Fill in the filter properties the solver needs for a request."""
         instance_properties = request_spec['instance_properties']
         instance_type = request_spec.get("instance_type", None)
 
@@ -205,16 +579,15 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
 
         self.populate_filter_properties(request_spec, filter_properties)
 
-        # NOTE(Yathi): Moving the host selection logic to a new method so that
-        # the subclasses can override the behavior.
-        selected_hosts = self._get_selected_hosts(context, filter_properties)
-        return selected_hosts
-
-    def _get_selected_hosts(self, context, filter_properties):
+    def _get_selected_hosts(self, context, filter_properties,
+                            fallback_filter_properties=None):
         """Returns the list of hosts that meet the required specs for
         each instance in the list of instance_uuids.
          Here each instance in instance_uuids have the same requirement
          as specified by request_spec.
+         If fallback_filter_properties, the filter properties as they were
+         passed, are given, the fallback scheduler is used when the solver
+         cannot be.
         """
         elevated = context.elevated()
         # this returns a host iterator
@@ -224,8 +597,55 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
                                       hosts, filter_properties)
 
         list_hosts = list(hosts)
-        host_instance_combinations = self.hosts_solver.solve(
+        if fallback_filter_properties is not None:
+            if not self.solver_circuit_breaker.allow_request():
+                LOG.debug(_("Solver circuit breaker is open, fallback "
+                            "scheduler used."))
+                return self._get_fallback_selected_hosts(list_hosts,
+                        filter_properties, fallback_filter_properties)
+            if CONF.solver_scheduler.speculative_fallback_deadline_ms > 0:
+                return self._get_speculative_selected_hosts(list_hosts,
+                        filter_properties, fallback_filter_properties)
+        try:
+            host_instance_combinations, alternates = self._solve(
                                             list_hosts, filter_properties)
+        except solver_scheduler_exception.SolverFailed:
+            if fallback_filter_properties is None:
+                raise
+            LOG.warn(_("Fallback scheduler used."))
+            return self._get_fallback_selected_hosts(list_hosts,
+                    filter_properties, fallback_filter_properties)
+        return self._select_solution(host_instance_combinations, alternates,
+                                     filter_properties)
+
+    def _solve(self, hosts, filter_properties):
+        """Returns the host-instance tuples of the solution, and the
+        alternate hosts for its instances.
+        """
+        num_alternates = CONF.solver_scheduler.num_alternate_hosts
+        start = timeutils.utcnow()
+        try:
+            if num_alternates > 0:
+                solution = self.hosts_solver.solve_with_alternates(hosts,
+                        filter_properties, num_alternates)
+            else:
+                solution = (self.hosts_solver.solve(hosts, filter_properties),
+                            [])
+        except Exception:
+            self.solver_circuit_breaker.record(False,
+                                               self._get_duration_ms(start))
+            raise
+        self.solver_circuit_breaker.record(True, self._get_duration_ms(start))
+        return solution
+
+    def _get_duration_ms(self, start):
+        return timeutils.delta_seconds(start, timeutils.utcnow()) * 1000
+
+    def _select_solution(self, host_instance_combinations, alternates,
+                         filter_properties):
+        """Returns the hosts selected by a solution, consuming its
+        instances from the host states.
+        """
         LOG.debug(_("solver results: %(host_instance_tuples_list)s") %
                     {"host_instance_tuples_list": host_instance_combinations})
         # NOTE(Yathi): Not using weights in solver scheduler,
@@ -234,5 +654,146 @@ class ConstraintSolverScheduler(filter_scheduler.FilterScheduler):
         # FilterScheduler class
         selected_hosts = [weights.WeighedHost(host, 1)
                             for (host, instance) in host_instance_combinations]
+        self._consume_selected_hosts(selected_hosts, filter_properties)
+        self._record_alternates(alternates, filter_properties)
 
         return selected_hosts
+
+    def _get_speculative_selected_hosts(self, hosts, filter_properties,
+                                        fallback_filter_properties):
+        """Run the solver and the fallback scheduler side by side.
+
+        The fallback scheduler selects hosts from copies of the host
+        states, so that it does not change what the solver sees. The
+        solution is used if the solver finishes within
+        speculative_fallback_deadline_ms, otherwise the hosts selected by
+        the fallback scheduler are, and their instances are consumed from
+        the actual host states. A solver still running past the deadline
+        is killed, which takes effect when the solve next yields, and is
+        recorded as a failed solve.
+        """
+        host_copies = [self._copy_host_state(host) for host in hosts]
+        originals = dict((id(host_copy), host)
+                         for host_copy, host in zip(host_copies, hosts))
+        fallback_filter_properties = self._get_fallback_filter_properties(
+                filter_properties, fallback_filter_properties)
+
+        solver_thread = greenthread.spawn(self._solve, hosts,
+                                          filter_properties)
+        fallback_thread = greenthread.spawn(self._schedule_fallback,
+                host_copies, filter_properties, fallback_filter_properties)
+
+        deadline_ms = CONF.solver_scheduler.speculative_fallback_deadline_ms
+        solution = None
+        try:
+            with timeout.Timeout(deadline_ms / 1000.0, False):
+                solution = solver_thread.wait()
+        except solver_scheduler_exception.SolverFailed:
+            LOG.warn(_("Fallback scheduler used."))
+        else:
+            if solution is None:
+                LOG.warn(_("Solver did not finish within %d ms, fallback "
+                           "scheduler used."), deadline_ms)
+        if solution is None and not solver_thread.dead:
+            solver_thread.kill()
+            self.solver_circuit_breaker.record(False, deadline_ms)
+        if solution is not None:
+            fallback_thread.kill()
+            host_instance_combinations, alternates = solution
+            return self._select_solution(host_instance_combinations,
+                                         alternates, filter_properties)
+
+        selected_hosts = [weights.WeighedHost(originals[id(host.obj)],
+                                              host.weight)
+                          for host in fallback_thread.wait()]
+        self._consume_selected_hosts(selected_hosts, filter_properties)
+        self._update_group_hosts(filter_properties,
+                                 fallback_filter_properties)
+        return selected_hosts
+
+    def _copy_host_state(self, host_state):
+        """Copy a host state, so that consuming instances from the copy
+        leaves the host state as it is.
+        """
+        host_copy = copy.copy(host_state)
+        # NOTE: consuming an instance and filtering the host update these
+        # in place, while the service and the other attributes are only
+        # replaced.
+        for name in ('limits', 'num_instances_by_os_type',
+                     'num_instances_by_project', 'pci_stats', 'task_states',
+                     'vm_states'):
+            setattr(host_copy, name, copy.deepcopy(getattr(host_state, name)))
+        return host_copy
+
+    def _schedule_fallback(self, hosts, filter_properties,
+                           fallback_filter_properties):
+        """Schedule the request with the fallback scheduler, over the given
+        host states instead of host states it fetches itself.
+
+        fallback_filter_properties are a copy of the filter properties,
+        which the fallback scheduler prepares and updates as it schedules.
+        """
+        # NOTE: the fallback scheduler is copied so that concurrent
+        # requests do not see each other's host states.
+        fallback_scheduler = copy.copy(self.fallback_scheduler)
+        fallback_scheduler._get_all_host_states = lambda context: hosts
+        return fallback_scheduler._schedule(filter_properties['context'],
+                filter_properties['request_spec'], fallback_filter_properties,
+                filter_properties['instance_uuids'])
+
+    def _get_fallback_filter_properties(self, filter_properties,
+                                        unprepared_filter_properties):
+        """Returns a copy of the prepared filter properties for the fallback
+        scheduler, with the retry state as it was passed, so that preparing
+        the request again counts the attempt once.
+
+        The values which preparing the request replaces are shared rather
+        than copied.
+        """
+        fallback_filter_properties = dict(filter_properties)
+        fallback_filter_properties.pop('retry', None)
+        memo = {}
+        for key in ('context', 'request_spec', 'config_options',
+                    'instance_type', 'instance_uuids'):
+            value = filter_properties.get(key)
+            memo[id(value)] = value
+        fallback_filter_properties = copy.deepcopy(fallback_filter_properties,
+                                                   memo)
+        if unprepared_filter_properties.get('retry'):
+            fallback_filter_properties['retry'] = copy.deepcopy(
+                    unprepared_filter_properties['retry'])
+        return fallback_filter_properties
+
+    def _update_group_hosts(self, filter_properties,
+                            fallback_filter_properties):
+        """Take over the instance group hosts which the fallback scheduler
+        updated, if the request is in an instance group.
+        """
+        if 'group_hosts' in fallback_filter_properties:
+            filter_properties['group_hosts'] = (
+                    fallback_filter_properties['group_hosts'])
+
+    def _get_fallback_selected_hosts(self, hosts, filter_properties,
+                                     fallback_filter_properties):
+        """Select hosts with the fallback scheduler, which consumes the
+        instances from the host states fetched for the solver.
+        """
+        fallback_filter_properties = self._get_fallback_filter_properties(
+                filter_properties, fallback_filter_properties)
+        selected_hosts = self._schedule_fallback(hosts, filter_properties,
+                                                 fallback_filter_properties)
+        self._update_group_hosts(filter_properties,
+                                 fallback_filter_properties)
+        return selected_hosts
+
+    def _consume_selected_hosts(self, selected_hosts, filter_properties):
+        """Consume the resources of the placed instances from the cached
+        host states, so that requests solved before the next compute node
+        update do not count on the same free capacity.
+        """
+        request_spec = filter_properties.get('request_spec') or {}
+        instance_properties = request_spec.get('instance_properties')
+        if not instance_properties:
+            return
+        for selected_host in selected_hosts:
+            selected_host.obj.consume_from_instance(instance_properties)
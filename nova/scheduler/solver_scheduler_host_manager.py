@@ -45,8 +45,33 @@ class SolverSchedulerHostState(host_manager.HostState):
     """
 
     def __init__(self, *args, **kwargs):
+        # NOTE: the generation is bumped whenever the state changes, either
+        # by a new compute node report or by an instance placed on the host,
+        # so that results derived from the state can tell they are stale.
+        # HostState may apply a compute node report while initializing.
+        self.generation = 0
         super(SolverSchedulerHostState, self).__init__(*args, **kwargs)
 
+    def update_from_compute_node(self, compute):
+        """Update information about a host from its compute_node info.
+
+        HostState skips reports older than its last update, which may be
+        an instance consumed from this host state. The generation is only
+        bumped when a report with a new timestamp was applied.
+        """
+        last_updated = self.updated
+        super(SolverSchedulerHostState, self).update_from_compute_node(
+                                                                    compute)
+        if (compute['updated_at'] is not None and
+                self.updated == compute['updated_at'] and
+                self.updated != last_updated):
+            self.generation += 1
+
+    def consume_from_instance(self, instance):
+        """Incrementally update host state from an instance."""
+        super(SolverSchedulerHostState, self).consume_from_instance(instance)
+        self.generation += 1
+
 
 class SolverSchedulerHostManager(host_manager.HostManager):
     """HostManager class for solver scheduler."""
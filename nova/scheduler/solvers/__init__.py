@@ -17,10 +17,22 @@
 Scheduler host constraint solvers
 """
 
+import datetime
+import hashlib
+
+from eventlet import greenthread
 from oslo.config import cfg
 
+from nova import db
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.scheduler.solvers import costs
 from nova.scheduler.solvers import constraints
+from nova.scheduler.solvers import problem
+from nova.scheduler.solvers import utils as solver_utils
+from nova import servicegroup
 
 scheduler_solver_opts =[
         cfg.ListOpt('scheduler_solver_costs',
@@ -32,11 +44,40 @@ scheduler_solver_opts =[
                             'NonTrivialSolutionConstraint',
                             'ValidSolutionConstraint'],
                     help='Which constraints to use in scheduler solver'),
+        cfg.IntOpt('scheduler_solver_solution_cache_size',
+                   default=128,
+                   help='How many solutions the scheduler solver keeps, '
+                        'so that a request identical to an earlier one is '
+                        'answered without solving again while the states '
+                        'of its candidate hosts are unchanged. Set to 0 to '
+                        'disable the solution cache.'),
+        cfg.IntOpt('scheduler_solver_solution_cache_seconds',
+                   default=60,
+                   help='How long in seconds the scheduler solver keeps a '
+                        'solution, which bounds how long changes the '
+                        'solution cache does not track, such as host '
+                        'attestations, can be missed.'),
+        cfg.IntOpt('scheduler_solver_infeasible_cache_seconds',
+                   default=30,
+                   help='How long in seconds a request proven infeasible '
+                        'is rejected without solving again, as long as the '
+                        'candidate hosts, their services and aggregates, '
+                        'and the capacities or states the proof depends on '
+                        'do not change. Set to 0 to disable the infeasible '
+                        'request cache.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(scheduler_solver_opts, group='solver_scheduler')
 
+LOG = logging.getLogger(__name__)
+
+# Rows of structural constraints by constraint class and problem shape.
+_structural_blocks = solver_utils.LRUCache(64)
+
+# How many infeasible requests a solver remembers.
+_INFEASIBLE_CACHE_SIZE = 256
+
 
 class BaseVariables(object):
     """Defines the convention of variables to be used in solvers.
@@ -49,14 +90,35 @@ class BaseVariables(object):
         raise NotImplementedError
 
 
+class IndexVariables(BaseVariables):
+    """Variables which are their own (host index, instance index) in the
+    host-instance matrix, used to read costs and constraints as matrices.
+    """
+
+    def populate_variables(self, num_hosts, num_instances):
+        self.host_instance_matrix = [
+                [(i, j) for j in xrange(num_instances)]
+                for i in xrange(num_hosts)]
+
+
 class BaseHostSolver(object):
     """Base class for host constraint solvers."""
 
     # Overwrite in sub-class
     variables_cls = BaseVariables
 
+    # Whether the solver implements solve_multi, placing requests of
+    # different flavors with one solve.
+    supports_multiple_flavors = False
+
     def __init__(self):
         self.variables = self.variables_cls()
+        self.cost_classes = self._get_cost_classes()
+        self.constraint_classes = self._get_constraint_classes()
+        self.solution_cache = solver_utils.CountingLRUCache(
+                CONF.solver_scheduler.scheduler_solver_solution_cache_size)
+        self.infeasible_cache = solver_utils.LRUCache(_INFEASIBLE_CACHE_SIZE)
+        self.servicegroup_api = servicegroup.API()
 
     def _get_cost_classes(self):
         """Get cost classes from configuration."""
@@ -81,9 +143,459 @@ class BaseHostSolver(object):
                 constraint_classes.append(constraint)
         return constraint_classes
 
+    def _calculate_host_instance_cost_matrix(self, cost_matrix):
+        new_cost_matrix = cost_matrix
+        if not cost_matrix:
+            return new_cost_matrix
+        first_column = [row[0] for row in cost_matrix]
+        last_column = [row[-1] for row in cost_matrix]
+        if sum(first_column) < sum(last_column):
+            offset = min(first_column)
+            sign = 1
+        else:
+            offset = max(first_column)
+            sign = -1
+        for i in xrange(len(cost_matrix)):
+            for j in xrange(len(cost_matrix[i])):
+                new_cost_matrix[i][j] = sign * (
+                                        (cost_matrix[i][j] - offset) ** 2)
+        return new_cost_matrix
+
+    def _get_service_state(self, host_state):
+        """Return whether the service of a host is disabled and whether it
+        is up, or None if the host state has no service.
+        """
+        service = getattr(host_state, 'service', None)
+        if not service:
+            return None
+        return (service.get('disabled'),
+                self.servicegroup_api.service_is_up(service))
+
+    def _get_aggregate_state(self, hosts, filter_properties):
+        """Return the ids, candidate hosts and metadata of the aggregates
+        of the candidate hosts, as a sorted list, or an empty list if the
+        request has no context to look them up.
+        """
+        context = filter_properties.get('context')
+        if context is None:
+            return []
+        host_names = set(host.host for host in hosts)
+        aggregate_state = []
+        for aggregate in db.aggregate_get_all(context.elevated()):
+            aggregate_hosts = sorted(host_names & set(aggregate['hosts']))
+            if aggregate_hosts:
+                aggregate_state.append(
+                        (aggregate['id'], aggregate_hosts,
+                         sorted(aggregate['metadetails'].iteritems())))
+        return sorted(aggregate_state)
+
+    def _get_candidate_state(self, hosts, filter_properties):
+        """Return the candidate hosts with the state of their services, and
+        the aggregates of the candidate hosts. Besides the host states
+        themselves, solutions and infeasibility depend on these.
+        """
+        return [[(host.host, host.nodename, self._get_service_state(host))
+                 for host in hosts],
+                self._get_aggregate_state(hosts, filter_properties)]
+
+    def _get_solution_cache_key(self, hosts, filter_properties,
+                                candidate_state, *args):
+        """Return a digest of everything a solution depends on besides
+        the host states themselves: the request, the configured costs and
+        constraints, the candidate state and any extra args. Returns None
+        if solutions are not cached, or a host state has no generation to
+        tell whether it changed.
+        """
+        if self.solution_cache.max_size <= 0:
+            return None
+        if any(getattr(host, 'generation', None) is None for host in hosts):
+            return None
+        request_spec = filter_properties.get('request_spec') or {}
+        key = [solver_utils.get_request_signature(request_spec,
+                                                  filter_properties),
+               filter_properties['num_instances'],
+               [cost.__name__ for cost in self.cost_classes],
+               [constraint.__name__ for constraint in
+                self.constraint_classes],
+               candidate_state,
+               list(args)]
+        return hashlib.sha1(jsonutils.dumps(key)).hexdigest()
+
+    def _is_cached_solution_current(self, entry, hosts, filter_properties):
+        """Whether a cached solution still holds for the host states.
+
+        It does while the host states are unchanged. For the same
+        instances, it also does once the instances it placed were
+        consumed from the host states, so that a retried request is
+        answered as before.
+        """
+        if entry['expires_at'] <= timeutils.utcnow():
+            return False
+        generations = [host.generation for host in hosts]
+        if generations == entry['generations']:
+            return True
+        instance_uuids = filter_properties.get('instance_uuids')
+        return bool(instance_uuids and
+                    instance_uuids == entry['instance_uuids'] and
+                    generations == entry['consumed_generations'])
+
+    def _get_cached_solution(self, cache_key, hosts, filter_properties):
+        entry = self.solution_cache.peek(cache_key)
+        if (entry is not None and not self._is_cached_solution_current(
+                                        entry, hosts, filter_properties)):
+            self.solution_cache.pop(cache_key)
+        entry = self.solution_cache.get(cache_key)
+        LOG.debug(_("Solution cache hit rate: %(hit_rate).2f "
+                    "(%(hits)s hits, %(misses)s misses)."),
+                  {'hit_rate': self.solution_cache.hit_rate,
+                   'hits': self.solution_cache.hits,
+                   'misses': self.solution_cache.misses})
+        if entry is None:
+            return None
+        return entry['solution']
+
+    def _cache_solution(self, cache_key, hosts, filter_properties,
+                        solution):
+        """Keep a solution for scheduler_solver_solution_cache_seconds,
+        along with the generations of the host states before and after
+        its instances are consumed from them.
+        """
+        ttl = CONF.solver_scheduler.scheduler_solver_solution_cache_seconds
+        if ttl <= 0:
+            return
+        generations = [host.generation for host in hosts]
+        host_counts = solution[0] or [0 for host in hosts]
+        self.solution_cache.put(cache_key, {
+                'solution': solution,
+                'instance_uuids': filter_properties.get('instance_uuids'),
+                'generations': generations,
+                'consumed_generations': [
+                        generation + count for generation, count
+                        in zip(generations, host_counts)],
+                'expires_at': timeutils.utcnow() +
+                              datetime.timedelta(seconds=ttl)})
+
+    def _get_host_capacities(self, hosts, filter_properties):
+        """Return, for each configured resource constraint, its name, the
+        demand of each requested instance and the capacity of each host.
+
+        Each constraint is evaluated once per request, so that the
+        presolve and the infeasible request cache share the lookups,
+        such as aggregate metadata, behind the capacities.
+        """
+        host_capacities = []
+        for constraint in self.constraint_classes:
+            if not issubclass(constraint, constraints.BaseResourceConstraint):
+                continue
+            constraint_object = constraint()
+            host_capacities.append((
+                    constraint.__name__,
+                    constraint_object.get_instance_demand(filter_properties),
+                    [constraint_object.get_host_capacity(host,
+                                                         filter_properties)
+                     for host in hosts]))
+        return host_capacities
+
+    def _presolve_capacity(self, filter_properties, host_capacities):
+        """Check that the hosts can take the requested instances at all.
+
+        For each resource constraint, a host can take at most as many
+        instances as its capacity holds demands. If these counts add up
+        to less than num_instances over all hosts, the request is
+        infeasible and there is no need to build the problem. Returns the
+        name of the first such resource constraint, or None.
+        """
+        num_instances = filter_properties['num_instances']
+        for name, demand, capacities in host_capacities:
+            if not demand:
+                continue
+            total = 0
+            for capacity in capacities:
+                if capacity is None:
+                    total = num_instances
+                else:
+                    total += min(max(int(capacity / demand), 0),
+                                 num_instances)
+                if total >= num_instances:
+                    break
+            if total < num_instances:
+                LOG.debug(_("%(constraint)s limits the hosts to "
+                            "%(total)s of %(num_instances)s requested "
+                            "instances."),
+                          {'constraint': name,
+                           'total': total,
+                           'num_instances': num_instances})
+                return name
+        return None
+
+    def _get_capacity_vector(self, hosts, host_capacities):
+        """Return the number of hosts and, for each configured resource
+        constraint, the largest and the total capacity of the hosts.
+        """
+        vector = [len(hosts)]
+        for name, demand, capacities in host_capacities:
+            capacities = [capacity for capacity in capacities
+                          if capacity is not None]
+            vector.append((name,
+                           max(capacities) if capacities else None,
+                           sum(capacities)))
+        return vector
+
+    def _get_infeasible_cache_key(self, filter_properties, candidate_state):
+        request_spec = filter_properties.get('request_spec') or {}
+        key = [solver_utils.get_request_signature(request_spec,
+                                                  filter_properties),
+               filter_properties['num_instances'],
+               [cost.__name__ for cost in self.cost_classes],
+               [constraint.__name__ for constraint in
+                self.constraint_classes],
+               candidate_state]
+        return hashlib.sha1(jsonutils.dumps(key)).hexdigest()
+
+    def _is_known_infeasible(self, hosts, filter_properties,
+                             candidate_state, capacity_vector):
+        """Whether the same request was found infeasible recently, against
+        the same candidate state and hosts with the same capacity vector,
+        and if the proof needed them, the same host states.
+        """
+        ttl = CONF.solver_scheduler.scheduler_solver_infeasible_cache_seconds
+        if ttl <= 0:
+            return False
+        key = self._get_infeasible_cache_key(filter_properties,
+                                             candidate_state)
+        entry = self.infeasible_cache.get(key)
+        if entry is None:
+            return False
+        if (entry['expires_at'] <= timeutils.utcnow() or
+                entry['capacity'] != capacity_vector or
+                entry['generations'] not in (
+                        None, [getattr(host, 'generation', None)
+                               for host in hosts])):
+            self.infeasible_cache.pop(key)
+            return False
+        return True
+
+    def _record_infeasible(self, filter_properties, candidate_state,
+                           capacity_vector, generations=None, reason=None):
+        """Remember that the request is infeasible with the current
+        candidate state and host capacities, for
+        scheduler_solver_infeasible_cache_seconds. Only requests proven
+        infeasible are recorded. The generations of the host states are
+        given when the proof depends on more than their capacities.
+        """
+        ttl = CONF.solver_scheduler.scheduler_solver_infeasible_cache_seconds
+        if ttl <= 0:
+            return
+        self.infeasible_cache.put(
+                self._get_infeasible_cache_key(filter_properties,
+                                               candidate_state),
+                {'capacity': capacity_vector,
+                 'generations': generations,
+                 'reason': reason,
+                 'expires_at': timeutils.utcnow() +
+                               datetime.timedelta(seconds=ttl)})
+
+    def _get_placement_problem(self, hosts, filter_properties):
+        """Evaluate the configured costs and constraints once and return
+        them as a PlacementProblem.
+        """
+        num_instances = filter_properties['num_instances']
+        placement_problem = problem.PlacementProblem(hosts, num_instances)
+
+        index_variables = IndexVariables()
+        index_variables.populate_variables(len(hosts), num_instances)
+
+        # NOTE: evaluating costs and constraints does not yield on its own,
+        # so the solve yields in between, letting a caller waiting on it
+        # with a deadline time out or kill it.
+        cost_objects = [cost() for cost in self.cost_classes]
+        for cost_object in cost_objects:
+            var_list, coeff_list = cost_object.get_components(
+                                index_variables, hosts, filter_properties)
+            placement_problem.add_cost(var_list, coeff_list,
+                                       cost_object.cost_multiplier())
+            greenthread.sleep(0)
+        placement_problem.cost_matrix = (
+                self._calculate_host_instance_cost_matrix(
+                                        placement_problem.cost_matrix))
+
+        for constraint in self.constraint_classes:
+            if issubclass(constraint, constraints.BaseStructuralConstraint):
+                placement_problem.add_rows_from(self._get_structural_block(
+                        constraint, hosts, filter_properties))
+            else:
+                self._add_constraint_rows(placement_problem, constraint(),
+                        index_variables, hosts, filter_properties)
+            greenthread.sleep(0)
+
+        return placement_problem
+
+    def _add_constraint_rows(self, placement_problem, constraint_object,
+                             index_variables, hosts, filter_properties):
+        vars_list, coeffs_list, consts_list, ops_list = (
+                constraint_object.get_components(index_variables, hosts,
+                filter_properties))
+        LOG.debug(_("coeffs of %(name)s is: %(value)s") %
+                {"name": constraint_object.__class__.__name__,
+                "value": coeffs_list})
+        for i in xrange(len(ops_list)):
+            placement_problem.add_row(
+                    "Costraint_Name_%s" %
+                    constraint_object.__class__.__name__ + "_No._%s" % i,
+                    vars_list[i], coeffs_list[i], consts_list[i],
+                    ops_list[i])
+
+    def _get_structural_block(self, constraint, hosts, filter_properties):
+        """Return the rows of a structural constraint for the shape of the
+        problem, evaluating the constraint only once per shape. The rows
+        are shared by every problem of that shape, and the PULP based
+        solver builds their LP expressions once per model it keeps for
+        that shape.
+        """
+        num_hosts = len(hosts)
+        num_instances = filter_properties['num_instances']
+        key = (constraint, num_hosts, num_instances)
+        block = _structural_blocks.get(key)
+        if block is None:
+            # NOTE: the rows of a structural constraint do not depend on
+            # the hosts, so the block does not keep any host state.
+            block = problem.PlacementProblem([None] * num_hosts,
+                                             num_instances)
+            index_variables = IndexVariables()
+            index_variables.populate_variables(num_hosts, num_instances)
+            self._add_constraint_rows(block, constraint(), index_variables,
+                                      hosts, filter_properties)
+            _structural_blocks.put(key, block)
+        return block
+
+    def _get_host_instance_combinations(self, hosts, host_counts,
+                                        instance_uuids):
+        """Turn the number of instances chosen for each host into a list
+        of (host, instance_uuid) tuples.
+        """
+        host_instance_combinations = []
+        instances_iter = iter(instance_uuids)
+        for i in xrange(len(hosts)):
+            for k in xrange(host_counts[i]):
+                host_instance_combinations.append(
+                        (hosts[i], instances_iter.next()))
+        return host_instance_combinations
+
+    def _get_instance_uuids(self, filter_properties):
+        num_instances = filter_properties['num_instances']
+        return filter_properties.get('instance_uuids') or [
+                '(unknown_uuid)' + str(i) for i in xrange(num_instances)]
+
+    def _solve(self, hosts, filter_properties, max_alternates=0):
+        """Formulate and solve the problem, unless the solution cache has
+        the solution already. Returns the number of instances to place on
+        each host, or None if the problem is infeasible, and the indexes
+        of up to max_alternates alternate hosts.
+        """
+        candidate_state = None
+        if (self.solution_cache.max_size > 0 or CONF.solver_scheduler.
+                scheduler_solver_infeasible_cache_seconds > 0):
+            candidate_state = self._get_candidate_state(hosts,
+                                                        filter_properties)
+        cache_key = self._get_solution_cache_key(hosts, filter_properties,
+                                                 candidate_state,
+                                                 max_alternates)
+        if cache_key is not None:
+            solution = self._get_cached_solution(cache_key, hosts,
+                                                 filter_properties)
+            if solution is not None:
+                return solution
+
+        host_capacities = self._get_host_capacities(hosts, filter_properties)
+        capacity_vector = self._get_capacity_vector(hosts, host_capacities)
+        if self._is_known_infeasible(hosts, filter_properties,
+                                     candidate_state, capacity_vector):
+            LOG.debug(_("Request was found infeasible recently and host "
+                        "capacities have not changed, skipping the solve."))
+            return None, []
+
+        binding_constraint = self._presolve_capacity(filter_properties,
+                                                     host_capacities)
+        if binding_constraint is not None:
+            LOG.info(_("Request is infeasible, %s does not leave room for "
+                       "the requested instances."), binding_constraint)
+            self._record_infeasible(filter_properties, candidate_state,
+                                    capacity_vector,
+                                    reason=binding_constraint)
+            return None, []
+
+        LOG.debug(_("All Hosts: %s") % [h.host for h in hosts])
+        for host in hosts:
+            LOG.debug(_("Host state: %s") % host)
+
+        # Get costs and constraints and formulate the problem.
+        placement_problem = self._get_placement_problem(hosts,
+                                                        filter_properties)
+        host_counts = self._solve_placement_problem(hosts, filter_properties,
+                                                    placement_problem)
+
+        # NOTE: a heuristic which finds no placement does not prove that
+        # there is none, so only proven infeasibility is recorded. The
+        # proof holds for the host states it was made on.
+        generations = [getattr(host, 'generation', None) for host in hosts]
+        if (host_counts is None and placement_problem.proven_infeasible and
+                None not in generations):
+            self._record_infeasible(filter_properties, candidate_state,
+                                    capacity_vector, generations=generations)
+
+        alternates = []
+        if (host_counts is not None and max_alternates > 0 and
+                placement_problem.is_separable):
+            alternates = placement_problem.get_alternate_hosts(
+                                            host_counts, max_alternates)
+
+        solution = (host_counts, alternates)
+        if cache_key is not None:
+            self._cache_solution(cache_key, hosts, filter_properties,
+                                 solution)
+        return solution
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        """Return the number of instances to place on each host, or None
+           if the problem is infeasible.
+           Implement this in a subclass which uses _solve.
+        """
+        raise NotImplementedError()
+
+    def _get_solution(self, hosts, filter_properties, max_alternates=0):
+        """Solve the problem and return the list of host-instance tuples
+        of the solution, and the list of alternate hosts.
+        """
+        host_counts, alternates = self._solve(hosts, filter_properties,
+                                              max_alternates)
+        if host_counts is None:
+            return [], []
+        instance_uuids = self._get_instance_uuids(filter_properties)
+        host_instance_combinations = self._get_host_instance_combinations(
+                hosts, host_counts, instance_uuids)
+        return host_instance_combinations, [hosts[i] for i in alternates]
+
     def solve(self, hosts, filter_properties):
         """Return the list of host-instance tuples after
            solving the constraints.
            Implement this in a subclass.
         """
         raise NotImplementedError()
+
+    def solve_with_alternates(self, hosts, filter_properties,
+                              max_alternates):
+        """Return the list of host-instance tuples like solve, and a list
+           of at most max_alternates hosts ranked by the same model, which
+           can take a requested instance if its chosen host fails.
+           Solvers which cannot rank alternates return none.
+        """
+        return self.solve(hosts, filter_properties), []
+
+    def solve_multi(self, hosts, filter_properties_list):
+        """Place several requests, which may ask for different flavors,
+           on the same hosts at once. Return a list of host-instance
+           tuple lists, one for each request.
+           Implement this in a subclass which supports multiple flavors.
+        """
+        raise NotImplementedError()
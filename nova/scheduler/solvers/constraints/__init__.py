@@ -53,6 +53,39 @@ class BaseLinearConstraint(BaseConstraint):
                 self.operators)
 
 
+class BaseStructuralConstraint(BaseLinearConstraint):
+    """Base class for constraints whose components only depend on the
+    shape of the problem, i.e. the number of hosts and of instances.
+
+    Solvers may evaluate such constraints once per shape and reuse the
+    resulting rows for every request of that shape.
+    """
+    pass
+
+
+class BaseResourceConstraint(BaseLinearConstraint):
+    """Base class for constraints on a host resource which each requested
+    instance consumes.
+
+    Besides the per-request components, these constraints tell how much
+    of the resource an instance demands and how much of it a host has
+    left, so that solvers placing requests of different flavors together
+    can limit the sum of their demands on each host.
+    """
+
+    def get_instance_demand(self, filter_properties):
+        """Return how much of the resource each requested instance
+        consumes, 0 if the request does not consume it.
+        """
+        raise NotImplementedError()
+
+    def get_host_capacity(self, host_state, filter_properties):
+        """Return how much of the resource is usable on the host, or None
+        if the host is not limited by this constraint.
+        """
+        raise NotImplementedError()
+
+
 class BaseFilterConstraint(BaseLinearConstraint):
     """Base class for constraints that correspond to 1-time host filters."""
 
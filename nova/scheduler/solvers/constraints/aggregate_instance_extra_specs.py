@@ -13,11 +13,58 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nova import db
 from nova.scheduler.filters import aggregate_instance_extra_specs
 from nova.scheduler.solvers import constraints
+from nova.scheduler.solvers import extra_specs_ops
+
+_SCOPE = aggregate_instance_extra_specs._SCOPE
 
 
 class AggregateInstanceExtraSpecsConstraint(constraints.BaseFilterConstraint):
-    """AggregateInstanceExtraSpecsFilter works with InstanceType records."""
+    """AggregateInstanceExtraSpecsFilter works with InstanceType records.
+
+    The flavor extra_specs are compiled once per flavor, aggregate metadata
+    is read with one query per referenced key, and hosts whose aggregate
+    metadata is identical share a single evaluation.
+    """
     host_filter_cls = aggregate_instance_extra_specs.\
                             AggregateInstanceExtraSpecsFilter
+
+    def _generate_components(self, variables, hosts, filter_properties):
+        num_hosts = len(hosts)
+        num_instances = filter_properties.get('num_instances')
+
+        var_matrix = variables.host_instance_matrix
+
+        instance_type = filter_properties.get('instance_type') or {}
+        matchers = extra_specs_ops.get_extra_specs_matchers(instance_type,
+                                                            _SCOPE, 1)
+        if not matchers:
+            return
+
+        context = filter_properties['context'].elevated()
+        metadata_by_key = {}
+        for scope, matcher in matchers:
+            key = scope[0]
+            if key not in metadata_by_key:
+                metadata_by_key[key] = db.aggregate_host_get_by_metadata_key(
+                                                            context, key=key)
+
+        results = {}
+        for i in xrange(num_hosts):
+            digest = tuple(frozenset(metadata_by_key[scope[0]].get(
+                                            hosts[i].host) or [])
+                           for scope, matcher in matchers)
+            host_passes = results.get(digest)
+            if host_passes is None:
+                host_passes = all(any(matcher(val) for val in vals)
+                                  for vals, (scope, matcher)
+                                  in zip(digest, matchers))
+                results[digest] = host_passes
+            if not host_passes:
+                for j in xrange(num_instances):
+                    self.variables.append([var_matrix[i][j]])
+                    self.coefficients.append([1])
+                    self.constants.append(0)
+                    self.operators.append('==')
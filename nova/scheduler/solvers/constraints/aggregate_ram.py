@@ -32,14 +32,18 @@ class AggregateRamConstraint(ram_constraint.RamConstraint):
     Fall back to global ram_allocation_ratio if no per-aggregate setting found.
     """
 
+    def __init__(self):
+        super(AggregateRamConstraint, self).__init__()
+        # ram_allocation_ratio metadata by host, looked up for all
+        # hosts at once.
+        self._host_metadata = None
+
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='ram_allocation_ratio')
-        aggregate_vals = metadata.get('ram_allocation_ratio', set())
+        if self._host_metadata is None:
+            context = filter_properties['context'].elevated()
+            self._host_metadata = db.aggregate_host_get_by_metadata_key(
+                    context, key='ram_allocation_ratio')
+        aggregate_vals = self._host_metadata.get(host_state.host, set())
         num_values = len(aggregate_vals)
 
         if num_values == 0:
@@ -32,14 +32,18 @@ class AggregateVcpuConstraint(vcpu_constraint.VcpuConstraint):
     Fall back to global cpu_allocation_ratio if no per-aggregate setting found.
     """
 
+    def __init__(self):
+        super(AggregateVcpuConstraint, self).__init__()
+        # cpu_allocation_ratio metadata by host, looked up for all
+        # hosts at once.
+        self._host_metadata = None
+
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='cpu_allocation_ratio')
-        aggregate_vals = metadata.get('cpu_allocation_ratio', set())
+        if self._host_metadata is None:
+            context = filter_properties['context'].elevated()
+            self._host_metadata = db.aggregate_host_get_by_metadata_key(
+                    context, key='cpu_allocation_ratio')
+        aggregate_vals = self._host_metadata.get(host_state.host, set())
         num_values = len(aggregate_vals)
 
         if num_values == 0:
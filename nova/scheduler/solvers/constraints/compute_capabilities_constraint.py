@@ -15,8 +15,69 @@
 
 from nova.scheduler.filters import compute_capabilities_filter
 from nova.scheduler.solvers import constraints
+from nova.scheduler.solvers import extra_specs_ops
 
 
 class ComputeCapabilitiesConstraint(constraints.BaseFilterConstraint):
-    """Hard-coded to work with InstanceType records."""
+    """Hard-coded to work with InstanceType records.
+
+    The flavor extra_specs are compiled once per flavor, and hosts whose
+    referenced capabilities are identical share a single evaluation.
+    """
     host_filter_cls = compute_capabilities_filter.ComputeCapabilitiesFilter
+
+    def _get_capabilities(self, host_state, scope):
+        cap = host_state
+        for index in range(0, len(scope)):
+            try:
+                if not isinstance(cap, dict):
+                    if getattr(cap, scope[index], None) is None:
+                        # If can't find, check stats dict
+                        cap = cap.stats.get(scope[index], None)
+                    else:
+                        cap = getattr(cap, scope[index], None)
+                else:
+                    cap = cap.get(scope[index], None)
+            except AttributeError:
+                return None
+            if cap is None:
+                return None
+        return cap
+
+    def _get_capability_digest(self, host_state, matchers):
+        """Return the string values of the capabilities referenced by the
+        matchers, which identifies the host's capability equivalence class.
+        """
+        digest = []
+        for scope, matcher in matchers:
+            cap = self._get_capabilities(host_state, scope)
+            digest.append(None if cap is None else str(cap))
+        return tuple(digest)
+
+    def _generate_components(self, variables, hosts, filter_properties):
+        num_hosts = len(hosts)
+        num_instances = filter_properties.get('num_instances')
+
+        var_matrix = variables.host_instance_matrix
+
+        instance_type = filter_properties.get('instance_type') or {}
+        matchers = extra_specs_ops.get_extra_specs_matchers(instance_type,
+                                                            'capabilities')
+        if not matchers:
+            return
+
+        results = {}
+        for i in xrange(num_hosts):
+            digest = self._get_capability_digest(hosts[i], matchers)
+            host_passes = results.get(digest)
+            if host_passes is None:
+                host_passes = all(cap is not None and matcher(cap)
+                                  for cap, (scope, matcher)
+                                  in zip(digest, matchers))
+                results[digest] = host_passes
+            if not host_passes:
+                for j in xrange(num_instances):
+                    self.variables.append([var_matrix[i][j]])
+                    self.coefficients.append([1])
+                    self.constants.append(0)
+                    self.operators.append('==')
@@ -26,9 +26,22 @@ CONF.import_opt('disk_allocation_ratio', 'nova.scheduler.filters.disk_filter')
 LOG = logging.getLogger(__name__)
 
 
-class DiskConstraint(constraints.BaseLinearConstraint):
+class DiskConstraint(constraints.BaseResourceConstraint):
     """Constraint of the maximum total disk demand acceptable on each host."""
 
+    def get_instance_demand(self, filter_properties):
+        instance_type = filter_properties.get('instance_type') or {}
+        requested_disk = (1024 * (instance_type.get('root_gb', 0) +
+                                  instance_type.get('ephemeral_gb', 0)) +
+                                  instance_type.get('swap', 0))
+        return max(requested_disk, 0)
+
+    def get_host_capacity(self, host_state, filter_properties):
+        total_usable_disk_mb = host_state.total_usable_disk_gb * 1024
+        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - host_state.free_disk_mb
+        return disk_mb_limit - used_disk_mb
+
     def _generate_components(self, variables, hosts, filter_properties):
         num_hosts = len(hosts)
         num_instances = filter_properties.get('num_instances')
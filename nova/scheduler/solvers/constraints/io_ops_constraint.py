@@ -25,11 +25,18 @@ CONF = cfg.CONF
 CONF.import_opt('max_io_ops_per_host', 'nova.scheduler.filters.io_ops_filter')
 
 
-class IoOpsConstraint(constraints.BaseLinearConstraint):
+class IoOpsConstraint(constraints.BaseResourceConstraint):
     """A constraint to ensure only those hosts are selected whose number of
     concurrent I/O operations are within a set threshold.
     """
 
+    def get_instance_demand(self, filter_properties):
+        # each instance being built adds one I/O operation to its host
+        return 1
+
+    def get_host_capacity(self, host_state, filter_properties):
+        return max(CONF.max_io_ops_per_host - host_state.num_io_ops, 0)
+
     def _generate_components(self, variables, hosts, filter_properties):
         max_io_ops = CONF.max_io_ops_per_host
 
@@ -13,12 +13,132 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nova.openstack.common import jsonutils
 from nova.scheduler.filters import json_filter
 from nova.scheduler.solvers import constraints
+from nova.scheduler.solvers import utils
+
+# Compiled query predicates, memoized by query string across requests.
+_compiled_queries = utils.LRUCache(256)
+
+
+class _HostColumns(object):
+    """Column-wise snapshot of the host attributes referenced by a query.
+
+    Every '$' variable is read once for all hosts and shared by all nodes
+    of the predicate tree that reference it.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.num_hosts = len(hosts)
+        self._columns = {}
+
+    def column(self, path):
+        column = self._columns.get(path)
+        if column is None:
+            column = [self._lookup(host, path) for host in self.hosts]
+            self._columns[path] = column
+        return column
+
+    @staticmethod
+    def _lookup(host_state, path):
+        obj = getattr(host_state, path[0], None)
+        if obj is None:
+            return None
+        for item in path[1:]:
+            obj = obj.get(item, None)
+            if obj is None:
+                return None
+        return obj
+
+
+def _compile_constant(value):
+    return lambda columns: [value] * columns.num_hosts
+
+
+def _compile_string(string):
+    if not string:
+        return _compile_constant(None)
+    if not string.startswith("$"):
+        return _compile_constant(string)
+    path = tuple(string[1:].split("."))
+    return lambda columns: columns.column(path)
+
+
+def _compile_query(host_filter, query):
+    """Compile a parsed JsonFilter query into a predicate tree.
+
+    The returned function takes a _HostColumns snapshot and returns the
+    list of per-host results of the query, with the same semantics as
+    JsonFilter._process_filter.
+    """
+    if not query:
+        return lambda columns: [True] * columns.num_hosts
+
+    method = host_filter.commands[query[0]]
+    arg_nodes = []
+    for arg in query[1:]:
+        if isinstance(arg, list):
+            arg_nodes.append(_compile_query(host_filter, arg))
+        elif isinstance(arg, basestring):
+            arg_nodes.append(_compile_string(arg))
+        else:
+            arg_nodes.append(_compile_constant(arg))
+
+    def evaluate(columns):
+        arg_columns = [node(columns) for node in arg_nodes]
+        return [method(host_filter, [column[i] for column in arg_columns
+                                     if column[i] is not None])
+                for i in xrange(columns.num_hosts)]
+
+    return evaluate
 
 
 class JsonConstraint(constraints.BaseFilterConstraint):
     """Constraint to allow simple JSON-based grammar for
     selecting hosts.
+
+    The query is compiled once into a predicate tree which is evaluated
+    against all hosts at once, instead of being re-parsed for each host.
     """
     host_filter_cls = json_filter.JsonFilter
+
+    def _get_query_predicate(self, query):
+        predicate = _compiled_queries.get(query)
+        if predicate is None:
+            predicate = _compile_query(self.host_filter,
+                                       jsonutils.loads(query))
+            _compiled_queries.put(query, predicate)
+        return predicate
+
+    def _get_host_passes_mask(self, hosts, query):
+        results = self._get_query_predicate(query)(_HostColumns(hosts))
+        mask = []
+        for result in results:
+            if isinstance(result, list):
+                # If any succeeded, include the host
+                result = any(result)
+            mask.append(bool(result))
+        return mask
+
+    def _generate_components(self, variables, hosts, filter_properties):
+        num_hosts = len(hosts)
+        num_instances = filter_properties.get('num_instances')
+
+        var_matrix = variables.host_instance_matrix
+
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        query = scheduler_hints.get('query')
+        if not query:
+            return
+
+        host_passes_mask = self._get_host_passes_mask(hosts, query)
+
+        for i in xrange(num_hosts):
+            if not host_passes_mask[i]:
+                for j in xrange(num_instances):
+                    self.variables.append([var_matrix[i][j]])
+                    self.coefficients.append([1])
+                    self.constants.append(0)
+                    self.operators.append('==')
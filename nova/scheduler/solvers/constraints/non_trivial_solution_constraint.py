@@ -16,7 +16,7 @@
 from nova.scheduler.solvers import constraints
 
 
-class NonTrivialSolutionConstraint(constraints.BaseLinearConstraint):
+class NonTrivialSolutionConstraint(constraints.BaseStructuralConstraint):
     """Constraint that forces every requested instances to be placed
     at one host, so as to avoid trivial solutions.
     """
@@ -26,11 +26,17 @@ CONF.import_opt("max_instances_per_host",
 LOG = logging.getLogger(__name__)
 
 
-class NumInstancesConstraint(constraints.BaseLinearConstraint):
+class NumInstancesConstraint(constraints.BaseResourceConstraint):
     """Constraint that specifies the maximum number of instances that
     each host can launch.
     """
 
+    def get_instance_demand(self, filter_properties):
+        return 1
+
+    def get_host_capacity(self, host_state, filter_properties):
+        return max(CONF.max_instances_per_host - host_state.num_instances, 0)
+
     def _generate_components(self, variables, hosts, filter_properties):
         num_hosts = len(hosts)
         num_instances = filter_properties.get('num_instances')
@@ -25,12 +25,25 @@ CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
 
 LOG = logging.getLogger(__name__)
 
-class RamConstraint(constraints.BaseLinearConstraint):
+
+class RamConstraint(constraints.BaseResourceConstraint):
     """Constraint of the total ram demand acceptable on each host."""
 
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return CONF.ram_allocation_ratio
 
+    def get_instance_demand(self, filter_properties):
+        instance_type = filter_properties.get('instance_type') or {}
+        return max(instance_type.get('memory_mb', 0), 0)
+
+    def get_host_capacity(self, host_state, filter_properties):
+        ram_allocation_ratio = self._get_ram_allocation_ratio(
+                                            host_state, filter_properties)
+        total_usable_ram_mb = host_state.total_usable_ram_mb
+        memory_mb_limit = total_usable_ram_mb * ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - host_state.free_ram_mb
+        return memory_mb_limit - used_ram_mb
+
     def _generate_components(self, variables, hosts, filter_properties):
         num_hosts = len(hosts)
         num_instances = filter_properties.get('num_instances')
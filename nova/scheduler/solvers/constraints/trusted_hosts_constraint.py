@@ -13,11 +13,123 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
+import eventlet
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.scheduler.filters import trusted_filter
 from nova.scheduler.solvers import constraints
 
+attestation_cache_opts = [
+        cfg.IntOpt('attestation_cache_ttl_seconds',
+                   default=60,
+                   help='How long in seconds a host trust level returned by '
+                        'the attestation service is cached by the solver '
+                        'scheduler.'),
+        cfg.IntOpt('attestation_cache_refresh_seconds',
+                   default=10,
+                   help='Cached host trust levels that expire within this '
+                        'many seconds are refreshed in the background, so '
+                        'that requests do not wait for the attestation '
+                        'service. Set to 0 to disable background refresh.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(attestation_cache_opts, group='solver_scheduler')
+
+LOG = logging.getLogger(__name__)
+
+
+class AttestationCache(object):
+    """Cache of host trust levels obtained from the attestation service.
+
+    Hosts that are missing or expired are attested with one bulk request,
+    and entries that are about to expire are refreshed in a background
+    greenthread before requests have to wait for them.
+    """
+
+    def __init__(self, attestservice=None):
+        self.attestservice = (attestservice or
+                              trusted_filter.AttestationService())
+        self.entries = {}
+        self.refreshing = set()
+
+    def _expired(self, host, now, margin=0):
+        entry = self.entries.get(host)
+        if entry is None:
+            return True
+        return entry['expires_at'] - datetime.timedelta(seconds=margin) <= now
+
+    def _attest(self, hosts):
+        states = self.attestservice.do_attestation(list(hosts))
+        if states is None:
+            LOG.warn(_("Attestation service returned no result for hosts: "
+                       "%s"), hosts)
+            return
+        expires_at = timeutils.utcnow() + datetime.timedelta(
+                seconds=CONF.solver_scheduler.attestation_cache_ttl_seconds)
+        attested = set()
+        for state in states:
+            host = state.get('host_name')
+            self.entries[host] = {'trust_lvl': state.get('trust_lvl',
+                                                         'unknown'),
+                                  'expires_at': expires_at}
+            attested.add(host)
+        # NOTE: hosts the attestation service does not know about are
+        # cached as 'unknown' as well, so they are not polled again on
+        # every request.
+        for host in set(hosts) - attested:
+            self.entries[host] = {'trust_lvl': 'unknown',
+                                  'expires_at': expires_at}
+
+    def _refresh(self, hosts):
+        try:
+            self._attest(hosts)
+        except Exception as e:
+            LOG.warn(_("Background attestation refresh failed: %s"), e)
+        finally:
+            self.refreshing.difference_update(hosts)
+
+    def get_trust_levels(self, hosts):
+        """Return a dict mapping each of the given compute node names to
+        its trust level, attesting all uncached nodes with a single
+        request.
+        """
+        now = timeutils.utcnow()
+        missing = [host for host in hosts if self._expired(host, now)]
+        if missing:
+            self._attest(missing)
+
+        margin = CONF.solver_scheduler.attestation_cache_refresh_seconds
+        if margin > 0:
+            expiring = [host for host in hosts
+                        if host not in self.refreshing and
+                        self._expired(host, now, margin)]
+            if expiring:
+                self.refreshing.update(expiring)
+                eventlet.spawn_n(self._refresh, expiring)
 
-class TrustedHostsConstraint(constraints.BaseFilterConstraint):
+        return dict((host, self.entries.get(host, {}).get('trust_lvl',
+                                                          'unknown'))
+                    for host in hosts)
+
+
+_attestation_cache = None
+
+
+def get_attestation_cache():
+    """Return the attestation cache shared by all solver requests."""
+    global _attestation_cache
+    if _attestation_cache is None:
+        _attestation_cache = AttestationCache()
+    return _attestation_cache
+
+
+class TrustedHostsConstraint(constraints.BaseLinearConstraint):
     """Constraint to add support for Trusted Computing Pools.
 
     Allows a host to be selected by scheduler only when the integrity (trust)
@@ -26,5 +138,35 @@ class TrustedHostsConstraint(constraints.BaseFilterConstraint):
     key is `trust'.  The value of this pair (`trusted'/`untrusted') must
     match the integrity of that host (obtained from the Attestation
     service) before the task can be scheduled on that host.
+
+    Trust levels are looked up in a shared AttestationCache, so hosts are
+    attested in bulk rather than one by one on the request path.
     """
-    host_filter_cls = trusted_filter.TrustedFilter
+
+    def _get_attestation_cache(self):
+        return get_attestation_cache()
+
+    def _generate_components(self, variables, hosts, filter_properties):
+        num_hosts = len(hosts)
+        num_instances = filter_properties.get('num_instances')
+
+        var_matrix = variables.host_instance_matrix
+
+        instance_type = filter_properties.get('instance_type') or {}
+        extra_specs = instance_type.get('extra_specs') or {}
+        trust = extra_specs.get('trust:trusted_host')
+        if not trust:
+            return
+
+        # NOTE: as in TrustedFilter, hosts are attested by the name of
+        # their compute node, which is the hypervisor hostname.
+        trust_levels = self._get_attestation_cache().get_trust_levels(
+                sorted(set(host.nodename for host in hosts)))
+
+        for i in xrange(num_hosts):
+            if trust_levels.get(hosts[i].nodename) != trust:
+                for j in xrange(num_instances):
+                    self.variables.append([var_matrix[i][j]])
+                    self.coefficients.append([1])
+                    self.constants.append(0)
+                    self.operators.append('==')
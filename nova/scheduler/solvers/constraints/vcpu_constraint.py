@@ -25,12 +25,26 @@ CONF.import_opt('cpu_allocation_ratio', 'nova.scheduler.filters.core_filter')
 LOG = logging.getLogger(__name__)
 
 
-class VcpuConstraint(constraints.BaseLinearConstraint):
+class VcpuConstraint(constraints.BaseResourceConstraint):
     """Constraint of the total vcpu demand acceptable on each host."""
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def get_instance_demand(self, filter_properties):
+        instance_type = filter_properties.get('instance_type') or {}
+        return max(instance_type.get('vcpus', 0), 0)
+
+    def get_host_capacity(self, host_state, filter_properties):
+        # NOTE: as in _generate_components, hosts without vCPU information
+        # are not limited.
+        if not host_state.vcpus_total:
+            return None
+        cpu_allocation_ratio = self._get_cpu_allocation_ratio(
+                                            host_state, filter_properties)
+        vcpus_total = host_state.vcpus_total * cpu_allocation_ratio
+        return vcpus_total - host_state.vcpus_used
+
     def _generate_components(self, variables, hosts, filter_properties):
         num_hosts = len(hosts)
         num_instances = filter_properties.get('num_instances')
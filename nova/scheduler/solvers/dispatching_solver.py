@@ -0,0 +1,139 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler.solvers import greedy_solver
+from nova.scheduler.solvers import portfolio_solver
+from nova.scheduler.solvers import pulp_solver
+
+dispatching_solver_opts = [
+        cfg.DictOpt('dispatching_solver_engine_overrides',
+                    default={},
+                    help='Engine to use for a class of problems instead of '
+                         'the default one, as class:engine pairs. Problem '
+                         'classes are single_instance, capacity_only, '
+                         'separable, coupled and large, and engines are '
+                         'single_instance, min_cost_flow, greedy, pulp and '
+                         'portfolio. The greedy and portfolio engines are '
+                         'not exact, and may return a costlier placement '
+                         'than the default engine.'),
+        cfg.IntOpt('dispatching_solver_large_threshold',
+                   default=0,
+                   help='Number of host-instance variables from which a '
+                        'problem which needs an LP is in the large class. '
+                        'Set to 0 to disable the large class.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(dispatching_solver_opts, group='solver_scheduler')
+
+LOG = logging.getLogger(__name__)
+
+# The cheapest engine which is exact for each class of problems.
+_DEFAULT_ENGINES = {
+        'single_instance': 'single_instance',
+        'capacity_only': 'min_cost_flow',
+        'separable': 'pulp',
+        'coupled': 'pulp',
+        'large': 'pulp'}
+
+# Classes of problems which engines are restricted to. Other engines
+# solve any problem.
+_ENGINE_CLASSES = {
+        'single_instance': ('single_instance',),
+        'min_cost_flow': ('single_instance', 'capacity_only')}
+
+_ENGINES = ('single_instance', 'min_cost_flow', 'greedy', 'pulp',
+            'portfolio')
+
+
+class DispatchingSolver(portfolio_solver.PortfolioSolver):
+    """A solver which classifies each problem and solves it with the
+    cheapest engine which is exact for its class.
+
+    Single-instance problems and problems where hosts are only bound by
+    their capacities are solved without an LP, and other problems with
+    the PULP based solver. Large problems are also solved by the PULP
+    based solver unless dispatching_solver_engine_overrides maps them to
+    a faster but inexact engine, such as the portfolio solver. The number
+    of problems each engine solved is kept in engine_counts.
+    """
+
+    def __init__(self):
+        super(DispatchingSolver, self).__init__()
+        self.engine_counts = collections.defaultdict(int)
+
+    def _get_problem_class(self, placement_problem):
+        if placement_problem.is_separable:
+            if placement_problem.num_instances == 1:
+                return 'single_instance'
+            if placement_problem.is_flow_representable:
+                return 'capacity_only'
+        threshold = CONF.solver_scheduler.dispatching_solver_large_threshold
+        if (threshold > 0 and placement_problem.num_hosts *
+                placement_problem.num_instances >= threshold):
+            return 'large'
+        if placement_problem.is_separable:
+            return 'separable'
+        return 'coupled'
+
+    def _get_engine(self, problem_class):
+        overrides = CONF.solver_scheduler.dispatching_solver_engine_overrides
+        engine = overrides.get(problem_class)
+        if engine is None:
+            return _DEFAULT_ENGINES[problem_class]
+        if (engine not in _ENGINES or
+                problem_class not in _ENGINE_CLASSES.get(engine,
+                                                         (problem_class,))):
+            LOG.warn(_("Engine %(engine)s cannot solve %(class)s problems, "
+                       "using %(default)s instead."),
+                     {'engine': engine, 'class': problem_class,
+                      'default': _DEFAULT_ENGINES[problem_class]})
+            return _DEFAULT_ENGINES[problem_class]
+        return engine
+
+    def _solve_with_engine(self, engine, hosts, filter_properties,
+                           placement_problem):
+        if engine == 'single_instance':
+            return placement_problem.get_single_instance_solution()
+        if engine == 'min_cost_flow':
+            return placement_problem.get_flow_solution()
+        if engine == 'greedy':
+            return greedy_solver.get_greedy_solution(placement_problem)
+        if engine == 'portfolio':
+            return super(DispatchingSolver, self)._solve_placement_problem(
+                    hosts, filter_properties, placement_problem)
+        return pulp_solver.PulpSolver._solve_placement_problem(
+                self, hosts, filter_properties, placement_problem)
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        problem_class = self._get_problem_class(placement_problem)
+        engine = self._get_engine(problem_class)
+        LOG.debug(_("Solving %(class)s problem of %(num_hosts)s hosts and "
+                    "%(num_instances)s instances with the %(engine)s "
+                    "engine."),
+                  {'class': problem_class,
+                   'num_hosts': placement_problem.num_hosts,
+                   'num_instances': placement_problem.num_instances,
+                   'engine': engine})
+        self.engine_counts[engine] += 1
+        return self._solve_with_engine(engine, hosts, filter_properties,
+                                       placement_problem)
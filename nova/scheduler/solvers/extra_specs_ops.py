@@ -0,0 +1,87 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Precompiled matchers for flavor extra_specs requirements.
+
+The matchers follow the semantics of
+nova.scheduler.filters.extra_specs_ops.match, but every requirement
+string ('<or> a <or> b', 's== x', '>= 2', ...) is parsed only once.
+"""
+
+from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.solvers import utils
+
+# Compiled extra_specs, keyed by flavor id, scope and extra_specs digest.
+_compiled_extra_specs = utils.LRUCache(1024)
+
+
+def compile_match(req):
+    """Return a function equivalent to extra_specs_ops.match(value, req)."""
+    words = req.split()
+
+    op = method = None
+    if words:
+        op = words.pop(0)
+        method = extra_specs_ops._op_methods.get(op)
+
+    if op != '<or>' and not method:
+        return lambda value: value == req
+
+    if op == '<or>':  # Ex: <or> v1 <or> v2 <or> v3
+        choices = frozenset(words[::2])
+        return lambda value: value is not None and value in choices
+
+    if not words:
+        return lambda value: False
+
+    operand = words[0]
+
+    def match(value):
+        if value is None:
+            return False
+        try:
+            return bool(method(value, operand))
+        except ValueError:
+            return False
+
+    return match
+
+
+def get_extra_specs_matchers(instance_type, scope, maxsplit=-1):
+    """Return the compiled requirements of a flavor for the given scope.
+
+    The result is a tuple of (key, matcher) pairs, where key is the list
+    of key components with the scope prefix removed. Keys carrying a
+    different scope prefix are skipped, mirroring the host filters.
+    Compiled requirements are cached by flavor id and extra_specs.
+    """
+    extra_specs = instance_type.get('extra_specs') or {}
+    cache_key = (instance_type.get('flavorid'), scope, maxsplit,
+                 frozenset(extra_specs.iteritems()))
+    matchers = _compiled_extra_specs.get(cache_key)
+    if matchers is None:
+        matchers = []
+        for key, req in sorted(extra_specs.iteritems()):
+            key_scope = key.split(':', maxsplit)
+            if len(key_scope) > 1:
+                if key_scope[0] != scope:
+                    continue
+                else:
+                    del key_scope[0]
+            matchers.append((tuple(key_scope), compile_match(req)))
+        matchers = tuple(matchers)
+        _compiled_extra_specs.put(cache_key, matchers)
+    return matchers
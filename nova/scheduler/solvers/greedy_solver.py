@@ -0,0 +1,73 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+
+from nova.scheduler import solvers as scheduler_solver
+
+greedy_solver_opts = [
+        cfg.IntOpt('greedy_solver_local_search_ms',
+                   default=0,
+                   help='How long in milliseconds a greedy placement is '
+                        'improved by local search, moving instances '
+                        'between hosts while that lowers its cost. Set to '
+                        '0 to disable local search.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(greedy_solver_opts, group='solver_scheduler')
+
+
+def get_greedy_solution(placement_problem):
+    """Return the greedy placement of the problem, improved by local
+    search if enabled, or None if no placement was found.
+    """
+    host_counts = placement_problem.get_greedy_solution()
+    time_budget_ms = CONF.solver_scheduler.greedy_solver_local_search_ms
+    if host_counts is not None and time_budget_ms > 0:
+        host_counts = placement_problem.improve_solution(
+                                host_counts, time_budget_ms / 1000.0)
+    return host_counts
+
+
+class GreedySolver(scheduler_solver.BaseHostSolver):
+    """A heuristic solver which places the instances greedily, host by
+    host, without an LP.
+
+    It uses the same costs and constraints as the LP based solvers, and is
+    fast on any number of hosts, but its placement is not guaranteed to be
+    optimal, and it may not find a placement for problems whose
+    constraints couple hosts together. The placement can be improved by
+    local search for greedy_solver_local_search_ms.
+    """
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        return get_greedy_solution(placement_problem)
+
+    def solve(self, hosts, filter_properties):
+        """Return the list of host-instance tuples of the greedy
+        placement.
+        """
+        host_instance_combinations, alternates = self._get_solution(
+                                                    hosts, filter_properties)
+        return host_instance_combinations
+
+    def solve_with_alternates(self, hosts, filter_properties,
+                              max_alternates):
+        """Like solve, but also rank up to max_alternates alternate hosts
+        when hosts are independent of each other in the problem.
+        """
+        return self._get_solution(hosts, filter_properties, max_alternates)
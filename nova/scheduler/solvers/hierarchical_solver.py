@@ -0,0 +1,195 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+
+from eventlet import greenthread
+from eventlet import timeout
+from oslo.config import cfg
+
+from nova import db
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler.solvers import partition_solver
+from nova import solver_scheduler_exception as exception
+
+hierarchical_solver_opts = [
+        cfg.StrOpt('hierarchical_solver_group_key',
+                   default='availability_zone',
+                   help='Aggregate metadata key whose value groups hosts for '
+                        'the hierarchical solver, such as a rack or an '
+                        'availability zone. Hosts without it are in one '
+                        'group.'),
+        cfg.IntOpt('hierarchical_solver_min_hosts',
+                   default=1000,
+                   help='Number of hosts from which the hierarchical solver '
+                        'chooses groups of hosts before hosts. Problems on '
+                        'fewer hosts are solved by the partition solver.'),
+        cfg.FloatOpt('hierarchical_solver_flat_check_ratio',
+                     default=0.0,
+                     help='Ratio of requests for which the hierarchical '
+                          'solver also solves the flat problem, and logs '
+                          'how much more the hierarchical placement '
+                          'costs. The flat problem is solved in the '
+                          'background, once the request is placed.'),
+        cfg.IntOpt('hierarchical_solver_flat_check_seconds',
+                   default=60,
+                   help='How long in seconds the hierarchical solver spends '
+                        'on the flat problem of a checked request before '
+                        'giving up on it.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(hierarchical_solver_opts, group='solver_scheduler')
+
+LOG = logging.getLogger(__name__)
+
+
+class HierarchicalSolver(partition_solver.PartitionSolver):
+    """A solver which places the instances on groups of hosts first, and
+    then on hosts within the chosen groups.
+
+    Hosts are grouped by their hierarchical_solver_group_key aggregate
+    metadata. The coarse problem chooses how many instances each group
+    runs, from the summed capacities of its hosts and an estimate of its
+    costs, and only the chosen groups are then solved host by host, so
+    the LPs stay small as the number of hosts grows. Problems whose
+    constraints span groups, or whose groups turn out infeasible, are
+    solved flat. The optimality loss against the flat problem is logged
+    for hierarchical_solver_flat_check_ratio of the requests, from a flat
+    solve in the background which does not delay the request.
+    """
+
+    def _get_host_groups(self, hosts, filter_properties, placement_problem):
+        """Group the hosts which can run an instance. Returns a list of
+        groups, each a sorted list of host indexes, in order of their
+        first host, or None if a coupling row spans groups.
+        """
+        context = filter_properties['context'].elevated()
+        metadata = db.aggregate_host_get_by_metadata_key(context,
+                key=CONF.solver_scheduler.hierarchical_solver_group_key)
+
+        groups = {}
+        host_groups = {}
+        for i in xrange(placement_problem.num_hosts):
+            if not placement_problem.get_max_count(i):
+                continue
+            group = tuple(sorted(metadata.get(hosts[i].host) or []))
+            host_groups[i] = group
+            groups.setdefault(group, []).append(i)
+        for row in placement_problem.coupling_rows:
+            if len(set(host_groups[i] for i, j in row[1]
+                       if i in host_groups)) > 1:
+                return None
+        return sorted(groups.values(), key=lambda group: group[0])
+
+    def _solve_groups(self, hosts, filter_properties, placement_problem,
+                      groups):
+        """Choose how many instances each group runs, and solve the
+        problem of each chosen group. Returns the number of instances to
+        place on each host, or None if a chosen group is infeasible.
+        """
+        estimated_solutions = []
+        for group in groups:
+            estimated_costs = placement_problem.get_estimated_costs(group)
+            solutions = dict((k, (cost, None))
+                             for k, cost in enumerate(estimated_costs))
+            if not placement_problem.can_leave_empty(group):
+                del solutions[0]
+            estimated_solutions.append(solutions)
+        choices = self._merge_partitions(placement_problem.num_instances,
+                                         estimated_solutions)
+        if choices is None:
+            return None
+
+        tasks = [(c, k) for c, k in enumerate(choices) if k]
+        LOG.debug(_("Placing the instances on %(num_chosen)s of "
+                    "%(num_groups)s host groups."),
+                  {'num_chosen': len(tasks), 'num_groups': len(groups)})
+        group_solutions = self._solve_partition_tasks(
+                hosts, filter_properties, placement_problem, groups, tasks)
+        for c, k in enumerate(choices):
+            if not k:
+                group_solutions[c][0] = (0, [0 for i in groups[c]])
+            elif k not in group_solutions[c]:
+                return None
+        return self._get_host_counts(placement_problem, groups,
+                                     group_solutions, choices)
+
+    def _log_optimality_loss(self, hosts, filter_properties,
+                             placement_problem, host_counts):
+        """Solve the flat problem, giving up after
+        hierarchical_solver_flat_check_seconds, and log how much more the
+        hierarchical placement costs.
+        """
+        seconds = CONF.solver_scheduler.hierarchical_solver_flat_check_seconds
+        solve_flat = super(HierarchicalSolver, self)._solve_placement_problem
+        finished = False
+        flat_counts = None
+        try:
+            with timeout.Timeout(seconds, False):
+                flat_counts = solve_flat(hosts, filter_properties,
+                                         placement_problem)
+                finished = True
+        except exception.SolverFailed:
+            LOG.debug(_("Flat problem not solved, optimality loss not "
+                        "logged."))
+            return
+        if not finished:
+            LOG.debug(_("Flat problem not solved within %d seconds, "
+                        "optimality loss not logged."), seconds)
+            return
+        if flat_counts is None:
+            return
+        cost = placement_problem.get_cost(host_counts)
+        flat_cost = placement_problem.get_cost(flat_counts)
+        LOG.info(_("Hierarchical placement cost: %(cost)s, flat placement "
+                   "cost: %(flat_cost)s, optimality loss: %(loss)s."),
+                 {'cost': cost, 'flat_cost': flat_cost,
+                  'loss': cost - flat_cost})
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        if (placement_problem.num_hosts <
+                CONF.solver_scheduler.hierarchical_solver_min_hosts or
+                not placement_problem.has_structural_rows or
+                not filter_properties.get('context')):
+            return super(HierarchicalSolver, self)._solve_placement_problem(
+                    hosts, filter_properties, placement_problem)
+
+        groups = self._get_host_groups(hosts, filter_properties,
+                                       placement_problem)
+        if groups is None:
+            LOG.debug(_("Constraints span host groups, solving the flat "
+                        "problem."))
+            return super(HierarchicalSolver, self)._solve_placement_problem(
+                    hosts, filter_properties, placement_problem)
+        if not groups:
+            return None
+
+        host_counts = self._solve_groups(hosts, filter_properties,
+                                         placement_problem, groups)
+        if host_counts is None:
+            LOG.info(_("No placement found on the chosen host groups, "
+                       "solving the flat problem."))
+            return super(HierarchicalSolver, self)._solve_placement_problem(
+                    hosts, filter_properties, placement_problem)
+
+        ratio = CONF.solver_scheduler.hierarchical_solver_flat_check_ratio
+        if ratio > 0 and random.random() < ratio:
+            greenthread.spawn_n(self._log_optimality_loss, hosts,
+                                filter_properties, placement_problem,
+                                host_counts)
+        return host_counts
@@ -0,0 +1,46 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler.solvers import pulp_solver
+
+LOG = logging.getLogger(__name__)
+
+
+class MinCostFlowSolver(pulp_solver.PulpSolver):
+    """A solver which places the instances as a min-cost flow whenever
+    the problem is one, and with the PULP based solver otherwise.
+
+    A problem is a min-cost flow problem when hosts are only coupled
+    through the instance count, each host can run any number of
+    instances up to its capacity, and the cost of each added instance on
+    a host is no lower than the one before. Such problems are solved
+    exactly in polynomial time, without an LP. The resource constraints
+    keep a problem separable, but whether the costs are convex is only
+    known once the squared transform of the cost matrix is applied. With
+    RamCost spreading instances, they are when the free RAM of the hosts
+    is within a few instances of each other, and with RamCost stacking
+    them, they never are.
+    """
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        if placement_problem.is_flow_representable:
+            LOG.debug(_("Solving the placement problem as a min-cost "
+                        "flow."))
+            return placement_problem.get_flow_solution()
+        return super(MinCostFlowSolver, self)._solve_placement_problem(
+                hosts, filter_properties, placement_problem)
@@ -0,0 +1,219 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet import greenpool
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler.solvers import pulp_solver
+
+partition_solver_opts = [
+        cfg.IntOpt('partition_solver_max_partitions',
+                   default=8,
+                   help='Largest number of host partitions which the '
+                        'partition solver solves separately and merges. '
+                        'Problems with more partitions are solved at once '
+                        'over the hosts which can run an instance.'),
+        cfg.IntOpt('partition_solver_workers',
+                   default=4,
+                   help='How many partition sub-problems the partition '
+                        'solver solves at the same time.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(partition_solver_opts, group='solver_scheduler')
+
+LOG = logging.getLogger(__name__)
+
+
+class PartitionSolver(pulp_solver.PulpSolver):
+    """A solver which splits the hosts into partitions which no coupling
+    constraint spans, and solves a smaller problem for each of them.
+
+    Hosts which cannot run any instance, like hosts outside of the
+    requested availability zone, are dropped from the problem, and do not
+    make partitions of their own. The remaining hosts only fall into
+    several partitions when coupling rows, such as the limits of separate
+    aggregates, tie each group of hosts together and no row spans two
+    groups. The number of instances each partition runs is then chosen
+    from bounds of its costs, and only the sub-problems of the chosen
+    numbers are solved by the PULP based solver, with
+    partition_solver_workers sub-problems solved at a time, until the
+    cheapest placement of all requested instances is found.
+    """
+
+    def _solve_partition(self, hosts, filter_properties, placement_problem,
+                         partition, num_instances):
+        """Return the cost and the host counts of the cheapest placement
+        of num_instances instances on the hosts of a partition, or None
+        if there is none.
+        """
+        if not num_instances:
+            if not placement_problem.can_leave_empty(partition):
+                return None
+            return 0, [0 for i in partition]
+        subproblem = placement_problem.get_subproblem(partition,
+                                                      num_instances)
+        sub_filter_properties = dict(filter_properties,
+                                     num_instances=num_instances)
+        host_counts = super(PartitionSolver, self)._solve_placement_problem(
+                [hosts[i] for i in partition], sub_filter_properties,
+                subproblem)
+        if host_counts is None:
+            return None
+        return subproblem.get_cost(host_counts), host_counts
+
+    def _merge_partitions(self, num_instances, partition_solutions):
+        """Choose how many instances each partition runs, where
+        partition_solutions[c] maps numbers of instances to the cost and
+        host counts of partition c. Returns the chosen number of instances
+        of each partition, or None if no choice places all instances.
+        """
+        # best[n] is the cost and the choices of the cheapest placement of
+        # n instances on the partitions seen so far.
+        best = {0: (0, [])}
+        for solutions in partition_solutions:
+            new_best = {}
+            for n in sorted(best):
+                cost, choices = best[n]
+                for k in sorted(solutions):
+                    if n + k > num_instances:
+                        break
+                    total_cost = cost + solutions[k][0]
+                    if (n + k not in new_best or
+                            total_cost < new_best[n + k][0]):
+                        new_best[n + k] = (total_cost, choices + [k])
+            best = new_best
+        if num_instances not in best:
+            return None
+        return best[num_instances][1]
+
+    def _solve_partition_tasks(self, hosts, filter_properties,
+                               placement_problem, partitions, tasks):
+        """Solve the sub-problems of placing k instances on partition c
+        for each task (c, k), partition_solver_workers at a time. Returns
+        a dict for each partition, mapping each k whose sub-problem is
+        feasible to the cost and host counts of its solution.
+        """
+        pool = greenpool.GreenPool(
+                CONF.solver_scheduler.partition_solver_workers)
+        threads = [pool.spawn(self._solve_partition, hosts,
+                              filter_properties, placement_problem,
+                              partitions[c], k)
+                   for c, k in tasks]
+        partition_solutions = [{} for partition in partitions]
+        for (c, k), thread in zip(tasks, threads):
+            solution = thread.wait()
+            if solution is not None:
+                partition_solutions[c][k] = solution
+        return partition_solutions
+
+    def _get_host_counts(self, placement_problem, partitions,
+                         partition_solutions, choices):
+        """Put together the solutions chosen for each partition, and
+        return the number of instances to place on each host, or None if
+        the placement breaks a constraint.
+        """
+        host_counts = [0 for i in xrange(placement_problem.num_hosts)]
+        for c, k in enumerate(choices):
+            for i, count in zip(partitions[c],
+                                partition_solutions[c][k][1]):
+                host_counts[i] = count
+        # NOTE: rows which only refer to hosts that cannot run an instance
+        # are in no partition, so they are checked on the whole placement.
+        if not placement_problem.is_feasible(host_counts):
+            return None
+        return host_counts
+
+    def _get_cost_bounds(self, placement_problem, partitions):
+        """Return a dict for each partition, mapping each number of
+        instances it may run to a lower bound of their cost and None, or
+        to their cost and host counts if these are already known.
+        """
+        cost_bounds = []
+        for partition in partitions:
+            estimated_costs = placement_problem.get_estimated_costs(partition)
+            bounds = dict((k, (cost, None))
+                          for k, cost in enumerate(estimated_costs))
+            if placement_problem.can_leave_empty(partition):
+                bounds[0] = (0, [0 for i in partition])
+            else:
+                del bounds[0]
+            cost_bounds.append(bounds)
+        return cost_bounds
+
+    def _solve_partitions(self, hosts, filter_properties, placement_problem,
+                          partitions):
+        """Choose how many instances each partition runs from the bounds
+        of their costs, and solve the sub-problems of the chosen numbers,
+        which replace their bounds with their costs, or drop them when
+        infeasible. Once every chosen number is solved, the placement is
+        the cheapest, as no bound is above the cost it stands for.
+        Returns the number of instances to place on each host, or None if
+        no placement is found.
+        """
+        # NOTE: the estimated costs of a partition sum its cheapest slots,
+        # so they never exceed the cost of a placement, and usually only
+        # the numbers of instances near the cheapest choice are solved,
+        # rather than every number up to the capacity of each partition.
+        num_instances = placement_problem.num_instances
+        cost_bounds = self._get_cost_bounds(placement_problem, partitions)
+        while True:
+            choices = self._merge_partitions(num_instances, cost_bounds)
+            if choices is None:
+                return None
+            tasks = [(c, k) for c, k in enumerate(choices)
+                     if cost_bounds[c][k][1] is None]
+            if not tasks:
+                break
+            partition_solutions = self._solve_partition_tasks(
+                    hosts, filter_properties, placement_problem, partitions,
+                    tasks)
+            for c, k in tasks:
+                if k in partition_solutions[c]:
+                    cost_bounds[c][k] = partition_solutions[c][k]
+                else:
+                    del cost_bounds[c][k]
+        return self._get_host_counts(placement_problem, partitions,
+                                     cost_bounds, choices)
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        if not placement_problem.has_structural_rows:
+            return super(PartitionSolver, self)._solve_placement_problem(
+                    hosts, filter_properties, placement_problem)
+        partitions = placement_problem.get_partitions()
+        if not partitions:
+            return None
+        if (len(partitions) > 1 and len(partitions) <=
+                CONF.solver_scheduler.partition_solver_max_partitions):
+            LOG.debug(_("Solving %(num_partitions)s host partitions "
+                        "separately."),
+                      {'num_partitions': len(partitions)})
+            return self._solve_partitions(hosts, filter_properties,
+                                          placement_problem, partitions)
+
+        host_indexes = sorted(i for partition in partitions
+                              for i in partition)
+        if len(host_indexes) == placement_problem.num_hosts:
+            return super(PartitionSolver, self)._solve_placement_problem(
+                    hosts, filter_properties, placement_problem)
+        LOG.debug(_("Solving over the %(num_eligible)s of %(num_hosts)s "
+                    "hosts which can run an instance."),
+                  {'num_eligible': len(host_indexes),
+                   'num_hosts': placement_problem.num_hosts})
+        return self._solve_partitions(hosts, filter_properties,
+                                      placement_problem, [host_indexes])
@@ -0,0 +1,94 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet import greenthread
+from eventlet import timeout
+from oslo.config import cfg
+
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+from nova.scheduler.solvers import greedy_solver
+from nova.scheduler.solvers import pulp_solver
+from nova import solver_scheduler_exception as exception
+
+portfolio_solver_opts = [
+        cfg.IntOpt('portfolio_solver_deadline_ms',
+                   default=1000,
+                   help='How long in milliseconds the portfolio solver '
+                        'waits for the LP solver. If the LP solver has not '
+                        'finished by then, the greedy placement is used.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(portfolio_solver_opts, group='solver_scheduler')
+
+LOG = logging.getLogger(__name__)
+
+
+class PortfolioSolver(pulp_solver.PulpSolver):
+    """A solver which runs a greedy placement and the PULP based solver on
+    the same problem at the same time.
+
+    The greedy placement is known almost at once. If the LP solver
+    finishes within portfolio_solver_deadline_ms, the placement of lower
+    cost is used, otherwise the greedy one is, and the LP solver is killed
+    so that it does not go on to update the warm starts. The LP solution
+    is waited for without a deadline only if the greedy placement failed.
+    """
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        start = timeutils.utcnow()
+        lp_thread = greenthread.spawn(
+                super(PortfolioSolver, self)._solve_placement_problem,
+                hosts, filter_properties, placement_problem)
+        greedy_counts = greedy_solver.get_greedy_solution(placement_problem)
+
+        deadline_ms = CONF.solver_scheduler.portfolio_solver_deadline_ms
+        remaining_seconds = max(deadline_ms / 1000.0 - timeutils.delta_seconds(
+                                    start, timeutils.utcnow()), 0)
+        finished = False
+        try:
+            if greedy_counts is None:
+                lp_counts = lp_thread.wait()
+                finished = True
+            else:
+                with timeout.Timeout(remaining_seconds, False):
+                    lp_counts = lp_thread.wait()
+                    finished = True
+        except exception.SolverFailed:
+            if greedy_counts is None:
+                raise
+            LOG.warn(_("LP solver failed, using the greedy placement."))
+            return greedy_counts
+
+        if not finished:
+            LOG.debug(_("LP solver did not finish within %d ms, using the "
+                        "greedy placement."), deadline_ms)
+            lp_thread.kill()
+            return greedy_counts
+        if lp_counts is None:
+            return greedy_counts
+        if greedy_counts is None:
+            return lp_counts
+        greedy_cost = placement_problem.get_cost(greedy_counts)
+        lp_cost = placement_problem.get_cost(lp_counts)
+        LOG.debug(_("Greedy placement cost: %(greedy_cost)s, LP placement "
+                    "cost: %(lp_cost)s."),
+                  {'greedy_cost': greedy_cost, 'lp_cost': lp_cost})
+        if greedy_cost < lp_cost:
+            return greedy_counts
+        return lp_counts
@@ -0,0 +1,611 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Placement problem shared by the scheduler solvers.
+
+Costs and constraints are evaluated once against IndexVariables, whose
+variables are (host index, instance index) tuples, and their components
+are kept as plain matrices. As in the LP model, variable (i, j) is 1 when
+host i is chosen to run j + 1 of the requested instances.
+"""
+
+import heapq
+import operator
+import time
+
+_OPERATIONS = {
+        '==': operator.eq,
+        '!=': operator.ne,
+        '>=': operator.ge,
+        '<=': operator.le,
+        '>': operator.gt,
+        '<': operator.lt}
+
+# Slack when rounding down fractional instance counts, so that counts
+# which are integral up to solver precision are kept.
+_ROUNDING_TOLERANCE = 1e-6
+
+# Smallest cost decrease for which local search makes a move, so that it
+# does not cycle through moves of equal cost.
+_IMPROVEMENT_TOLERANCE = 1e-9
+
+# Slack when checking that the cost of each added instance on a host is
+# no lower than the one before, so that linear costs with rounding noise
+# still count as convex.
+_CONVEXITY_TOLERANCE = 1e-9
+
+
+class PlacementProblem(object):
+    """Costs and constraints of one request in matrix form.
+
+    cost_matrix[i][j] is the cost of placing j + 1 instances on host i,
+    and allowed[i][j] is False when a constraint fixes variable (i, j) to
+    0. All constraint rows are kept in 'rows' in their original order;
+    rows other than these exclusions are also classified as per-host rows
+    (ValidSolutionConstraint), the instance count row
+    (NonTrivialSolutionConstraint) or coupling rows. Per-host rows and the
+    instance count row only depend on the shape of the problem, and are
+    kept in 'structural_rows'. A solver which proves that the problem has
+    no placement sets 'proven_infeasible'.
+    """
+
+    def __init__(self, hosts, num_instances):
+        self.hosts = hosts
+        self.num_hosts = len(hosts)
+        self.num_instances = num_instances
+        self.cost_matrix = [[0 for j in xrange(num_instances)]
+                            for i in xrange(self.num_hosts)]
+        self.allowed = [[True for j in xrange(num_instances)]
+                        for i in xrange(self.num_hosts)]
+        self.rows = []
+        self.exclusions = []
+        self.structural_rows = []
+        self.host_rows = set()
+        self.has_count_row = False
+        self.coupling_rows = []
+        self.proven_infeasible = False
+        self.is_subproblem = False
+
+    def add_cost(self, variables, coefficients, multiplier=1.0):
+        for k in xrange(len(variables)):
+            i, j = variables[k]
+            self.cost_matrix[i][j] += coefficients[k] * multiplier
+
+    def add_row(self, name, variables, coefficients, constant, operator):
+        self.rows.append((name, variables, coefficients, constant, operator))
+        if self._is_exclusion_row(variables, coefficients, constant,
+                                  operator):
+            i, j = variables[0]
+            self.allowed[i][j] = False
+            self.exclusions.append((i, j))
+        elif self._is_host_row(variables, coefficients, constant, operator):
+            self.host_rows.add(variables[0][0])
+            self.structural_rows.append(self.rows[-1])
+        elif self._is_count_row(variables, coefficients, constant, operator):
+            self.has_count_row = True
+            self.structural_rows.append(self.rows[-1])
+        else:
+            self.coupling_rows.append(self.rows[-1])
+
+    def add_rows_from(self, other):
+        """Add the rows of another problem of the same shape, keeping the
+        classification they were given there.
+        """
+        self.rows.extend(other.rows)
+        for i, j in other.exclusions:
+            self.allowed[i][j] = False
+        self.exclusions.extend(other.exclusions)
+        self.structural_rows.extend(other.structural_rows)
+        self.host_rows.update(other.host_rows)
+        self.has_count_row = self.has_count_row or other.has_count_row
+        self.coupling_rows.extend(other.coupling_rows)
+
+    def _is_exclusion_row(self, variables, coefficients, constant,
+                          operator):
+        return (len(variables) == 1 and coefficients[0] == 1 and
+                constant == 0 and operator in ('==', '<='))
+
+    def _is_host_row(self, variables, coefficients, constant, operator):
+        if (operator != '<=' or constant != 1 or
+                len(variables) != self.num_instances):
+            return False
+        host_idx = variables[0][0]
+        return (all(coeff == 1 for coeff in coefficients) and
+                sorted(variables) == [(host_idx, j)
+                                      for j in xrange(self.num_instances)])
+
+    def _is_count_row(self, variables, coefficients, constant, operator):
+        if (operator != '==' or constant != self.num_instances or
+                len(variables) != self.num_hosts * self.num_instances):
+            return False
+        return (len(set(variables)) == len(variables) and
+                all(coefficients[k] == variables[k][1] + 1
+                    for k in xrange(len(variables))))
+
+    @property
+    def has_structural_rows(self):
+        """Whether the problem has the instance count row, and every host
+        has its per-host row (which ValidSolutionConstraint omits for
+        single-instance requests).
+        """
+        return self.has_count_row and (self.num_instances <= 1 or
+                                       len(self.host_rows) == self.num_hosts)
+
+    @property
+    def is_separable(self):
+        """Whether hosts are only coupled through the instance count.
+
+        This holds when every row is an exclusion, a per-host row or the
+        instance count row, and the structural rows are all there.
+        """
+        return not self.coupling_rows and self.has_structural_rows
+
+    @property
+    def is_flow_representable(self):
+        """Whether the problem is a min-cost flow problem.
+
+        This holds for separable problems where every host is allowed to
+        run any number of instances up to some capacity, and the cost of
+        each added instance on a host is no lower than the one before.
+        The costs are checked as they are in the cost matrix, after any
+        transform the solver applied to them.
+        """
+        if not self.is_separable:
+            return False
+        for i in xrange(self.num_hosts):
+            capacity = 0
+            while (capacity < self.num_instances and
+                    self.allowed[i][capacity]):
+                capacity += 1
+            if any(self.allowed[i][capacity:]):
+                return False
+            last_cost = None
+            for count in xrange(1, capacity + 1):
+                cost = (self._get_host_cost(i, count) -
+                        self._get_host_cost(i, count - 1))
+                if (last_cost is not None and
+                        cost < last_cost - _CONVEXITY_TOLERANCE):
+                    return False
+                last_cost = cost
+        return True
+
+    def get_cost(self, host_counts):
+        """Return the cost of placing host_counts[i] instances on each
+        host i.
+        """
+        return sum(self.cost_matrix[i][host_counts[i] - 1]
+                   for i in xrange(self.num_hosts) if host_counts[i])
+
+    def is_feasible(self, host_counts):
+        """Whether placing host_counts[i] instances on each host i
+        satisfies every constraint row.
+        """
+        for (name, variables, coefficients, constant,
+                operator_str) in self.rows:
+            value = sum(coefficients[k]
+                        for k, (i, j) in enumerate(variables)
+                        if host_counts[i] == j + 1)
+            if not _OPERATIONS[operator_str](value, constant):
+                return False
+        return True
+
+    def get_single_instance_solution(self):
+        """Solve a separable single-instance problem without an LP.
+
+        The instance goes to the allowed host of lowest cost, ties broken
+        by (host, nodename), so the placement has the objective value of
+        the LP solution. When several hosts share the lowest cost, the LP
+        solver may pick another one of them.
+        Returns the number of instances to place on each host, or None if
+        no host is allowed.
+        """
+        best = None
+        best_key = None
+        for i in xrange(self.num_hosts):
+            if not self.allowed[i][0]:
+                continue
+            key = (self.cost_matrix[i][0], self.hosts[i].host,
+                   self.hosts[i].nodename)
+            if best_key is None or key < best_key:
+                best = i
+                best_key = key
+        if best is None:
+            return None
+        host_counts = [0 for i in xrange(self.num_hosts)]
+        host_counts[best] = 1
+        return host_counts
+
+    def _get_host_cost(self, i, count):
+        if not count:
+            return 0
+        return self.cost_matrix[i][count - 1]
+
+    def _get_next_count(self, i, count):
+        for j in xrange(count, self.num_instances):
+            if self.allowed[i][j]:
+                return j + 1
+        return None
+
+    def _push_greedy_step(self, heap, i, count):
+        """Push the step of host i from count to its next allowed count,
+        keyed by the cost it adds per added instance.
+        """
+        next_count = self._get_next_count(i, count)
+        if next_count is None:
+            return
+        rate = ((self._get_host_cost(i, next_count) -
+                 self._get_host_cost(i, count)) / float(next_count - count))
+        heapq.heappush(heap, (rate, self.hosts[i].host,
+                              self.hosts[i].nodename, i, count, next_count))
+
+    def get_greedy_solution(self):
+        """Place the instances with a greedy heuristic, without an LP.
+        Returns the number of instances to place on each host, or None if
+        no feasible placement was found this way.
+        """
+        return self.complete_solution([0 for i in xrange(self.num_hosts)])
+
+    def complete_solution(self, host_counts):
+        """Greedily place the instances which a partial placement leaves
+        out.
+
+        The host whose next allowed instance count adds the least cost
+        per added instance is raised to that count, ties broken by (host,
+        nodename), until every instance is placed. Only allowed counts
+        are used, so exclusions hold by construction, and other rows are
+        checked at the end. Returns the number of instances to place on
+        each host, or None if no feasible placement was found this way.
+        """
+        host_counts = list(host_counts)
+        remaining = self.num_instances - sum(host_counts)
+        heap = []
+
+        for i in xrange(self.num_hosts):
+            self._push_greedy_step(heap, i, host_counts[i])
+        while remaining > 0 and heap:
+            rate, host, nodename, i, count, next_count = heapq.heappop(heap)
+            # NOTE: the number of remaining instances only decreases, so a
+            # step larger than that will never fit and is dropped.
+            if next_count - count > remaining:
+                continue
+            host_counts[i] = next_count
+            remaining -= next_count - count
+            self._push_greedy_step(heap, i, next_count)
+
+        if remaining or not self.is_feasible(host_counts):
+            return None
+        return host_counts
+
+    def round_solution(self, values):
+        """Round a solution of the continuous relaxation of the problem,
+        where values[i][j] is the fractional value of variable (i, j).
+
+        Each host keeps the largest allowed count not above the number
+        of instances the relaxation gives it, rounded down, and the
+        instances left out are then placed greedily. Returns the number
+        of instances to place on each host, or None if no feasible
+        placement was found this way.
+        """
+        host_counts = []
+        for i in xrange(self.num_hosts):
+            expected = sum((j + 1) * values[i][j]
+                           for j in xrange(self.num_instances))
+            count = min(int(expected + _ROUNDING_TOLERANCE),
+                        self.num_instances)
+            while count and not self.allowed[i][count - 1]:
+                count -= 1
+            host_counts.append(count)
+        return self.complete_solution(host_counts)
+
+    def improve_solution(self, host_counts, time_budget):
+        """Improve a feasible placement by local search.
+
+        A move takes some instances off one host and puts them on another
+        host, both keeping allowed instance counts; moving the difference
+        between the counts of two hosts swaps them. The first move which
+        lowers the cost and keeps every coupling row satisfied is made,
+        until no move does or time_budget seconds have passed. Moves keep
+        the number of placed instances, so the other rows stay satisfied,
+        and the cost and coupling row values of a move are computed from
+        the two hosts it changes. Returns the number of instances to
+        place on each host.
+        """
+        deadline = time.time() + time_budget
+        host_counts = list(host_counts)
+        row_terms = []
+        row_values = []
+        for (name, variables, coefficients, constant,
+                operator_str) in self.coupling_rows:
+            terms = {}
+            for k, (i, j) in enumerate(variables):
+                host_terms = terms.setdefault(i, {})
+                host_terms[j] = host_terms.get(j, 0) + coefficients[k]
+            row_terms.append(terms)
+            row_values.append(sum(terms[i].get(host_counts[i] - 1, 0)
+                                  for i in terms))
+
+        while time.time() < deadline:
+            move = self._find_improving_move(host_counts, row_terms,
+                                             row_values, deadline)
+            if move is None:
+                break
+            a, new_count_a, b, new_count_b, row_values = move
+            host_counts[a] = new_count_a
+            host_counts[b] = new_count_b
+        return host_counts
+
+    def _get_row_delta(self, terms, i, count, new_count):
+        host_terms = terms.get(i)
+        if not host_terms:
+            return 0
+        return (host_terms.get(new_count - 1, 0) -
+                host_terms.get(count - 1, 0))
+
+    def _find_improving_move(self, host_counts, row_terms, row_values,
+                             deadline):
+        """Return the first move lowering the cost of the placement as
+        (host a, new count of a, host b, new count of b, new coupling row
+        values), or None if there is none or the deadline has passed.
+        """
+        for a in xrange(self.num_hosts):
+            count_a = host_counts[a]
+            if not count_a:
+                continue
+            if time.time() >= deadline:
+                return None
+            for new_count_a in xrange(count_a - 1, -1, -1):
+                if new_count_a and not self.allowed[a][new_count_a - 1]:
+                    continue
+                moved = count_a - new_count_a
+                delta_a = (self._get_host_cost(a, new_count_a) -
+                           self._get_host_cost(a, count_a))
+                for b in xrange(self.num_hosts):
+                    count_b = host_counts[b]
+                    new_count_b = count_b + moved
+                    if (b == a or new_count_b > self.num_instances or
+                            not self.allowed[b][new_count_b - 1]):
+                        continue
+                    delta = (delta_a + self._get_host_cost(b, new_count_b) -
+                             self._get_host_cost(b, count_b))
+                    if delta > -_IMPROVEMENT_TOLERANCE:
+                        continue
+                    new_values = [
+                            row_values[r] +
+                            self._get_row_delta(terms, a, count_a,
+                                                new_count_a) +
+                            self._get_row_delta(terms, b, count_b,
+                                                new_count_b)
+                            for r, terms in enumerate(row_terms)]
+                    if all(_OPERATIONS[row[4]](new_values[r], row[3])
+                           for r, row in enumerate(self.coupling_rows)):
+                        return a, new_count_a, b, new_count_b, new_values
+        return None
+
+    def _push_flow_arc(self, heap, i, count):
+        """Push the arc of host i taking its (count + 1)-th instance,
+        keyed by the cost it adds.
+        """
+        if count >= self.num_instances or not self.allowed[i][count]:
+            return
+        cost = (self._get_host_cost(i, count + 1) -
+                self._get_host_cost(i, count))
+        heapq.heappush(heap, (cost, self.hosts[i].host,
+                              self.hosts[i].nodename, i))
+
+    def get_flow_solution(self):
+        """Solve a flow representable problem exactly as a min-cost flow.
+
+        Each instance is a unit of flow from a source through one host to
+        a sink, and the arc for the (c + 1)-th instance on host i costs
+        what it adds to the cost of host i. The flow is found by
+        successive shortest paths: as the arc costs of a host do not
+        decrease, the shortest augmenting path is always the cheapest
+        unused arc, ties broken by (host, nodename), and no residual cycle
+        has negative cost, so the N paths are taken from a heap in
+        O(H + N log H). Returns the number of instances to place on each
+        host, or None if the hosts cannot take all instances.
+        """
+        host_counts = [0 for i in xrange(self.num_hosts)]
+        heap = []
+        for i in xrange(self.num_hosts):
+            self._push_flow_arc(heap, i, 0)
+        for n in xrange(self.num_instances):
+            if not heap:
+                return None
+            cost, host, nodename, i = heapq.heappop(heap)
+            host_counts[i] += 1
+            self._push_flow_arc(heap, i, host_counts[i])
+        return host_counts
+
+    def _find_partition(self, parents, i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    def get_partitions(self):
+        """Split the hosts which can run an instance into partitions which
+        no coupling row spans.
+
+        Hosts sharing a coupling row are in the same partition, and the
+        hosts no coupling row refers to are in one separable partition.
+        Hosts which cannot run any instance, like hosts outside of the
+        requested availability zone, are in no partition. Returns a list
+        of partitions, each a sorted list of host indexes, in order of
+        their first host.
+        """
+        eligible = [any(self.allowed[i]) for i in xrange(self.num_hosts)]
+        parents = range(self.num_hosts)
+        coupled = set()
+        for row in self.coupling_rows:
+            row_hosts = sorted(set(i for i, j in row[1] if eligible[i]))
+            coupled.update(row_hosts)
+            for i in row_hosts[1:]:
+                parents[self._find_partition(parents, i)] = (
+                        self._find_partition(parents, row_hosts[0]))
+
+        partitions = {}
+        free_hosts = []
+        for i in xrange(self.num_hosts):
+            if not eligible[i]:
+                continue
+            if i in coupled:
+                partitions.setdefault(self._find_partition(parents, i),
+                                      []).append(i)
+            else:
+                free_hosts.append(i)
+        partitions = partitions.values()
+        if free_hosts:
+            partitions.append(free_hosts)
+        partitions.sort(key=lambda partition: partition[0])
+        return partitions
+
+    def get_max_count(self, i):
+        """Return the largest number of instances host i may run."""
+        for j in reversed(xrange(self.num_instances)):
+            if self.allowed[i][j]:
+                return j + 1
+        return 0
+
+    def get_estimated_costs(self, host_indexes):
+        """Estimate the cost of placing each number of instances on a
+        group of hosts without solving its problem.
+
+        The cost each added instance adds on a host, up to the largest
+        number of instances the host may run, is a slot of the group, and
+        k instances are estimated to cost the k cheapest slots. This is
+        exact when the problem of the group is flow representable.
+        Returns a list whose item k is the estimated cost of k instances,
+        for k up to the number of slots or of requested instances.
+        """
+        slots = []
+        for i in host_indexes:
+            for count in xrange(1, self.get_max_count(i) + 1):
+                slots.append(self._get_host_cost(i, count) -
+                             self._get_host_cost(i, count - 1))
+        estimated_costs = [0]
+        for cost in heapq.nsmallest(self.num_instances, slots):
+            estimated_costs.append(estimated_costs[-1] + cost)
+        return estimated_costs
+
+    def can_leave_empty(self, host_indexes):
+        """Whether the coupling rows of a partition hold when its hosts
+        run no instance.
+        """
+        host_indexes = set(host_indexes)
+        return all(_OPERATIONS[operator_str](0, constant)
+                   for (name, variables, coefficients, constant,
+                        operator_str) in self.coupling_rows
+                   if any(i in host_indexes for i, j in variables))
+
+    def get_subproblem(self, host_indexes, num_instances):
+        """Return the problem of placing num_instances instances on the
+        given hosts only, renumbered in the order given.
+
+        Exclusions and coupling rows keep their terms on these hosts and
+        counts up to num_instances; the other terms are dropped, as their
+        variables are 0. The instance count row and per-host rows are
+        built for the new shape if the problem has them.
+        """
+        subproblem = PlacementProblem([self.hosts[i] for i in host_indexes],
+                                      num_instances)
+        subproblem.is_subproblem = True
+        new_indexes = dict((i, k) for k, i in enumerate(host_indexes))
+        for k, i in enumerate(host_indexes):
+            subproblem.cost_matrix[k] = self.cost_matrix[i][:num_instances]
+            for j in xrange(num_instances):
+                if not self.allowed[i][j]:
+                    subproblem.add_row('Exclusion_%s_%s' % (k, j), [(k, j)],
+                                       [1], 0, '==')
+
+        variables = [(k, j) for k in xrange(len(host_indexes))
+                     for j in xrange(num_instances)]
+        if self.has_count_row:
+            subproblem.add_row('Instance_Count', variables,
+                               [j + 1 for k, j in variables], num_instances,
+                               '==')
+        for k, i in enumerate(host_indexes):
+            if i in self.host_rows:
+                subproblem.add_row('Host_%s' % k,
+                                   [(k, j) for j in xrange(num_instances)],
+                                   [1 for j in xrange(num_instances)], 1,
+                                   '<=')
+
+        for (name, variables, coefficients, constant,
+                operator_str) in self.coupling_rows:
+            terms = [((new_indexes[i], j), coefficients[n])
+                     for n, (i, j) in enumerate(variables)
+                     if i in new_indexes and j < num_instances]
+            if terms:
+                subproblem.add_row(name, [var for var, coeff in terms],
+                                   [coeff for var, coeff in terms],
+                                   constant, operator_str)
+        return subproblem
+
+    def get_alternate_hosts(self, host_counts, max_alternates):
+        """Rank the hosts which could take one of the requested instances
+        if its chosen host fails.
+
+        These are the hosts not chosen by the solution which are allowed
+        to run an instance, lowest cost first and ties broken by (host,
+        nodename). Only meaningful for separable problems. Returns at most
+        max_alternates host indexes.
+        """
+        candidates = [i for i in xrange(self.num_hosts)
+                      if not host_counts[i] and self.allowed[i][0]]
+        candidates.sort(key=lambda i: (self.cost_matrix[i][0],
+                                       self.hosts[i].host,
+                                       self.hosts[i].nodename))
+        return candidates[:max_alternates]
+
+    def get_host_classes(self):
+        """Group hosts which are interchangeable in the model.
+
+        Hosts with identical allowed variables and cost rows are in the
+        same class. Returns a list of classes, each a list of host indexes
+        sorted by (host, nodename), in order of first appearance.
+        """
+        classes = {}
+        class_keys = []
+        for i in xrange(self.num_hosts):
+            key = (tuple(self.allowed[i]), tuple(self.cost_matrix[i]))
+            if key not in classes:
+                classes[key] = []
+                class_keys.append(key)
+            classes[key].append(i)
+        host_classes = []
+        for key in class_keys:
+            members = classes[key]
+            members.sort(key=lambda i: (self.hosts[i].host,
+                                        self.hosts[i].nodename))
+            host_classes.append(members)
+        return host_classes
+
+    def expand_host_classes(self, host_classes, class_counts):
+        """Expand a class-level solution back to concrete hosts.
+
+        class_counts[c][j] is the number of hosts of class c chosen to run
+        j + 1 instances. Larger counts go to hosts earlier in the class, so
+        the expansion is deterministic. Returns the number of instances
+        to place on each host.
+        """
+        host_counts = [0 for i in xrange(self.num_hosts)]
+        for members, counts in zip(host_classes, class_counts):
+            members_iter = iter(members)
+            for j in reversed(xrange(self.num_instances)):
+                for k in xrange(counts[j]):
+                    host_counts[members_iter.next()] = j + 1
+        return host_counts
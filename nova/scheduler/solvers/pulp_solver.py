@@ -17,11 +17,14 @@ from pulp import constants
 from pulp import pulp
 from pulp import solvers as pulp_solver_classes
 
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import solvers as scheduler_solver
+from nova.scheduler.solvers import constraints
+from nova.scheduler.solvers import utils as solver_utils
 from nova import solver_scheduler_exception as exception
 
 pulp_solver_opts =[
@@ -30,6 +33,37 @@ pulp_solver_opts =[
                     help='How much time in seconds is allowed for solvers to '
                          'solve the scheduling problem. If this time limit '
                          'is exceeded the solver will be stopped.'),
+        cfg.BoolOpt('pulp_solver_host_class_presolve',
+                    default=True,
+                    help='Whether to group interchangeable hosts into '
+                         'equivalence classes before building the LP, so '
+                         'that the problem is solved over host classes '
+                         'instead of individual hosts.'),
+        cfg.BoolOpt('pulp_solver_single_instance_fast_path',
+                    default=True,
+                    help='Whether to place single-instance requests by '
+                         'taking the lowest cost allowed host directly, '
+                         'without building and solving the LP.'),
+        cfg.BoolOpt('pulp_solver_warm_start',
+                    default=True,
+                    help='Whether to start from the last solution of a '
+                         'request with the same signature. If it is still '
+                         'feasible, it bounds the cost of the new solution '
+                         'and is used if the solver times out.'),
+        cfg.BoolOpt('pulp_solver_persistent_models',
+                    default=True,
+                    help='Whether to keep the flat LP model of each problem '
+                         'shape and reuse it for the next problem of the '
+                         'same shape, only setting again the bounds and '
+                         'costs of the hosts which changed, and the '
+                         'coupling constraints.'),
+        cfg.IntOpt('pulp_solver_lp_relaxation_threshold',
+                   default=0,
+                   help='Number of host-instance variables from which the '
+                        'problem is solved as a continuous LP, whose '
+                        'solution is then rounded to a feasible placement, '
+                        'instead of with integer branch and bound. Set to '
+                        '0 to always solve the integer problem.'),
 ]
 
 CONF = cfg.CONF
@@ -37,6 +71,18 @@ CONF.register_opts(pulp_solver_opts, group='solver_scheduler')
 
 LOG = logging.getLogger(__name__)
 
+# Last solutions by request signature, number of instances and, for
+# sub-problems, their hosts, as instance counts by (host, nodename).
+_warm_starts = solver_utils.LRUCache(256)
+
+# Flat LP models kept for reuse, by number of hosts, number of instances
+# and whether the model has costs.
+_host_models = solver_utils.LRUCache(16)
+
+# Relative slack of the incumbent cost bound, so that rounding in the LP
+# solver does not cut off the incumbent itself.
+_INCUMBENT_COST_TOLERANCE = 1e-6
+
 
 class PulpVariables(scheduler_solver.BaseVariables):
     
@@ -52,10 +98,7 @@ class PulpSolver(scheduler_solver.BaseHostSolver):
 
     variables_cls = PulpVariables
 
-    def __init__(self):
-        super(PulpSolver, self).__init__()
-        self.cost_classes = self._get_cost_classes()
-        self.constraint_classes = self._get_constraint_classes()
+    supports_multiple_flavors = True
 
     def _get_operation(self, op_str):
         ops = {
@@ -67,137 +110,476 @@ class PulpSolver(scheduler_solver.BaseHostSolver):
                 '<': lambda x, y: x < y}
         return ops.get(op_str)
 
-    def _calculate_host_instance_cost_matrix(self, cost_matrix):
-        new_cost_matrix = cost_matrix
-        if not cost_matrix:
-            return new_cost_matrix
-        first_column = [row[0] for row in cost_matrix]
-        last_column = [row[-1] for row in cost_matrix]
-        if sum(first_column) < sum(last_column):
-            offset = min(first_column)
-            sign = 1
-        else:
-            offset = max(first_column)
-            sign = -1
-        for i in xrange(len(cost_matrix)):
-            for j in xrange(len(cost_matrix[i])):
-                new_cost_matrix[i][j] = sign * (
-                                        (cost_matrix[i][j] - offset) ** 2)
-        return new_cost_matrix
+    def _solve_problem(self, prob):
+        """Solve the LP and return its status, raising SolverFailed if the
+        solver could neither find an optimal solution nor prove that the
+        problem is infeasible.
+        """
+        # NOTE: building the LP does not yield, so the solve yields before
+        # handing it to the solver.
+        greenthread.sleep(0)
+        # The problem is solved using PULP's choice of Solver.
+        prob.solve(pulp_solver_classes.PULP_CBC_CMD(
+                maxSeconds=CONF.solver_scheduler.pulp_solver_timeout_seconds))
 
-    def solve(self, hosts, filter_properties):
-        """This method returns a list of tuples - (host, instance_uuid)
-        that are returned by the solver. Here the assumption is that
-        all instance_uuids have the same requirement as specified in
-        filter_properties.
+        status = pulp.LpStatus[prob.status]
+        if status != 'Optimal':
+            LOG.warn(_("Pulp solver didnot find optimal solution! reason: %s")
+                    % status)
+        if status not in ('Optimal', 'Infeasible'):
+            raise exception.SolverFailed(reason=status)
+        return status
+
+    def _get_warm_start_key(self, filter_properties, hosts=None):
+        """Return the key of the last solution of a request. hosts are
+        given for a sub-problem of the request, such as a host partition,
+        whose solutions are kept apart from those of other sub-problems
+        placing the same number of instances.
         """
-        host_instance_combinations = []
+        request_spec = filter_properties.get('request_spec') or {}
+        key = (solver_utils.get_request_signature(request_spec,
+                                                  filter_properties),
+               filter_properties['num_instances'])
+        if hosts is not None:
+            key += (tuple(sorted((host.host, host.nodename)
+                                 for host in hosts)),)
+        return key
 
-        num_instances = filter_properties['num_instances']
-        num_hosts = len(hosts)
+    def _get_incumbent(self, placement_problem, key):
+        """Map the last solution of the same request onto the current
+        hosts, and return it if it still places every instance without
+        breaking a constraint.
+        """
+        last_counts = _warm_starts.get(key)
+        if not last_counts:
+            return None
+        host_counts = [last_counts.get((host.host, host.nodename), 0)
+                       for host in placement_problem.hosts]
+        if (sum(host_counts) != placement_problem.num_instances or
+                not placement_problem.is_feasible(host_counts)):
+            return None
+        return host_counts
 
-        instance_uuids = filter_properties.get('instance_uuids') or [
-                '(unknown_uuid)' + str(i) for i in xrange(num_instances)]
+    def _save_warm_start(self, key, hosts, host_counts):
+        _warm_starts.put(key, dict(((hosts[i].host, hosts[i].nodename),
+                                    host_counts[i])
+                                   for i in xrange(len(hosts))
+                                   if host_counts[i]))
 
-        LOG.debug(_("All Hosts: %s") % [h.host for h in hosts])
-        for host in hosts:
-            LOG.debug(_("Host state: %s") % host)
+    def _add_row(self, prob, var_matrix, row):
+        name, variables, coefficients, constant, operator = row
+        operation = self._get_operation(operator)
+        prob += (operation(pulp.lpSum([coefficients[k] *
+                var_matrix[i][j] for k, (i, j) in enumerate(variables)]),
+                constant), name)
 
-        # Create dictionaries mapping temporary host/instance keys to
-        # hosts/instance_uuids. These temorary keys are to be used in the
-        # solving process since we need a convention of lp variable names.
-        host_keys = ['Host' + str(i) for i in xrange(num_hosts)]
-        host_key_map = dict(zip(host_keys, hosts))
-        instance_keys = ['InstanceNum' + str(i) for i in xrange(num_instances)]
-        instance_key_map = dict(
-                zip(instance_keys, xrange(1, num_instances + 1)))
+    def _set_coupling_rows(self, model, coupling_rows):
+        prob = model['prob']
+        for name in model['coupling_rows']:
+            del prob.constraints[name]
+        for row in coupling_rows:
+            self._add_row(prob, model['var_matrix'], row)
+        model['coupling_rows'] = [row[0] for row in coupling_rows]
 
-        # this is currently hard-coded and should match variable names
-        host_instance_matrix_idx_map = {}
-        for i in xrange(len(host_keys)):
-            for j in xrange(len(instance_keys)):
-                var_name = 'HI_' + host_keys[i] + '_' + instance_keys[j]
-                host_instance_matrix_idx_map[var_name] = (i, j)
+    def _get_model_structure(self, placement_problem):
+        return (frozenset(placement_problem.host_rows),
+                placement_problem.has_count_row)
+
+    def _build_host_model(self, placement_problem):
+        """Build the LP with one variable per host and instance count.
+        Exclusions are expressed as variable bounds, so that they can be
+        patched in place when the model is reused.
+        """
+        num_hosts = placement_problem.num_hosts
+        num_instances = placement_problem.num_instances
+        cost_matrix = placement_problem.cost_matrix
 
-        # Create the 'variables' to contain the referenced variables.
+        # Create the 'variables' to contain the referenced variables. The
+        # temporary host/instance keys are only used as lp variable names.
+        host_keys = ['Host' + str(i) for i in xrange(num_hosts)]
+        instance_keys = ['InstanceNum' + str(i) for i in xrange(num_instances)]
         self.variables.populate_variables(host_keys, instance_keys)
+        var_matrix = self.variables.host_instance_matrix
+        for i in xrange(num_hosts):
+            for j in xrange(num_instances):
+                if not placement_problem.allowed[i][j]:
+                    var_matrix[i][j].upBound = 0
 
         # Create the 'prob' variable to contain the problem data.
         prob = pulp.LpProblem("Host Instance Scheduler Problem",
                                 constants.LpMinimize)
 
-        # Get costs and constraints and formulate the linear problem.
-
         # Add costs.
-        cost_objects = [cost() for cost in self.cost_classes]
-        cost_coeff_matrix = [[0 for j in xrange(num_instances)]
-                            for i in xrange(num_hosts)]
-        for cost_object in cost_objects:
-            var_list, coeff_list = cost_object.get_components(
-                                    self.variables, hosts, filter_properties)
-            for i in xrange(len(var_list)):
-                var = var_list[i]
-                coeff = coeff_list[i]
-                hidx, iidx = host_instance_matrix_idx_map[var.name]
-                cost_coeff_matrix[hidx][iidx] += (
-                                        coeff * cost_object.cost_multiplier())
-        cost_coeff_matrix = self._calculate_host_instance_cost_matrix(
-                                                            cost_coeff_matrix)
-        cost_coeff_array = []
-        for var in var_list:
-            hidx, iidx = host_instance_matrix_idx_map[var.name]
-            cost_coeff_array.append(cost_coeff_matrix[hidx][iidx])
-        cost_variables = var_list
-        cost_coefficients = cost_coeff_array
-        if cost_variables:
-            prob += (pulp.lpSum([cost_coefficients[i] * cost_variables[i]
-                    for i in xrange(len(cost_variables))]), "Sum_Costs")
+        if self.cost_classes:
+            prob += (pulp.lpSum([cost_matrix[i][j] * var_matrix[i][j]
+                    for i in xrange(num_hosts)
+                    for j in xrange(num_instances)]), "Sum_Costs")
 
         # Add constraints.
-        constraint_objects = [constraint()
-                                for constraint in self.constraint_classes]
-        for constraint_object in constraint_objects:
-            vars_list, coeffs_list, consts_list, ops_list = (
-                    constraint_object.get_components(self.variables, hosts,
-                    filter_properties))
-            LOG.debug(_("coeffs of %(name)s is: %(value)s") %
-                    {"name": constraint_object.__class__.__name__,
-                    "value": coeffs_list})
-            for i in xrange(len(ops_list)):
-                operation = self._get_operation(ops_list[i])
-                prob += (
-                        operation(pulp.lpSum([coeffs_list[i][j] *
-                        vars_list[i][j] for j in xrange(len(vars_list[i]))]),
-                        consts_list[i]), "Costraint_Name_%s" %
-                        constraint_object.__class__.__name__ + "_No._%s" % i)
+        for row in placement_problem.structural_rows:
+            self._add_row(prob, var_matrix, row)
 
-        # The problem is solved using PULP's choice of Solver.
-        prob.solve(pulp_solver_classes.PULP_CBC_CMD(
-                maxSeconds=CONF.solver_scheduler.pulp_solver_timeout_seconds))
+        model = {'prob': prob,
+                 'var_matrix': var_matrix,
+                 'allowed': [list(row) for row in placement_problem.allowed],
+                 'cost_matrix': [list(row) for row in cost_matrix],
+                 'structure': self._get_model_structure(placement_problem),
+                 'coupling_rows': [],
+                 'busy': True}
+        self._set_coupling_rows(model, placement_problem.coupling_rows)
+        return model
 
-        # Create host-instance tuples from the solutions.
-        if pulp.LpStatus[prob.status] == 'Optimal':
-            num_insts_on_host = {}
-            for v in prob.variables():
-                if v.name.startswith('HI'):
-                    (host_key, instance_key) = v.name.lstrip('HI').lstrip(
-                                                        '_').split('_')
-                    if v.varValue == 1:
-                        num_insts_on_host[host_key] = (
-                                            instance_key_map[instance_key])
-            instances_iter = iter(instance_uuids)
-            for host_key in host_keys:
-                num_insts_on_this_host = num_insts_on_host.get(host_key, 0)
-                for i in xrange(num_insts_on_this_host):
-                    host_instance_combinations.append(
-                            (host_key_map[host_key], instances_iter.next()))
-        elif pulp.LpStatus[prob.status] == 'Infeasible':
-            LOG.warn(_("Pulp solver didnot find optimal solution! reason: %s")
-                    % pulp.LpStatus[prob.status])
-            host_instance_combinations = []
-        else:
-            LOG.warn(_("Pulp solver didnot find optimal solution! reason: %s")
-                    % pulp.LpStatus[prob.status])
-            raise exception.SolverFailed(reason=pulp.LpStatus[prob.status])
+    def _patch_host_model(self, model, placement_problem):
+        """Update a model built for an earlier problem of the same shape:
+        only the bounds and costs of hosts whose rows changed are set
+        again, and the coupling rows are replaced.
+        """
+        prob = model['prob']
+        var_matrix = model['var_matrix']
+        num_patched = 0
+        for i in xrange(placement_problem.num_hosts):
+            allowed = placement_problem.allowed[i]
+            costs = placement_problem.cost_matrix[i]
+            if (allowed == model['allowed'][i] and
+                    costs == model['cost_matrix'][i]):
+                continue
+            num_patched += 1
+            for j in xrange(placement_problem.num_instances):
+                var_matrix[i][j].upBound = 1 if allowed[j] else 0
+                if prob.objective is not None:
+                    prob.objective[var_matrix[i][j]] = costs[j]
+            model['allowed'][i] = list(allowed)
+            model['cost_matrix'][i] = list(costs)
+        self._set_coupling_rows(model, placement_problem.coupling_rows)
+        if 'Incumbent_Cost' in prob.constraints:
+            del prob.constraints['Incumbent_Cost']
+        model['busy'] = True
+        LOG.debug(_("Reusing the LP model, %(num_patched)s of %(num_hosts)s "
+                    "hosts changed."),
+                  {'num_patched': num_patched,
+                   'num_hosts': placement_problem.num_hosts})
+
+    def _get_host_model(self, placement_problem):
+        """Return the flat LP model of the problem. With persistent models,
+        the model kept for the shape of the problem is patched and reused,
+        unless another request is solving it. The caller releases the
+        model by clearing its 'busy' flag once solved.
+        """
+        if not CONF.solver_scheduler.pulp_solver_persistent_models:
+            return self._build_host_model(placement_problem)
+        # NOTE: changed hosts are found by comparing the evaluated rows, not
+        # by host state generations, as costs are normalized across all
+        # hosts and some constraints read data outside the host state.
+        model_key = (placement_problem.num_hosts,
+                     placement_problem.num_instances,
+                     bool(self.cost_classes))
+        model = _host_models.get(model_key)
+        if model is not None and model['busy']:
+            return self._build_host_model(placement_problem)
+        if (model is None or model['structure'] !=
+                self._get_model_structure(placement_problem)):
+            model = self._build_host_model(placement_problem)
+            _host_models.put(model_key, model)
+            return model
+        self._patch_host_model(model, placement_problem)
+        return model
+
+    def _solve_hosts(self, placement_problem, incumbent=None):
+        """Solve the problem with one variable per host and instance count.
+        Returns the number of instances to place on each host, or None if
+        the problem is infeasible.
+
+        A feasible incumbent solution bounds the cost of the solution,
+        which lets the solver prune the search, and is returned if the
+        solver does not finish.
+        """
+        num_hosts = placement_problem.num_hosts
+        num_instances = placement_problem.num_instances
+
+        model = self._get_host_model(placement_problem)
+        prob = model['prob']
+        var_matrix = model['var_matrix']
+        if incumbent is not None and prob.objective is not None:
+            incumbent_cost = placement_problem.get_cost(incumbent)
+            prob += (prob.objective <= incumbent_cost +
+                     _INCUMBENT_COST_TOLERANCE * max(1, abs(incumbent_cost)),
+                     "Incumbent_Cost")
+
+        try:
+            status = self._solve_problem(prob)
+        except exception.SolverFailed:
+            if incumbent is None:
+                raise
+            LOG.warn(_("Pulp solver did not finish, using the last solution "
+                       "of the same request."))
+            return incumbent
+        finally:
+            model['busy'] = False
+        if status != 'Optimal':
+            if status == 'Infeasible' and incumbent is None:
+                placement_problem.proven_infeasible = True
+            return incumbent
+
+        host_counts = [0 for i in xrange(num_hosts)]
+        for i in xrange(num_hosts):
+            for j in xrange(num_instances):
+                if var_matrix[i][j].varValue > 0.5:
+                    host_counts[i] = j + 1
+        return host_counts
+
+    def _solve_host_classes(self, placement_problem):
+        """Solve the problem over classes of interchangeable hosts, where
+        variable (c, j) counts the hosts of class c which run j + 1
+        instances. Only valid for separable problems. Returns the number
+        of instances to place on each host, or None if the problem is
+        infeasible.
+        """
+        num_instances = placement_problem.num_instances
+        host_classes = placement_problem.get_host_classes()
+        LOG.debug(_("Solving over %(num_classes)s host classes instead of "
+                    "%(num_hosts)s hosts."),
+                  {'num_classes': len(host_classes),
+                   'num_hosts': placement_problem.num_hosts})
 
+        prob = pulp.LpProblem("Host Class Instance Scheduler Problem",
+                                constants.LpMinimize)
+
+        class_vars = []
+        costs = []
+        count_vars = []
+        count_coeffs = []
+        for c, members in enumerate(host_classes):
+            rep = members[0]
+            row_vars = {}
+            for j in xrange(num_instances):
+                if placement_problem.allowed[rep][j]:
+                    var = pulp.LpVariable('HC_Class%s_InstanceNum%s' % (c, j),
+                                          0, len(members), constants.LpInteger)
+                    row_vars[j] = var
+                    costs.append(placement_problem.cost_matrix[rep][j] * var)
+                    count_vars.append(var)
+                    count_coeffs.append(j + 1)
+            class_vars.append(row_vars)
+            if row_vars and num_instances > 1:
+                prob += (pulp.lpSum(row_vars.values()) <= len(members),
+                         "Host_Class_%s" % c)
+
+        if not count_vars:
+            return None
+
+        if self.cost_classes:
+            prob += (pulp.lpSum(costs), "Sum_Costs")
+        prob += (pulp.lpSum([count_coeffs[k] * count_vars[k]
+                             for k in xrange(len(count_vars))]) ==
+                 num_instances, "Num_Instances")
+
+        status = self._solve_problem(prob)
+        if status != 'Optimal':
+            if status == 'Infeasible':
+                placement_problem.proven_infeasible = True
+            return None
+
+        class_counts = []
+        for row_vars in class_vars:
+            counts = [0 for j in xrange(num_instances)]
+            for j, var in row_vars.iteritems():
+                counts[j] = int(round(var.varValue or 0))
+            class_counts.append(counts)
+        return placement_problem.expand_host_classes(host_classes,
+                                                     class_counts)
+
+    def _solve_placement_problem(self, hosts, filter_properties,
+                                 placement_problem):
+        """Solve separable problems without an LP or over host classes
+        where enabled, and other problems with the flat LP.
+        """
+        if (CONF.solver_scheduler.pulp_solver_single_instance_fast_path and
+                placement_problem.num_instances == 1 and
+                placement_problem.is_separable):
+            return placement_problem.get_single_instance_solution()
+        threshold = CONF.solver_scheduler.pulp_solver_lp_relaxation_threshold
+        if (threshold > 0 and placement_problem.num_hosts *
+                placement_problem.num_instances >= threshold):
+            return self._solve_relaxation(placement_problem)
+        if (CONF.solver_scheduler.pulp_solver_host_class_presolve and
+                placement_problem.is_separable):
+            return self._solve_host_classes(placement_problem)
+        return self._solve_flat(hosts, filter_properties, placement_problem)
+
+    def _solve_relaxation(self, placement_problem):
+        """Solve the continuous relaxation of the problem and round its
+        solution to a feasible placement.
+
+        The cost of the relaxed solution is a lower bound on the cost of
+        any placement, and is logged with the cost of the rounded one.
+        If rounding does not give a feasible placement, the integer
+        problem is solved instead. Returns the number of instances to
+        place on each host, or None if the problem is infeasible.
+
+        The relaxation is solved on the same model as the integer problem,
+        whose variables are made continuous for the solve only.
+        """
+        model = self._get_host_model(placement_problem)
+        prob = model['prob']
+        var_matrix = model['var_matrix']
+        for row in var_matrix:
+            for var in row:
+                var.cat = constants.LpContinuous
+
+        try:
+            status = self._solve_problem(prob)
+            values = [[var.varValue or 0 for var in row]
+                      for row in var_matrix]
+            lp_bound = pulp.value(prob.objective) if prob.objective else 0
+        finally:
+            for row in var_matrix:
+                for var in row:
+                    var.cat = constants.LpInteger
+            model['busy'] = False
+        if status != 'Optimal':
+            # NOTE: without a placement of the relaxation, there is none of
+            # the integer problem either.
+            if status == 'Infeasible':
+                placement_problem.proven_infeasible = True
+            return None
+
+        host_counts = placement_problem.round_solution(values)
+        if host_counts is None:
+            LOG.warn(_("Rounding the LP relaxation did not give a feasible "
+                       "placement, solving the integer problem."))
+            return self._solve_hosts(placement_problem)
+
+        LOG.info(_("Placement cost %(cost)s, the LP relaxation bounds it "
+                   "from below by %(lp_bound)s."),
+                 {'cost': placement_problem.get_cost(host_counts),
+                  'lp_bound': lp_bound})
+        return host_counts
+
+    def _solve_flat(self, hosts, filter_properties, placement_problem):
+        """Solve the problem with one variable per host and instance
+        count, starting from the last solution of the same request if
+        enabled.
+        """
+        key = self._get_warm_start_key(filter_properties,
+                hosts if placement_problem.is_subproblem else None)
+        incumbent = None
+        if CONF.solver_scheduler.pulp_solver_warm_start:
+            incumbent = self._get_incumbent(placement_problem, key)
+        host_counts = self._solve_hosts(placement_problem, incumbent)
+        if (CONF.solver_scheduler.pulp_solver_warm_start and
+                host_counts is not None):
+            self._save_warm_start(key, hosts, host_counts)
+        return host_counts
+
+    def solve(self, hosts, filter_properties):
+        """This method returns a list of tuples - (host, instance_uuid)
+        that are returned by the solver. Here the assumption is that
+        all instance_uuids have the same requirement as specified in
+        filter_properties.
+        """
+        host_instance_combinations, alternates = self._get_solution(
+                                                    hosts, filter_properties)
         return host_instance_combinations
+
+    def solve_with_alternates(self, hosts, filter_properties,
+                              max_alternates):
+        """Like solve, but also rank up to max_alternates hosts which can
+        take a requested instance if its chosen host fails. Alternates
+        are only ranked when hosts are independent of each other in the
+        model, as they are otherwise not known to be feasible.
+        """
+        return self._get_solution(hosts, filter_properties, max_alternates)
+
+    def solve_multi(self, hosts, filter_properties_list):
+        """Place several requests, each with its own flavor, with one LP.
+
+        Every request gets its own host-instance variables, costs and
+        constraint rows. For each resource constraint, one row per host
+        then limits the sum of the demands of all requests to what the
+        host has left, so that the requests cannot oversubscribe a host
+        together. Returns a list of host-instance tuple lists, one for
+        each request, which are all empty if the requests cannot be
+        placed together.
+        """
+        num_hosts = len(hosts)
+        LOG.debug(_("Placing %(num_requests)s requests on hosts: %(hosts)s"),
+                  {'num_requests': len(filter_properties_list),
+                   'hosts': [h.host for h in hosts]})
+
+        for filter_properties in filter_properties_list:
+            binding_constraint = self._presolve_capacity(filter_properties,
+                    self._get_host_capacities(hosts, filter_properties))
+            if binding_constraint is not None:
+                LOG.info(_("Requests are infeasible, %s does not leave room "
+                           "for the requested instances."),
+                         binding_constraint)
+                return [[] for filter_properties in filter_properties_list]
+
+        placement_problems = [
+                self._get_placement_problem(hosts, filter_properties)
+                for filter_properties in filter_properties_list]
+
+        prob = pulp.LpProblem("Multiple Flavor Scheduler Problem",
+                                constants.LpMinimize)
+
+        var_matrices = []
+        costs = []
+        for r, placement_problem in enumerate(placement_problems):
+            num_instances = placement_problem.num_instances
+            var_matrix = [
+                    [pulp.LpVariable('HI_Request%s_Host%s_InstanceNum%s' %
+                                     (r, i, j), 0, 1, constants.LpInteger)
+                     for j in xrange(num_instances)]
+                    for i in xrange(num_hosts)]
+            var_matrices.append(var_matrix)
+            costs.extend([placement_problem.cost_matrix[i][j] *
+                          var_matrix[i][j] for i in xrange(num_hosts)
+                          for j in xrange(num_instances)])
+            for (name, variables, coefficients, constant,
+                    operator) in placement_problem.rows:
+                operation = self._get_operation(operator)
+                prob += (operation(pulp.lpSum([coefficients[k] *
+                        var_matrix[i][j] for k, (i, j) in
+                        enumerate(variables)]), constant),
+                        "Request%s_%s" % (r, name))
+
+        if self.cost_classes:
+            prob += (pulp.lpSum(costs), "Sum_Costs")
+
+        for constraint_cls in self.constraint_classes:
+            if not issubclass(constraint_cls,
+                              constraints.BaseResourceConstraint):
+                continue
+            constraint_object = constraint_cls()
+            demands = [constraint_object.get_instance_demand(
+                                                        filter_properties)
+                       for filter_properties in filter_properties_list]
+            demanding = [r for r in xrange(len(demands)) if demands[r] > 0]
+            # NOTE: a single demanding request is already limited by its
+            # own rows.
+            if len(demanding) < 2:
+                continue
+            for i in xrange(num_hosts):
+                capacity = constraint_object.get_host_capacity(
+                                        hosts[i], filter_properties_list[0])
+                if capacity is None:
+                    continue
+                prob += (pulp.lpSum([demands[r] * (j + 1) *
+                        var_matrices[r][i][j] for r in demanding
+                        for j in xrange(placement_problems[r].num_instances)])
+                        <= max(capacity, 0),
+                        "Resource_%s_Host%s" % (constraint_cls.__name__, i))
+
+        if self._solve_problem(prob) != 'Optimal':
+            return [[] for filter_properties in filter_properties_list]
+
+        results = []
+        for r, filter_properties in enumerate(filter_properties_list):
+            host_counts = [0 for i in xrange(num_hosts)]
+            for i in xrange(num_hosts):
+                for j in xrange(placement_problems[r].num_instances):
+                    if var_matrices[r][i][j].varValue > 0.5:
+                        host_counts[i] = j + 1
+            results.append(self._get_host_instance_combinations(hosts,
+                    host_counts, self._get_instance_uuids(filter_properties)))
+        return results
@@ -0,0 +1,140 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Utility methods for scheduler solvers."""
+
+import collections
+import hashlib
+
+from nova.openstack.common import jsonutils
+
+# Instance properties which can affect where an instance is placed. The
+# other instance properties (uuid, display_name, ...) are per instance.
+_PLACEMENT_INSTANCE_PROPERTIES = ('project_id', 'availability_zone',
+                                  'os_type', 'architecture', 'image_ref',
+                                  'instance_type_id', 'root_gb',
+                                  'ephemeral_gb', 'memory_mb', 'vcpus')
+
+# Request properties which only describe the flavor of the instances.
+_FLAVOR_INSTANCE_PROPERTIES = ('instance_type_id', 'root_gb', 'ephemeral_gb',
+                               'memory_mb', 'vcpus')
+
+# Filter properties which either do not affect placement, are per
+# instance, or are already covered by the request spec.
+_IGNORED_FILTER_PROPERTIES = ('context', 'request_spec', 'config_options',
+                              'instance_uuids', 'num_instances', 'retry')
+
+
+class LRUCache(object):
+    """A bounded mapping which evicts the least recently used entries."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = collections.OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def peek(self, key, default=None):
+        """Return the value of key without marking it as used."""
+        return self._data.get(key, default)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def put(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+class CountingLRUCache(LRUCache):
+    """An LRUCache which counts the hits and misses of its lookups."""
+
+    def __init__(self, max_size):
+        super(CountingLRUCache, self).__init__(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self._data:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return super(CountingLRUCache, self).get(key, default)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return sorted((str(k), _normalize(v)) for k, v in value.iteritems())
+    if isinstance(value, (set, frozenset)):
+        return sorted(_normalize(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def get_request_signature(request_spec, filter_properties,
+                          ignore_flavor=False):
+    """Return a digest of the parts of a request which affect placement.
+
+    Requests with equal signatures only differ in the number and uuids of
+    their instances, so they can be placed by the same solve. With
+    ignore_flavor, the flavor is left out as well, so requests which only
+    differ in flavor have equal signatures.
+    """
+    instance_properties = request_spec.get('instance_properties') or {}
+    retry = filter_properties.get('retry') or {}
+    ignored_spec_keys = ('instance_properties', 'instance_uuids',
+                         'num_instances')
+    ignored_filter_keys = _IGNORED_FILTER_PROPERTIES
+    instance_keys = _PLACEMENT_INSTANCE_PROPERTIES
+    if ignore_flavor:
+        ignored_spec_keys += ('instance_type',)
+        ignored_filter_keys += ('instance_type',)
+        instance_keys = [k for k in instance_keys
+                         if k not in _FLAVOR_INSTANCE_PROPERTIES]
+    signature = {
+        'request_spec': dict((k, v) for k, v in request_spec.iteritems()
+                             if k not in ignored_spec_keys),
+        'instance_properties': dict(
+                (k, instance_properties.get(k)) for k in instance_keys),
+        'filter_properties': dict(
+                (k, v) for k, v in filter_properties.iteritems()
+                if k not in ignored_filter_keys),
+        'retry_hosts': retry.get('hosts') or []}
+    return hashlib.sha1(jsonutils.dumps(_normalize(signature))).hexdigest()
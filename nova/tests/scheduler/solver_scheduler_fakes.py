@@ -21,6 +21,7 @@ import mox
 from nova.compute import vm_states
 from nova import db
 from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
 from nova.scheduler import solver_scheduler_host_manager
 from nova.scheduler import solver_scheduler
 
@@ -263,3 +264,22 @@ def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
 
     db.compute_node_get_all(mox.IgnoreArg()).AndReturn(COMPUTE_NODES)
+
+
+class FakeAttestationService(object):
+    """Local stand-in for the OAT attestation server.
+
+    Answers PollHosts requests from a static host to trust level map and
+    records every bulk request it receives.
+    """
+
+    def __init__(self, trust_levels=None):
+        self.trust_levels = trust_levels or {}
+        self.requests = []
+
+    def do_attestation(self, hosts):
+        self.requests.append(sorted(hosts))
+        return [{'host_name': host,
+                 'trust_lvl': self.trust_levels[host],
+                 'vtime': timeutils.isotime()}
+                for host in hosts if host in self.trust_levels]
@@ -15,6 +15,7 @@
 
 import mock
 
+from nova import context
 from nova.scheduler import solvers
 from nova.scheduler.solvers.constraints import aggregate_instance_extra_specs
 from nova import test
@@ -27,6 +28,7 @@ class TestAggregateInstanceExtraSpecsConstraint(test.NoDBTestCase):
         super(TestAggregateInstanceExtraSpecsConstraint, self).setUp()
         self.constraint_cls = aggregate_instance_extra_specs.\
                                         AggregateInstanceExtraSpecsConstraint
+        self.context = context.RequestContext('fake', 'fake')
         self._generate_fake_constraint_input()
 
     def _generate_fake_constraint_input(self):
@@ -35,24 +37,27 @@ class TestAggregateInstanceExtraSpecsConstraint(test.NoDBTestCase):
                 ['h0i0', 'h0i1', 'h0i2'],
                 ['h1i0', 'h1i1', 'h1i2']]
         self.fake_filter_properties = {
+                'context': self.context,
                 'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
-                'num_instances': 3}
+                'num_instances': 3,
+                'instance_type': {'flavorid': 'fake_flavor',
+                        'extra_specs': {
+                                'aggregate_instance_extra_specs:opt1': 's== a',
+                                'trust:trusted_host': 'true'}}}
         host1 = fakes.FakeSolverSchedulerHostState('host1', 'node1', {})
         host2 = fakes.FakeSolverSchedulerHostState('host2', 'node1', {})
         self.fake_hosts = [host1, host2]
 
-    @mock.patch('nova.scheduler.solvers.constraints.'
-                'aggregate_instance_extra_specs.'
-                'AggregateInstanceExtraSpecsConstraint.host_filter_cls')
+    @mock.patch('nova.db.aggregate_host_get_by_metadata_key')
     def test_aggregate_instance_extra_specs_get_components(
-                                                    self, mock_filter_cls):
+                                                    self, mock_get_by_key):
         expected_cons_vars = [['h1i0'], ['h1i1'], ['h1i2']]
         expected_cons_coeffs = [[1], [1], [1]]
         expected_cons_consts = [0, 0, 0]
         expected_cons_ops = ['==', '==', '==']
 
-        mock_filter = mock_filter_cls.return_value
-        mock_filter.host_passes.side_effect = [True, False]
+        mock_get_by_key.return_value = {'host1': set(['a', 'b']),
+                                        'host2': set(['b'])}
         cons_vars, cons_coeffs, cons_consts, cons_ops = (
                 self.constraint_cls().get_components(self.fake_variables,
                 self.fake_hosts, self.fake_filter_properties))
@@ -61,3 +66,23 @@ class TestAggregateInstanceExtraSpecsConstraint(test.NoDBTestCase):
         self.assertEqual(expected_cons_coeffs, cons_coeffs)
         self.assertEqual(expected_cons_consts, cons_consts)
         self.assertEqual(expected_cons_ops, cons_ops)
+        mock_get_by_key.assert_called_once_with(mock.ANY, key='opt1')
+
+    @mock.patch('nova.db.aggregate_host_get_by_metadata_key')
+    def test_aggregate_instance_extra_specs_host_not_in_aggregate(
+                                                    self, mock_get_by_key):
+        mock_get_by_key.return_value = {'host1': set(['a'])}
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self.constraint_cls().get_components(self.fake_variables,
+                self.fake_hosts, self.fake_filter_properties))
+        self.assertEqual([['h1i0'], ['h1i1'], ['h1i2']], cons_vars)
+
+    @mock.patch('nova.db.aggregate_host_get_by_metadata_key')
+    def test_aggregate_instance_extra_specs_no_extra_specs(
+                                                    self, mock_get_by_key):
+        self.fake_filter_properties['instance_type'] = {}
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self.constraint_cls().get_components(self.fake_variables,
+                self.fake_hosts, self.fake_filter_properties))
+        self.assertEqual([], cons_vars)
+        self.assertFalse(mock_get_by_key.called)
@@ -48,18 +48,11 @@ class TestAggregateRamConstraint(test.NoDBTestCase):
                 {'free_ram_mb': 512, 'total_usable_ram_mb': 1024})
         self.fake_hosts = [host1, host2, host3]
 
-    @mock.patch('nova.db.aggregate_metadata_get_by_host')
+    @mock.patch('nova.db.aggregate_host_get_by_metadata_key')
     def test_aggregate_ram_get_components(self, agg_mock):
         self.flags(ram_allocation_ratio=1.0)
-
-        def _agg_mock_side_effect(*args, **kwargs):
-            if args[1] == 'host1':
-                return {'ram_allocation_ratio': set(['1.0', '2.0'])}
-            if args[1] == 'host2':
-                return {'ram_allocation_ratio': set(['3.0'])}
-            if args[1] == 'host3':
-                return {'ram_allocation_ratio': set()}
-        agg_mock.side_effect = _agg_mock_side_effect
+        agg_mock.return_value = {'host1': set(['1.0', '2.0']),
+                                 'host2': set(['3.0'])}
 
         expected_cons_vars = [
                 ['h0i0'], ['h0i1'], ['h2i0'], ['h2i1']]
@@ -73,3 +66,6 @@ class TestAggregateRamConstraint(test.NoDBTestCase):
         self.assertEqual(expected_cons_coeffs, cons_coeffs)
         self.assertEqual(expected_cons_consts, cons_consts)
         self.assertEqual(expected_cons_ops, cons_ops)
+        # the metadata of all hosts is looked up at once
+        agg_mock.assert_called_once_with(mock.ANY,
+                                         key='ram_allocation_ratio')
@@ -17,6 +17,7 @@ import mock
 
 from nova.scheduler import solvers
 from nova.scheduler.solvers.constraints import compute_capabilities_constraint
+from nova.scheduler.solvers import extra_specs_ops
 from nova import test
 from nova.tests.scheduler import solver_scheduler_fakes as fakes
 
@@ -27,32 +28,37 @@ class TestComputeCapabilitiesConstraint(test.NoDBTestCase):
         super(TestComputeCapabilitiesConstraint, self).setUp()
         self.constraint_cls = compute_capabilities_constraint.\
                                                 ComputeCapabilitiesConstraint
+        extra_specs_ops._compiled_extra_specs.clear()
         self._generate_fake_constraint_input()
 
     def _generate_fake_constraint_input(self):
         self.fake_variables = solvers.BaseVariables()
         self.fake_variables.host_instance_matrix = [
                 ['h0i0', 'h0i1', 'h0i2'],
-                ['h1i0', 'h1i1', 'h1i2']]
+                ['h1i0', 'h1i1', 'h1i2'],
+                ['h2i0', 'h2i1', 'h2i2']]
         self.fake_filter_properties = {
                 'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
-                'num_instances': 3}
-        host1 = fakes.FakeSolverSchedulerHostState('host1', 'node1', {})
-        host2 = fakes.FakeSolverSchedulerHostState('host2', 'node1', {})
-        self.fake_hosts = [host1, host2]
-
-    @mock.patch('nova.scheduler.solvers.constraints.'
-                'compute_capabilities_constraint.'
-                'ComputeCapabilitiesConstraint.host_filter_cls')
-    def test_compute_capabilities_constraint_get_components(
-                                                    self, mock_filter_cls):
+                'num_instances': 3,
+                'instance_type': {'flavorid': 'fake_flavor',
+                        'extra_specs': {
+                                'capabilities:free_ram_mb': '>= 1024',
+                                'capabilities:stats:opt1': '<or> a <or> b',
+                                'trust:trusted_host': 'true'}}}
+        host1 = fakes.FakeSolverSchedulerHostState('host1', 'node1',
+                {'free_ram_mb': 2048, 'stats': {'opt1': 'a'}})
+        host2 = fakes.FakeSolverSchedulerHostState('host2', 'node1',
+                {'free_ram_mb': 512, 'stats': {'opt1': 'a'}})
+        host3 = fakes.FakeSolverSchedulerHostState('host3', 'node1',
+                {'free_ram_mb': 2048, 'stats': {'opt1': 'a'}})
+        self.fake_hosts = [host1, host2, host3]
+
+    def test_compute_capabilities_constraint_get_components(self):
         expected_cons_vars = [['h1i0'], ['h1i1'], ['h1i2']]
         expected_cons_coeffs = [[1], [1], [1]]
         expected_cons_consts = [0, 0, 0]
         expected_cons_ops = ['==', '==', '==']
 
-        mock_filter = mock_filter_cls.return_value
-        mock_filter.host_passes.side_effect = [True, False]
         cons_vars, cons_coeffs, cons_consts, cons_ops = (
                 self.constraint_cls().get_components(self.fake_variables,
                 self.fake_hosts, self.fake_filter_properties))
@@ -61,3 +67,28 @@ class TestComputeCapabilitiesConstraint(test.NoDBTestCase):
         self.assertEqual(expected_cons_coeffs, cons_coeffs)
         self.assertEqual(expected_cons_consts, cons_consts)
         self.assertEqual(expected_cons_ops, cons_ops)
+
+    def test_compute_capabilities_constraint_missing_capability(self):
+        self.fake_hosts[2].stats = {}
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self.constraint_cls().get_components(self.fake_variables,
+                self.fake_hosts, self.fake_filter_properties))
+        self.assertEqual([['h1i0'], ['h1i1'], ['h1i2'],
+                          ['h2i0'], ['h2i1'], ['h2i2']], cons_vars)
+
+    def test_compute_capabilities_constraint_no_extra_specs(self):
+        self.fake_filter_properties['instance_type'] = {}
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self.constraint_cls().get_components(self.fake_variables,
+                self.fake_hosts, self.fake_filter_properties))
+        self.assertEqual([], cons_vars)
+
+    def test_compute_capabilities_constraint_shares_equal_digests(self):
+        constraint = self.constraint_cls()
+        with mock.patch('nova.scheduler.solvers.extra_specs_ops.'
+                        'compile_match') as mock_compile:
+            mock_compile.return_value.return_value = True
+            constraint.get_components(self.fake_variables,
+                    self.fake_hosts, self.fake_filter_properties)
+            # host1 and host3 have identical capabilities
+            self.assertEqual(4, mock_compile.return_value.call_count)
@@ -15,6 +15,8 @@
 
 import mock
 
+from nova.openstack.common import jsonutils
+from nova.scheduler.filters import json_filter
 from nova.scheduler import solvers
 from nova.scheduler.solvers.constraints import json_constraint
 from nova import test
@@ -26,6 +28,7 @@ class TestJsonConstraint(test.NoDBTestCase):
     def setUp(self):
         super(TestJsonConstraint, self).setUp()
         self.constraint_cls = json_constraint.JsonConstraint
+        json_constraint._compiled_queries.clear()
         self._generate_fake_constraint_input()
 
     def _generate_fake_constraint_input(self):
@@ -35,22 +38,23 @@ class TestJsonConstraint(test.NoDBTestCase):
                 ['h1i0', 'h1i1', 'h1i2']]
         self.fake_filter_properties = {
                 'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
-                'num_instances': 3}
-        host1 = fakes.FakeSolverSchedulerHostState('host1', 'node1', {})
-        host2 = fakes.FakeSolverSchedulerHostState('host2', 'node1', {})
+                'num_instances': 3,
+                'scheduler_hints': {'query': jsonutils.dumps(
+                        ['>=', '$free_ram_mb', 1024])}}
+        host1 = fakes.FakeSolverSchedulerHostState('host1', 'node1',
+                {'free_ram_mb': 2048, 'free_disk_mb': 200 * 1024,
+                 'capabilities': {'enabled': True, 'opt1': 'match'}})
+        host2 = fakes.FakeSolverSchedulerHostState('host2', 'node1',
+                {'free_ram_mb': 512, 'free_disk_mb': 100 * 1024,
+                 'capabilities': {'enabled': False, 'opt1': 'no-match'}})
         self.fake_hosts = [host1, host2]
 
-    @mock.patch('nova.scheduler.solvers.constraints.'
-                'json_constraint.JsonConstraint.'
-                'host_filter_cls')
-    def test_json_constraint_get_components(self, mock_filter_cls):
+    def test_json_constraint_get_components(self):
         expected_cons_vars = [['h1i0'], ['h1i1'], ['h1i2']]
         expected_cons_coeffs = [[1], [1], [1]]
         expected_cons_consts = [0, 0, 0]
         expected_cons_ops = ['==', '==', '==']
 
-        mock_filter = mock_filter_cls.return_value
-        mock_filter.host_passes.side_effect = [True, False]
         cons_vars, cons_coeffs, cons_consts, cons_ops = (
                 self.constraint_cls().get_components(self.fake_variables,
                 self.fake_hosts, self.fake_filter_properties))
@@ -59,3 +63,40 @@ class TestJsonConstraint(test.NoDBTestCase):
         self.assertEqual(expected_cons_coeffs, cons_coeffs)
         self.assertEqual(expected_cons_consts, cons_consts)
         self.assertEqual(expected_cons_ops, cons_ops)
+
+    def test_json_constraint_no_query(self):
+        self.fake_filter_properties['scheduler_hints'] = {}
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self.constraint_cls().get_components(self.fake_variables,
+                self.fake_hosts, self.fake_filter_properties))
+        self.assertEqual([], cons_vars)
+
+    def test_json_constraint_matches_json_filter(self):
+        queries = [
+                ['>=', '$free_ram_mb', 1024],
+                ['and', ['>=', '$free_ram_mb', 1024],
+                        ['>=', '$free_disk_mb', 200 * 1024]],
+                ['or', ['<', '$free_ram_mb', 1024],
+                       ['=', '$capabilities.opt1', 'match']],
+                ['not', '$capabilities.enabled'],
+                ['in', '$capabilities.opt1', 'match', 'other'],
+                ['=', '$capabilities.missing', 'value'],
+                ['>', 'literal', '']]
+        host_filter = json_filter.JsonFilter()
+        constraint = self.constraint_cls()
+        for query in queries:
+            query = jsonutils.dumps(query)
+            filter_properties = {'scheduler_hints': {'query': query}}
+            expected_mask = [host_filter.host_passes(host, filter_properties)
+                             for host in self.fake_hosts]
+            self.assertEqual(expected_mask, constraint._get_host_passes_mask(
+                                                    self.fake_hosts, query))
+
+    def test_json_constraint_query_compiled_once(self):
+        with mock.patch.object(json_constraint, '_compile_query',
+                wraps=json_constraint._compile_query) as compile_query:
+            self.constraint_cls().get_components(self.fake_variables,
+                    self.fake_hosts, self.fake_filter_properties)
+            self.constraint_cls().get_components(self.fake_variables,
+                    self.fake_hosts, self.fake_filter_properties)
+            self.assertEqual(1, compile_query.call_count)
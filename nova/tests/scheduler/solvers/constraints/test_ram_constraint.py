@@ -75,3 +75,14 @@ class TestRamConstraint(test.NoDBTestCase):
         self.assertEqual(1024 * 2.0, self.fake_hosts[0].limits['memory_mb'])
         self.assertEqual(2048 * 2.0, self.fake_hosts[1].limits['memory_mb'])
         self.assertEqual(512 * 2.0, self.fake_hosts[2].limits['memory_mb'])
+
+    def test_ram_constraint_instance_demand_and_host_capacity(self):
+        self.flags(ram_allocation_ratio=1.5)
+        constraint = self.constraint_cls()
+        self.assertEqual(1024, constraint.get_instance_demand(
+                                            self.fake_filter_properties))
+        self.assertEqual(0, constraint.get_instance_demand({}))
+        self.assertEqual([1024, 3072, 0],
+                         [constraint.get_host_capacity(host,
+                                            self.fake_filter_properties)
+                          for host in self.fake_hosts])
@@ -15,6 +15,7 @@
 
 import mock
 
+from nova.openstack.common import timeutils
 from nova.scheduler import solvers
 from nova.scheduler.solvers.constraints import trusted_hosts_constraint
 from nova import test
@@ -26,6 +27,14 @@ class TestTrustedHostsConstraint(test.NoDBTestCase):
     def setUp(self):
         super(TestTrustedHostsConstraint, self).setUp()
         self.constraint_cls = trusted_hosts_constraint.TrustedHostsConstraint
+        self.fake_attestation = fakes.FakeAttestationService(
+                {'node1': 'trusted', 'node2': 'untrusted'})
+        self.cache = trusted_hosts_constraint.AttestationCache(
+                attestservice=self.fake_attestation)
+        self.flags(attestation_cache_refresh_seconds=0,
+                   group='solver_scheduler')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
         self._generate_fake_constraint_input()
 
     def _generate_fake_constraint_input(self):
@@ -35,27 +44,85 @@ class TestTrustedHostsConstraint(test.NoDBTestCase):
                 ['h1i0', 'h1i1', 'h1i2']]
         self.fake_filter_properties = {
                 'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
-                'num_instances': 3}
+                'num_instances': 3,
+                'instance_type': {
+                        'extra_specs': {'trust:trusted_host': 'trusted'}}}
         host1 = fakes.FakeSolverSchedulerHostState('host1', 'node1', {})
-        host2 = fakes.FakeSolverSchedulerHostState('host2', 'node1', {})
+        host2 = fakes.FakeSolverSchedulerHostState('host2', 'node2', {})
         self.fake_hosts = [host1, host2]
 
-    @mock.patch('nova.scheduler.solvers.constraints.'
-                'trusted_hosts_constraint.TrustedHostsConstraint.'
-                'host_filter_cls')
-    def test_trusted_hosts_constraint_get_components(self, mock_filter_cls):
+    def _get_components(self):
+        constraint = self.constraint_cls()
+        with mock.patch.object(constraint, '_get_attestation_cache',
+                               return_value=self.cache):
+            return constraint.get_components(self.fake_variables,
+                    self.fake_hosts, self.fake_filter_properties)
+
+    def test_trusted_hosts_constraint_get_components(self):
         expected_cons_vars = [['h1i0'], ['h1i1'], ['h1i2']]
         expected_cons_coeffs = [[1], [1], [1]]
         expected_cons_consts = [0, 0, 0]
         expected_cons_ops = ['==', '==', '==']
 
-        mock_filter = mock_filter_cls.return_value
-        mock_filter.host_passes.side_effect = [True, False]
         cons_vars, cons_coeffs, cons_consts, cons_ops = (
-                self.constraint_cls().get_components(self.fake_variables,
-                self.fake_hosts, self.fake_filter_properties))
+                self._get_components())
 
         self.assertEqual(expected_cons_vars, cons_vars)
         self.assertEqual(expected_cons_coeffs, cons_coeffs)
         self.assertEqual(expected_cons_consts, cons_consts)
         self.assertEqual(expected_cons_ops, cons_ops)
+        self.assertEqual([['node1', 'node2']], self.fake_attestation.requests)
+
+    def test_trusted_hosts_constraint_attests_nodes(self):
+        # the service host of a node is not what the attestation service
+        # knows it by
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('node2', 'node1', {}),
+                fakes.FakeSolverSchedulerHostState('node1', 'node2', {})]
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self._get_components())
+        self.assertEqual([['h1i0'], ['h1i1'], ['h1i2']], cons_vars)
+        self.assertEqual([['node1', 'node2']], self.fake_attestation.requests)
+
+    def test_trusted_hosts_constraint_no_trust_requested(self):
+        self.fake_filter_properties['instance_type'] = {}
+        cons_vars, cons_coeffs, cons_consts, cons_ops = (
+                self._get_components())
+        self.assertEqual([], cons_vars)
+        self.assertEqual([], self.fake_attestation.requests)
+
+    def test_attestation_cache_hit(self):
+        self._get_components()
+        self._get_components()
+        self.assertEqual(1, len(self.fake_attestation.requests))
+
+    def test_attestation_cache_expiry(self):
+        self.flags(attestation_cache_ttl_seconds=60,
+                   group='solver_scheduler')
+        self._get_components()
+        timeutils.advance_time_seconds(61)
+        self._get_components()
+        self.assertEqual(2, len(self.fake_attestation.requests))
+
+    def test_attestation_cache_bulk_attests_uncached_hosts_only(self):
+        self.cache.get_trust_levels(['node1'])
+        levels = self.cache.get_trust_levels(['node1', 'node2', 'node3'])
+        self.assertEqual({'node1': 'trusted', 'node2': 'untrusted',
+                          'node3': 'unknown'}, levels)
+        self.assertEqual([['node1'], ['node2', 'node3']],
+                         self.fake_attestation.requests)
+
+    @mock.patch('eventlet.spawn_n')
+    def test_attestation_cache_background_refresh(self, mock_spawn):
+        self.flags(attestation_cache_ttl_seconds=60,
+                   attestation_cache_refresh_seconds=10,
+                   group='solver_scheduler')
+        self.cache.get_trust_levels(['node1', 'node2'])
+        self.assertFalse(mock_spawn.called)
+
+        timeutils.advance_time_seconds(55)
+        levels = self.cache.get_trust_levels(['node1', 'node2'])
+        self.assertEqual({'node1': 'trusted', 'node2': 'untrusted'}, levels)
+        mock_spawn.assert_called_once_with(self.cache._refresh,
+                                           ['node1', 'node2'])
+        self.assertEqual(1, len(self.fake_attestation.requests))
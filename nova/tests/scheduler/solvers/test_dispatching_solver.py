@@ -0,0 +1,131 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For Dispatching-Solver.
+"""
+
+import mock
+
+from nova.scheduler.solvers import dispatching_solver
+from nova.scheduler.solvers import portfolio_solver
+from nova.scheduler.solvers import problem
+from nova.scheduler.solvers import pulp_solver
+from nova import test
+from nova.tests.scheduler import solver_scheduler_fakes as fakes
+
+
+class DispatchingSolverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(DispatchingSolverTestCase, self).setUp()
+        self.solver = dispatching_solver.DispatchingSolver()
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host1', 'node1', {}),
+                fakes.FakeSolverSchedulerHostState('host2', 'node1', {})]
+        self.placement_problem = self._get_problem(2)
+        self.placement_problem.cost_matrix = [[1, 4], [2, 5]]
+        self.lp_patcher = mock.patch.object(pulp_solver.PulpSolver,
+                                            '_solve_placement_problem')
+        self.lp_solve = self.lp_patcher.start()
+        self.addCleanup(self.lp_patcher.stop)
+        self.lp_solve.return_value = [2, 0]
+
+    def _get_problem(self, num_instances):
+        placement_problem = problem.PlacementProblem(self.fake_hosts,
+                                                     num_instances)
+        variables = [(i, j) for i in xrange(2)
+                     for j in xrange(num_instances)]
+        placement_problem.add_row('count', variables,
+                                  [j + 1 for i, j in variables],
+                                  num_instances, '==')
+        if num_instances > 1:
+            for i in xrange(2):
+                placement_problem.add_row('host',
+                        [(i, j) for j in xrange(num_instances)],
+                        [1] * num_instances, 1, '<=')
+        return placement_problem
+
+    def _solve(self):
+        return self.solver._solve_placement_problem(self.fake_hosts,
+                {'num_instances': 2}, self.placement_problem)
+
+    def test_single_instance(self):
+        self.placement_problem = self._get_problem(1)
+        self.placement_problem.cost_matrix = [[2], [1]]
+        self.assertEqual([0, 1], self._solve())
+        self.assertEqual({'single_instance': 1}, self.solver.engine_counts)
+
+    def test_capacity_only(self):
+        self.assertEqual([1, 1], self._solve())
+        self.assertEqual({'min_cost_flow': 1}, self.solver.engine_counts)
+        self.assertFalse(self.lp_solve.called)
+
+    def test_separable(self):
+        # as with server group affinity, host1 can only run both instances
+        self.placement_problem.add_row('exclusion', [(0, 0)], [1], 0, '==')
+        self.assertEqual([2, 0], self._solve())
+        self.assertEqual({'pulp': 1}, self.solver.engine_counts)
+
+    def test_coupled(self):
+        self.placement_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1],
+                                       1, '<=')
+        self.assertEqual([2, 0], self._solve())
+        self.assertEqual({'pulp': 1}, self.solver.engine_counts)
+
+    def test_large(self):
+        self.flags(dispatching_solver_large_threshold=4,
+                   group='solver_scheduler')
+        self.placement_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1],
+                                       1, '<=')
+        self.assertEqual([2, 0], self._solve())
+        self.assertEqual({'pulp': 1}, self.solver.engine_counts)
+
+    @mock.patch.object(portfolio_solver.PortfolioSolver,
+                       '_solve_placement_problem')
+    def test_large_portfolio_override(self, portfolio_solve):
+        self.flags(dispatching_solver_large_threshold=4,
+                   dispatching_solver_engine_overrides={'large': 'portfolio'},
+                   group='solver_scheduler')
+        portfolio_solve.return_value = [0, 2]
+        self.placement_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1],
+                                       1, '<=')
+        self.assertEqual([0, 2], self._solve())
+        self.assertEqual({'portfolio': 1}, self.solver.engine_counts)
+        self.assertFalse(self.lp_solve.called)
+
+    def test_default_engines_exact(self):
+        # greedy and portfolio may return a costlier placement, so they are
+        # only used when configured
+        for problem_class, engine in (
+                dispatching_solver._DEFAULT_ENGINES.iteritems()):
+            self.assertNotIn(engine, ('greedy', 'portfolio'), problem_class)
+
+    def test_engine_override(self):
+        self.flags(dispatching_solver_engine_overrides={'coupled': 'greedy'},
+                   group='solver_scheduler')
+        self.placement_problem.add_row('coupling', [(0, 1), (1, 1)], [1, 1],
+                                       0, '<=')
+        self.assertEqual([1, 1], self._solve())
+        self.assertEqual({'greedy': 1}, self.solver.engine_counts)
+        self.assertFalse(self.lp_solve.called)
+
+    def test_engine_override_not_exact(self):
+        self.flags(dispatching_solver_engine_overrides={
+                        'coupled': 'min_cost_flow'},
+                   group='solver_scheduler')
+        self.placement_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1],
+                                       1, '<=')
+        self.assertEqual([2, 0], self._solve())
+        self.assertEqual({'pulp': 1}, self.solver.engine_counts)
@@ -0,0 +1,68 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests for precompiled extra_specs matchers.
+"""
+
+from nova.scheduler.filters import extra_specs_ops as filter_extra_specs_ops
+from nova.scheduler.solvers import extra_specs_ops
+from nova import test
+
+
+class ExtraSpecsOpsTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ExtraSpecsOpsTestCase, self).setUp()
+        extra_specs_ops._compiled_extra_specs.clear()
+
+    def test_compile_match_same_as_match(self):
+        cases = [
+                ('1', '1'), ('1', '2'), ('123', '= 123'), ('124', '= 123'),
+                ('12', '= 123'), ('1', '== 1'), ('1.0', '== 1'),
+                ('1', '!= 2'), ('4', '>= 3'), ('2', '<= 3'), ('5', '<= 3'),
+                ('abc', '<in> b'), ('abc', '<in> z'), ('12', 's== 12'),
+                ('12', 's!= 12'), ('1', 's< 2'), ('1', 's<= 1'),
+                ('3', 's> 2'), ('3', 's>= 4'), ('b', '<or> a <or> b'),
+                ('c', '<or> a <or> b'), ('a', '<or> a'), ('abc', '>= 1'),
+                ('1', '==')]
+        for value, req in cases:
+            self.assertEqual(filter_extra_specs_ops.match(value, req),
+                             extra_specs_ops.compile_match(req)(value),
+                             'value=%s req=%s' % (value, req))
+
+    def test_get_extra_specs_matchers_scope(self):
+        instance_type = {'flavorid': 'fake_flavor',
+                         'extra_specs': {'capabilities:opt1': 's== a',
+                                         'opt2': 's== b',
+                                         'trust:trusted_host': 'true'}}
+        matchers = extra_specs_ops.get_extra_specs_matchers(instance_type,
+                                                            'capabilities')
+        self.assertEqual([('opt1',), ('opt2',)],
+                         [scope for scope, matcher in matchers])
+
+    def test_get_extra_specs_matchers_cached(self):
+        instance_type = {'flavorid': 'fake_flavor',
+                         'extra_specs': {'opt1': 's== a'}}
+        first = extra_specs_ops.get_extra_specs_matchers(instance_type,
+                                                         'capabilities')
+        second = extra_specs_ops.get_extra_specs_matchers(
+                    dict(instance_type), 'capabilities')
+        self.assertIs(first, second)
+
+        instance_type['extra_specs'] = {'opt1': 's== b'}
+        third = extra_specs_ops.get_extra_specs_matchers(instance_type,
+                                                         'capabilities')
+        self.assertIsNot(first, third)
@@ -0,0 +1,89 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For Greedy-Solver.
+"""
+
+import mock
+
+from nova.scheduler import solver_scheduler_host_manager as host_manager
+from nova.scheduler.solvers.constraints import non_trivial_solution_constraint
+from nova.scheduler.solvers.constraints import valid_solution_constraint
+from nova.scheduler.solvers import costs
+from nova.scheduler.solvers import greedy_solver
+from nova.scheduler.solvers import problem
+from nova import test
+
+
+class FakeCostClass(costs.BaseLinearCost):
+    def _generate_components(self, variables, hosts, filter_properties):
+        num_hosts = len(hosts)
+        num_instances = filter_properties.get('num_instances')
+        var_matrix = variables.host_instance_matrix
+        self.variables = [var_matrix[i][j] for i in range(num_hosts)
+                                            for j in range(num_instances)]
+        self.coefficients = [(j + 1) * (i + 1) for i in range(num_hosts)
+                                               for j in range(num_instances)]
+
+
+class GreedySolverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(GreedySolverTestCase, self).setUp()
+        self.flags(scheduler_solver_solution_cache_size=0,
+                   scheduler_solver_infeasible_cache_seconds=0,
+                   group='solver_scheduler')
+        self.solver = greedy_solver.GreedySolver()
+        self.solver.cost_classes = [FakeCostClass]
+        self.solver.constraint_classes = [
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint]
+        self.fake_hosts = [host_manager.SolverSchedulerHostState(
+                'fake_host%s' % x, 'fake-node') for x in xrange(1, 4)]
+        self.filter_properties = {
+                'num_instances': 2,
+                'instance_uuids': ['fake_uuid_0', 'fake_uuid_1'],
+                'request_spec': {}}
+
+    def test_solve(self):
+        result = self.solver.solve(self.fake_hosts, self.filter_properties)
+        self.assertEqual([(self.fake_hosts[0], 'fake_uuid_0'),
+                          (self.fake_hosts[0], 'fake_uuid_1')], result)
+
+    def test_solve_with_alternates(self):
+        result, alternates = self.solver.solve_with_alternates(
+                self.fake_hosts, self.filter_properties, 1)
+        self.assertEqual([(self.fake_hosts[0], 'fake_uuid_0'),
+                          (self.fake_hosts[0], 'fake_uuid_1')], result)
+        self.assertEqual([self.fake_hosts[1]], alternates)
+
+    def test_solve_no_placement(self):
+        with mock.patch.object(problem.PlacementProblem,
+                               'get_greedy_solution') as get_greedy_solution:
+            get_greedy_solution.return_value = None
+            self.assertEqual([], self.solver.solve(self.fake_hosts,
+                                                   self.filter_properties))
+
+    def test_solve_local_search(self):
+        self.flags(greedy_solver_local_search_ms=100,
+                   group='solver_scheduler')
+        with mock.patch.object(problem.PlacementProblem,
+                               'improve_solution') as improve_solution:
+            improve_solution.return_value = [0, 2, 0]
+            result = self.solver.solve(self.fake_hosts,
+                                       self.filter_properties)
+            improve_solution.assert_called_once_with([2, 0, 0], 0.1)
+        self.assertEqual([(self.fake_hosts[1], 'fake_uuid_0'),
+                          (self.fake_hosts[1], 'fake_uuid_1')], result)
@@ -0,0 +1,144 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For Hierarchical-Solver.
+"""
+
+import contextlib
+
+import eventlet
+import mock
+
+from nova import context
+from nova.scheduler.solvers import hierarchical_solver
+from nova.scheduler.solvers import partition_solver
+from nova.scheduler.solvers import problem
+from nova.scheduler.solvers import pulp_solver
+from nova import test
+from nova.tests.scheduler import solver_scheduler_fakes as fakes
+
+
+class HierarchicalSolverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(HierarchicalSolverTestCase, self).setUp()
+        self.flags(hierarchical_solver_min_hosts=1, group='solver_scheduler')
+        self.solver = hierarchical_solver.HierarchicalSolver()
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host%s' % i, 'node1', {})
+                for i in xrange(5)]
+        self.filter_properties = {
+                'num_instances': 2,
+                'context': context.RequestContext('fake', 'fake')}
+        self.placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        variables = [(i, j) for i in xrange(5) for j in xrange(2)]
+        self.placement_problem.add_row('count', variables,
+                                       [j + 1 for i, j in variables], 2, '==')
+        for i in xrange(5):
+            self.placement_problem.add_row('host', [(i, 0), (i, 1)], [1, 1],
+                                           1, '<=')
+        self.placement_problem.cost_matrix = [[1, 10], [2, 10], [1.5, 2.6],
+                                              [5, 6], [0, 0]]
+        # host4 cannot run any instance
+        self.placement_problem.add_row('exclusion', [(4, 0)], [1], 0, '==')
+        self.placement_problem.add_row('exclusion', [(4, 1)], [1], 0, '==')
+
+        self.metadata_patcher = mock.patch(
+                'nova.db.aggregate_host_get_by_metadata_key')
+        get_metadata = self.metadata_patcher.start()
+        self.addCleanup(self.metadata_patcher.stop)
+        get_metadata.return_value = {'host0': set(['az1']),
+                                     'host1': set(['az1']),
+                                     'host2': set(['az2']),
+                                     'host3': set(['az2'])}
+
+        def fake_lp_solve(hosts, filter_properties, placement_problem):
+            return placement_problem.get_greedy_solution()
+
+        self.lp_patcher = mock.patch.object(pulp_solver.PulpSolver,
+                                            '_solve_placement_problem')
+        self.lp_solve = self.lp_patcher.start()
+        self.addCleanup(self.lp_patcher.stop)
+        self.lp_solve.side_effect = fake_lp_solve
+
+        self.flat_patcher = mock.patch.object(
+                partition_solver.PartitionSolver, '_solve_placement_problem')
+        self.flat_solve = self.flat_patcher.start()
+        self.addCleanup(self.flat_patcher.stop)
+        self.flat_solve.return_value = [2, 0, 0, 0, 0]
+
+    def _solve(self):
+        return self.solver._solve_placement_problem(self.fake_hosts,
+                self.filter_properties, self.placement_problem)
+
+    def test_solve_groups(self):
+        # the coarse problem puts one instance in each group
+        self.assertEqual([1, 0, 1, 0, 0], self._solve())
+        self.assertEqual([['host0', 'host1'], ['host2', 'host3']],
+                         [[host.host for host in args[0]]
+                          for args, kwargs in self.lp_solve.call_args_list])
+        self.assertFalse(self.flat_solve.called)
+
+    def test_solve_small_problem_flat(self):
+        self.flags(hierarchical_solver_min_hosts=10, group='solver_scheduler')
+        self.assertEqual([2, 0, 0, 0, 0], self._solve())
+        self.assertFalse(self.lp_solve.called)
+
+    def test_solve_coupled_groups_flat(self):
+        self.placement_problem.add_row('coupling', [(0, 0), (2, 0)], [1, 1],
+                                       1, '<=')
+        self.assertEqual([2, 0, 0, 0, 0], self._solve())
+        self.assertFalse(self.lp_solve.called)
+
+    def test_solve_infeasible_group_flat(self):
+        self.lp_solve.side_effect = None
+        self.lp_solve.return_value = None
+        self.assertEqual([2, 0, 0, 0, 0], self._solve())
+        self.assertTrue(self.flat_solve.called)
+
+    def test_optimality_loss(self):
+        self.flags(hierarchical_solver_flat_check_ratio=1.0,
+                   group='solver_scheduler')
+        self.flat_solve.return_value = [1, 0, 1, 0, 0]
+        with mock.patch.object(hierarchical_solver.LOG, 'info') as log_info:
+            self.assertEqual([1, 0, 1, 0, 0], self._solve())
+            # the flat problem is solved once the request is placed
+            self.assertFalse(self.flat_solve.called)
+            eventlet.sleep(0)
+            self.assertTrue(self.flat_solve.called)
+            self.assertEqual(0, log_info.call_args[0][1]['loss'])
+
+    def test_optimality_loss_flat_too_slow(self):
+        self.flags(hierarchical_solver_flat_check_ratio=1.0,
+                   hierarchical_solver_flat_check_seconds=1,
+                   group='solver_scheduler')
+        real_timeout = eventlet.Timeout
+
+        def fake_flat_solve(*args):
+            eventlet.sleep(0.2)
+            return [1, 0, 1, 0, 0]
+
+        self.flat_solve.side_effect = fake_flat_solve
+        with contextlib.nested(
+                mock.patch.object(hierarchical_solver.timeout, 'Timeout',
+                                  side_effect=lambda seconds, exception:
+                                  real_timeout(0.01, exception)),
+                mock.patch.object(hierarchical_solver.LOG, 'info')) as (
+                fake_timeout, log_info):
+            self.assertEqual([1, 0, 1, 0, 0], self._solve())
+            eventlet.sleep(0.3)
+            fake_timeout.assert_called_once_with(1, False)
+            # the flat solve is given up, so no loss is logged
+            self.assertFalse(log_info.called)
@@ -0,0 +1,97 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For Min-Cost-Flow-Solver.
+"""
+
+import mock
+
+from nova.scheduler.solvers.constraints import non_trivial_solution_constraint
+from nova.scheduler.solvers.constraints import valid_solution_constraint
+from nova.scheduler.solvers.costs import ram_cost
+from nova.scheduler.solvers import min_cost_flow_solver
+from nova.scheduler.solvers import problem
+from nova.scheduler.solvers import pulp_solver
+from nova import test
+from nova.tests.scheduler import solver_scheduler_fakes as fakes
+
+
+class MinCostFlowSolverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(MinCostFlowSolverTestCase, self).setUp()
+        self.solver = min_cost_flow_solver.MinCostFlowSolver()
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host1', 'node1', {}),
+                fakes.FakeSolverSchedulerHostState('host2', 'node1', {})]
+        self.placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        self.placement_problem.cost_matrix = [[1, 4], [2, 5]]
+        self.lp_patcher = mock.patch.object(pulp_solver.PulpSolver,
+                                            '_solve_placement_problem')
+        self.lp_solve = self.lp_patcher.start()
+        self.addCleanup(self.lp_patcher.stop)
+
+    def _solve(self):
+        return self.solver._solve_placement_problem(self.fake_hosts,
+                {'num_instances': 2}, self.placement_problem)
+
+    @mock.patch.object(problem.PlacementProblem, 'is_flow_representable',
+                       new_callable=mock.PropertyMock)
+    def test_solve_as_flow(self, is_flow_representable):
+        is_flow_representable.return_value = True
+        self.assertEqual([1, 1], self._solve())
+        self.assertFalse(self.lp_solve.called)
+
+    @mock.patch.object(problem.PlacementProblem, 'is_flow_representable',
+                       new_callable=mock.PropertyMock)
+    def test_solve_with_lp(self, is_flow_representable):
+        is_flow_representable.return_value = False
+        self.lp_solve.return_value = [2, 0]
+        self.assertEqual([2, 0], self._solve())
+        self.lp_solve.assert_called_once_with(self.fake_hosts,
+                {'num_instances': 2}, self.placement_problem)
+
+    def _solve_with_ram_cost(self, free_ram_mbs):
+        self.solver.cost_classes = [ram_cost.RamCost]
+        self.solver.constraint_classes = [
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint]
+        hosts = [fakes.FakeSolverSchedulerHostState('host%s' % i, 'node1',
+                                                    {'free_ram_mb': ram})
+                 for i, ram in enumerate(free_ram_mbs)]
+        filter_properties = {'num_instances': 2,
+                             'instance_type': {'memory_mb': 1024}}
+        placement_problem = self.solver._get_placement_problem(
+                                                hosts, filter_properties)
+        return self.solver._solve_placement_problem(hosts,
+                filter_properties, placement_problem)
+
+    def test_ram_cost_spread_alike_hosts_as_flow(self):
+        # the squared RAM costs of hosts with the same free RAM are convex
+        self.assertEqual([1, 1], self._solve_with_ram_cost([2048, 2048]))
+        self.assertFalse(self.lp_solve.called)
+
+    def test_ram_cost_spread_unlike_hosts_with_lp(self):
+        # the first instance on the host with less free RAM costs more
+        # than the second one once the costs are squared
+        self.lp_solve.return_value = [2, 0]
+        self.assertEqual([2, 0], self._solve_with_ram_cost([8192, 1024]))
+        self.assertTrue(self.lp_solve.called)
+
+    def test_ram_cost_stack_with_lp(self):
+        self.flags(ram_cost_multiplier=-1.0, group='solver_scheduler')
+        self.lp_solve.return_value = [2, 0]
+        self.assertEqual([2, 0], self._solve_with_ram_cost([2048, 2048]))
+        self.assertTrue(self.lp_solve.called)
@@ -0,0 +1,128 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For Partition-Solver.
+"""
+
+import mock
+
+from nova.scheduler.solvers import partition_solver
+from nova.scheduler.solvers import problem
+from nova.scheduler.solvers import pulp_solver
+from nova import test
+from nova.tests.scheduler import solver_scheduler_fakes as fakes
+
+
+class PartitionSolverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(PartitionSolverTestCase, self).setUp()
+        self.solver = partition_solver.PartitionSolver()
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host%s' % i, 'node1', {})
+                for i in xrange(5)]
+        self.filter_properties = {'num_instances': 2}
+        self.placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        variables = [(i, j) for i in xrange(5) for j in xrange(2)]
+        self.placement_problem.add_row('count', variables,
+                                       [j + 1 for i, j in variables], 2, '==')
+        for i in xrange(5):
+            self.placement_problem.add_row('host', [(i, 0), (i, 1)], [1, 1],
+                                           1, '<=')
+        self.placement_problem.cost_matrix = [[1, 10], [2, 10], [1.5, 2.6],
+                                              [5, 6], [0, 0]]
+        # as with an availability zone, host4 cannot run any instance
+        self.placement_problem.add_row('exclusion', [(4, 0)], [1], 0, '==')
+        self.placement_problem.add_row('exclusion', [(4, 1)], [1], 0, '==')
+
+        def fake_lp_solve(hosts, filter_properties, placement_problem):
+            return placement_problem.get_greedy_solution()
+
+        self.lp_patcher = mock.patch.object(pulp_solver.PulpSolver,
+                                            '_solve_placement_problem')
+        self.lp_solve = self.lp_patcher.start()
+        self.addCleanup(self.lp_patcher.stop)
+        self.lp_solve.side_effect = fake_lp_solve
+
+    def _solve(self):
+        return self.solver._solve_placement_problem(self.fake_hosts,
+                self.filter_properties, self.placement_problem)
+
+    def _get_solved_hosts(self):
+        return [([host.host for host in args[0]], args[1]['num_instances'])
+                for args, kwargs in self.lp_solve.call_args_list]
+
+    def test_solve_eligible_hosts(self):
+        self.assertEqual([1, 0, 1, 0, 0], self._solve())
+        self.assertEqual([(['host0', 'host1', 'host2', 'host3'], 2)],
+                         self._get_solved_hosts())
+
+    def test_solve_partitions(self):
+        # host0 and host1 may not run two instances, and at most one of
+        # host2 and host3 may run one
+        self.placement_problem.add_row('coupling_a', [(0, 1), (1, 1)],
+                                       [1, 1], 0, '<=')
+        self.placement_problem.add_row('coupling_b', [(2, 0), (3, 0)],
+                                       [1, 1], 1, '<=')
+        self.assertEqual([1, 0, 1, 0, 0], self._solve())
+        # two instances on host0 and host1 are bound to cost more than the
+        # placement found, and are never solved
+        self.assertEqual([(['host0', 'host1'], 1), (['host2', 'host3'], 1),
+                          (['host2', 'host3'], 2)],
+                         self._get_solved_hosts())
+
+    def test_solve_partitions_bounded(self):
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host%s' % i, 'node1', {})
+                for i in xrange(8)]
+        self.filter_properties = {'num_instances': 4}
+        self.placement_problem = problem.PlacementProblem(self.fake_hosts, 4)
+        variables = [(i, j) for i in xrange(8) for j in xrange(4)]
+        self.placement_problem.add_row('count', variables,
+                                       [j + 1 for i, j in variables], 4, '==')
+        for i in xrange(8):
+            self.placement_problem.add_row('host',
+                    [(i, j) for j in xrange(4)], [1] * 4, 1, '<=')
+        self.placement_problem.cost_matrix = [
+                [(j + 1) * (i + 1) for j in xrange(4)] for i in xrange(8)]
+        # as with aggregate limits, four pairs of hosts are coupled
+        for c in xrange(4):
+            self.placement_problem.add_row('coupling_%s' % c,
+                    [(i, j) for i in (2 * c, 2 * c + 1) for j in xrange(4)],
+                    [1] * 8, 2, '<=')
+        self.assertEqual([4, 0, 0, 0, 0, 0, 0, 0], self._solve())
+        # rather than each of the 5 numbers of instances on 4 partitions
+        self.assertEqual([(['host0', 'host1'], 4)], self._get_solved_hosts())
+
+    def test_solve_too_many_partitions(self):
+        self.flags(partition_solver_max_partitions=1,
+                   group='solver_scheduler')
+        self.placement_problem.add_row('coupling_a', [(0, 1), (1, 1)],
+                                       [1, 1], 0, '<=')
+        self.placement_problem.add_row('coupling_b', [(2, 0), (3, 0)],
+                                       [1, 1], 1, '<=')
+        self.assertEqual([1, 0, 1, 0, 0], self._solve())
+        self.assertEqual([(['host0', 'host1', 'host2', 'host3'], 2)],
+                         self._get_solved_hosts())
+
+    def test_solve_partitions_infeasible(self):
+        self.placement_problem.add_row('coupling_a', [(0, 1), (1, 1)],
+                                       [1, 1], 0, '<=')
+        self.placement_problem.add_row('coupling_b', [(2, 0), (3, 0)],
+                                       [1, 1], 1, '<=')
+        # a row on a host which cannot run an instance is in no partition
+        self.placement_problem.add_row('coupling_c', [(4, 0)], [1], 1,
+                                       '>=')
+        self.assertIsNone(self._solve())
@@ -0,0 +1,93 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For Portfolio-Solver.
+"""
+
+import eventlet
+import mock
+
+from nova.scheduler.solvers import portfolio_solver
+from nova.scheduler.solvers import problem
+from nova.scheduler.solvers import pulp_solver
+from nova import solver_scheduler_exception as exception
+from nova import test
+from nova.tests.scheduler import solver_scheduler_fakes as fakes
+
+
+class PortfolioSolverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(PortfolioSolverTestCase, self).setUp()
+        self.flags(portfolio_solver_deadline_ms=10, group='solver_scheduler')
+        self.solver = portfolio_solver.PortfolioSolver()
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host1', 'node1', {}),
+                fakes.FakeSolverSchedulerHostState('host2', 'node1', {})]
+        self.placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        self.placement_problem.cost_matrix = [[1, 4], [2, 5]]
+        # the greedy placement is [1, 1] of cost 3
+        self.lp_patcher = mock.patch.object(pulp_solver.PulpSolver,
+                                            '_solve_placement_problem')
+        self.lp_solve = self.lp_patcher.start()
+        self.addCleanup(self.lp_patcher.stop)
+
+    def _solve(self):
+        return self.solver._solve_placement_problem(self.fake_hosts,
+                {'num_instances': 2}, self.placement_problem)
+
+    def test_lp_solution_of_lower_cost(self):
+        # the greedy placement is [2, 0] of cost 2
+        self.placement_problem.cost_matrix = [[1, 2], [1.5, 1.6]]
+        self.lp_solve.return_value = [0, 2]
+        self.assertEqual([0, 2], self._solve())
+
+    def test_greedy_solution_of_lower_cost(self):
+        self.lp_solve.return_value = [0, 2]
+        self.assertEqual([1, 1], self._solve())
+
+    def test_lp_solver_too_slow(self):
+        lp_finished = []
+
+        def fake_lp_solve(*args):
+            eventlet.sleep(0.05)
+            lp_finished.append(True)
+            return [2, 0]
+
+        self.lp_solve.side_effect = fake_lp_solve
+        self.assertEqual([1, 1], self._solve())
+        # the LP solver is killed rather than left to finish
+        eventlet.sleep(0.1)
+        self.assertEqual([], lp_finished)
+
+    def test_lp_solver_failed(self):
+        self.lp_solve.side_effect = exception.SolverFailed(reason='')
+        self.assertEqual([1, 1], self._solve())
+
+    def test_no_greedy_solution(self):
+        with mock.patch.object(self.placement_problem,
+                               'get_greedy_solution') as get_greedy_solution:
+            get_greedy_solution.return_value = None
+
+            def fake_lp_solve(*args):
+                eventlet.sleep(0.05)
+                return [2, 0]
+
+            # the LP solution is waited for past the deadline
+            self.lp_solve.side_effect = fake_lp_solve
+            self.assertEqual([2, 0], self._solve())
+
+            self.lp_solve.side_effect = exception.SolverFailed(reason='')
+            self.assertRaises(exception.SolverFailed, self._solve)
@@ -0,0 +1,331 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests For the placement problem of scheduler solvers.
+"""
+
+from nova.scheduler import solvers
+from nova.scheduler.solvers.constraints import non_trivial_solution_constraint
+from nova.scheduler.solvers.constraints import valid_solution_constraint
+from nova.scheduler.solvers import problem
+from nova import test
+from nova.tests.scheduler import solver_scheduler_fakes as fakes
+
+
+class PlacementProblemTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(PlacementProblemTestCase, self).setUp()
+        self.fake_hosts = [
+                fakes.FakeSolverSchedulerHostState('host3', 'node1', {}),
+                fakes.FakeSolverSchedulerHostState('host1', 'node1', {}),
+                fakes.FakeSolverSchedulerHostState('host2', 'node1', {})]
+        self.fake_filter_properties = {'num_instances': 2}
+        self.variables = solvers.IndexVariables()
+        self.variables.populate_variables(3, 2)
+
+    def _get_problem(self, constraint_classes):
+        placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        for constraint_cls in constraint_classes:
+            vars_list, coeffs_list, consts_list, ops_list = (
+                    constraint_cls().get_components(self.variables,
+                    self.fake_hosts, self.fake_filter_properties))
+            for i in xrange(len(ops_list)):
+                placement_problem.add_row('row%s' % i, vars_list[i],
+                        coeffs_list[i], consts_list[i], ops_list[i])
+        return placement_problem
+
+    def test_index_variables(self):
+        self.assertEqual([[(0, 0), (0, 1)], [(1, 0), (1, 1)],
+                          [(2, 0), (2, 1)]],
+                         self.variables.host_instance_matrix)
+
+    def test_add_row_classification(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.add_row('exclusion', [(1, 1)], [1], 0, '==')
+
+        self.assertEqual([[True, True], [True, False], [True, True]],
+                         placement_problem.allowed)
+        self.assertEqual(set([0, 1, 2]), placement_problem.host_rows)
+        self.assertTrue(placement_problem.has_count_row)
+        self.assertEqual([], placement_problem.coupling_rows)
+        self.assertTrue(placement_problem.is_separable)
+        self.assertEqual(5, len(placement_problem.rows))
+        self.assertEqual(4, len(placement_problem.structural_rows))
+
+    def test_coupling_row_not_separable(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1], 1,
+                                  '<=')
+        self.assertFalse(placement_problem.is_separable)
+
+    def test_missing_host_rows_not_separable(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint])
+        self.assertFalse(placement_problem.is_separable)
+
+    def test_get_host_classes(self):
+        placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [1, 2]]
+        self.assertEqual([[2, 0], [1]], placement_problem.get_host_classes())
+
+        placement_problem.allowed[0][1] = False
+        self.assertEqual([[0], [1], [2]],
+                         placement_problem.get_host_classes())
+
+    def test_expand_host_classes(self):
+        placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        host_classes = [[2, 0], [1]]
+        class_counts = [[1, 1], [0, 0]]
+        self.assertEqual([1, 0, 2], placement_problem.expand_host_classes(
+                                            host_classes, class_counts))
+
+    def test_get_alternate_hosts(self):
+        placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        placement_problem.cost_matrix = [[1, 2], [1, 2], [0, 2]]
+        # host2 is chosen, host3 and host1 tie on cost
+        self.assertEqual([1, 0], placement_problem.get_alternate_hosts(
+                                                            [0, 0, 2], 3))
+        self.assertEqual([1], placement_problem.get_alternate_hosts(
+                                                            [0, 0, 2], 1))
+
+        placement_problem.allowed[1][0] = False
+        self.assertEqual([0], placement_problem.get_alternate_hosts(
+                                                            [0, 0, 2], 3))
+
+    def test_get_cost_and_is_feasible(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [5, 6]]
+        placement_problem.add_row('exclusion', [(1, 1)], [1], 0, '==')
+
+        self.assertEqual(7, placement_problem.get_cost([2, 0, 1]))
+        self.assertTrue(placement_problem.is_feasible([2, 0, 0]))
+        self.assertTrue(placement_problem.is_feasible([1, 1, 0]))
+        # too few instances, and an excluded instance count
+        self.assertFalse(placement_problem.is_feasible([1, 0, 0]))
+        self.assertFalse(placement_problem.is_feasible([0, 2, 0]))
+
+    def test_add_rows_from(self):
+        block = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        block.add_row('exclusion', [(1, 1)], [1], 0, '==')
+        block.add_row('coupling', [(0, 0), (1, 0)], [1, 1], 1, '<=')
+
+        placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        placement_problem.add_rows_from(block)
+        self.assertEqual(block.rows, placement_problem.rows)
+        self.assertEqual(block.allowed, placement_problem.allowed)
+        self.assertEqual(block.host_rows, placement_problem.host_rows)
+        self.assertTrue(placement_problem.has_count_row)
+        self.assertEqual(4, len(placement_problem.structural_rows))
+        self.assertEqual(1, len(placement_problem.coupling_rows))
+
+    def test_get_greedy_solution(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [5, 6]]
+        self.assertEqual([2, 0, 0], placement_problem.get_greedy_solution())
+
+        # the second instance costs more on the first host than elsewhere
+        placement_problem.cost_matrix = [[1, 4], [2, 5], [5, 6]]
+        self.assertEqual([1, 1, 0], placement_problem.get_greedy_solution())
+
+    def test_get_greedy_solution_jumps_to_allowed_counts(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 2], [1, 1], [1, 3]]
+        # as with server group affinity, all instances go to one host
+        for i in xrange(3):
+            placement_problem.add_row('exclusion', [(i, 0)], [1], 0, '==')
+        self.assertEqual([0, 2, 0], placement_problem.get_greedy_solution())
+
+        placement_problem.add_row('exclusion', [(1, 1)], [1], 0, '==')
+        placement_problem.add_row('exclusion', [(0, 1)], [1], 0, '==')
+        placement_problem.add_row('exclusion', [(2, 1)], [1], 0, '==')
+        self.assertIsNone(placement_problem.get_greedy_solution())
+
+    def test_get_greedy_solution_checks_coupling_rows(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [5, 6]]
+        placement_problem.add_row('coupling', [(0, 1), (1, 1)], [1, 1], 0,
+                                  '<=')
+        self.assertIsNone(placement_problem.get_greedy_solution())
+
+    def test_round_solution(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [5, 6]]
+        self.assertEqual([0, 2, 0], placement_problem.round_solution(
+                [[0, 0], [0, 1], [0, 0]]))
+        # fractional counts are rounded down, and the rest placed greedily
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [5, 7]]
+        self.assertEqual([1, 0, 1], placement_problem.round_solution(
+                [[0.5, 0], [0, 0], [0.5, 0.25]]))
+
+        # rounded counts which are not allowed are lowered
+        placement_problem.add_row('exclusion', [(1, 1)], [1], 0, '==')
+        self.assertEqual([1, 1, 0], placement_problem.round_solution(
+                [[0, 0], [0, 1], [0, 0]]))
+
+    def test_improve_solution(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        # the greedy placement is [2, 0, 0] of cost 2
+        placement_problem.cost_matrix = [[1, 2], [1.5, 1.6], [5, 6]]
+        host_counts = placement_problem.get_greedy_solution()
+        self.assertEqual([2, 0, 0], host_counts)
+        self.assertEqual([0, 2, 0], placement_problem.improve_solution(
+                                                        host_counts, 10))
+        # the placement is kept as it is without time
+        self.assertEqual([2, 0, 0], placement_problem.improve_solution(
+                                                        host_counts, 0))
+
+    def test_improve_solution_keeps_coupling_rows(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 3], [1.2, 1.0], [0.1, 5]]
+        self.assertEqual([0, 2, 0], placement_problem.improve_solution(
+                                                        [1, 1, 0], 10))
+
+        # host1 may not run both instances
+        placement_problem.add_row('coupling', [(1, 1), (2, 1)], [1, 1], 0,
+                                  '<=')
+        self.assertEqual([1, 0, 1], placement_problem.improve_solution(
+                                                        [1, 1, 0], 10))
+
+    def test_is_flow_representable(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 3], [2, 4], [5, 10]]
+        self.assertTrue(placement_problem.is_flow_representable)
+
+        # the second instance costs less on host1 than the first one
+        placement_problem.cost_matrix = [[1, 1.5], [2, 4], [5, 10]]
+        self.assertFalse(placement_problem.is_flow_representable)
+
+    def test_is_flow_representable_with_exclusions(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        # as with resource constraints, host3 can run one instance
+        placement_problem.add_row('exclusion', [(0, 1)], [1], 0, '==')
+        self.assertTrue(placement_problem.is_flow_representable)
+
+        # as with server group affinity, host1 can only run both instances
+        placement_problem.add_row('exclusion', [(1, 0)], [1], 0, '==')
+        self.assertFalse(placement_problem.is_flow_representable)
+
+    def test_coupling_row_not_flow_representable(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1], 1,
+                                  '<=')
+        self.assertFalse(placement_problem.is_flow_representable)
+
+    def test_get_flow_solution(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        # the second instance costs as much on host3 as the first one on
+        # host1, and host1 is preferred
+        placement_problem.cost_matrix = [[1, 3], [2, 4], [5, 10]]
+        self.assertEqual([1, 1, 0], placement_problem.get_flow_solution())
+
+        placement_problem.add_row('exclusion', [(0, 0)], [1], 0, '==')
+        placement_problem.add_row('exclusion', [(0, 1)], [1], 0, '==')
+        placement_problem.add_row('exclusion', [(1, 1)], [1], 0, '==')
+        self.assertEqual([0, 1, 1], placement_problem.get_flow_solution())
+
+        placement_problem.add_row('exclusion', [(2, 0)], [1], 0, '==')
+        placement_problem.add_row('exclusion', [(2, 1)], [1], 0, '==')
+        self.assertIsNone(placement_problem.get_flow_solution())
+
+    def test_get_partitions(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        self.assertEqual([[0, 1, 2]], placement_problem.get_partitions())
+
+        placement_problem.add_row('coupling', [(0, 1), (2, 1)], [1, 1], 0,
+                                  '<=')
+        self.assertEqual([[0, 2], [1]], placement_problem.get_partitions())
+
+        # as with an availability zone, host3 cannot run any instance
+        placement_problem.add_row('exclusion', [(0, 0)], [1], 0, '==')
+        placement_problem.add_row('exclusion', [(0, 1)], [1], 0, '==')
+        self.assertEqual([[1], [2]], placement_problem.get_partitions())
+
+    def test_can_leave_empty(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.add_row('coupling', [(0, 0), (2, 0)], [1, 1], 1,
+                                  '>=')
+        self.assertTrue(placement_problem.can_leave_empty([1]))
+        self.assertFalse(placement_problem.can_leave_empty([0, 2]))
+
+    def test_get_subproblem(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 2], [3, 4], [5, 6]]
+        placement_problem.add_row('exclusion', [(2, 0)], [1], 0, '==')
+        placement_problem.add_row('coupling', [(0, 0), (2, 1)], [1, 1], 1,
+                                  '<=')
+
+        subproblem = placement_problem.get_subproblem([2, 0], 2)
+        self.assertEqual([self.fake_hosts[2], self.fake_hosts[0]],
+                         subproblem.hosts)
+        self.assertEqual([[5, 6], [1, 2]], subproblem.cost_matrix)
+        self.assertEqual([[False, True], [True, True]], subproblem.allowed)
+        self.assertTrue(subproblem.has_structural_rows)
+        self.assertEqual([('coupling', [(1, 0), (0, 1)], [1, 1], 1, '<=')],
+                         subproblem.coupling_rows)
+
+        # terms for more instances than the subproblem places are dropped
+        subproblem = placement_problem.get_subproblem([0, 2], 1)
+        self.assertEqual([[1], [5]], subproblem.cost_matrix)
+        self.assertEqual(('coupling', [(0, 0)], [1], 1, '<='),
+                         subproblem.rows[-1])
+
+    def test_get_estimated_costs(self):
+        placement_problem = self._get_problem([
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                valid_solution_constraint.ValidSolutionConstraint])
+        placement_problem.cost_matrix = [[1, 3], [2, 4], [5, 10]]
+        self.assertEqual([0, 1, 3],
+                         placement_problem.get_estimated_costs([0, 1]))
+        self.assertEqual([0, 5, 10],
+                         placement_problem.get_estimated_costs([2]))
+
+        placement_problem.add_row('exclusion', [(2, 1)], [1], 0, '==')
+        self.assertEqual([0, 5], placement_problem.get_estimated_costs([2]))
@@ -19,11 +19,16 @@ Tests For Pulp-Solver.
 
 import contextlib
 import mock
+from pulp import constants
 
+from nova.openstack.common import timeutils
 from nova.scheduler import solver_scheduler_host_manager as host_manager
 from nova.scheduler import solvers
 from nova.scheduler.solvers import constraints
+from nova.scheduler.solvers.constraints import aggregate_ram
+from nova.scheduler.solvers.constraints import ram_constraint
 from nova.scheduler.solvers import costs
+from nova.scheduler.solvers import problem
 from nova.scheduler.solvers import pulp_solver
 from nova import solver_scheduler_exception as exception
 from nova import test
@@ -55,6 +60,17 @@ class FakeCostClass2(costs.BaseLinearCost):
                                                 for j in range(num_instances)]
 
 
+class FakeCostClass3(costs.BaseLinearCost):
+    def _generate_components(self, variables, hosts, filter_properties):
+        num_hosts = len(hosts)
+        num_instances = filter_properties.get('num_instances')
+        var_matrix = variables.host_instance_matrix
+        self.variables = [var_matrix[i][j] for i in range(num_hosts)
+                                            for j in range(num_instances)]
+        self.coefficients = [j for i in range(num_hosts)
+                                for j in range(num_instances)]
+
+
 class FakeConstraintClass1(constraints.BaseLinearConstraint):
     def _generate_components(self, variables, hosts, filter_properties):
         num_hosts = len(hosts)
@@ -163,6 +179,15 @@ class PulpSolverTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(PulpSolverTestCase, self).setUp()
+        pulp_solver._warm_starts.clear()
+        pulp_solver._host_models.clear()
+        solvers._structural_blocks.clear()
+        # NOTE: most tests solve the same request several times to compare
+        # solver paths, which the solution and infeasible request caches
+        # would short-circuit.
+        self.flags(scheduler_solver_solution_cache_size=0,
+                   scheduler_solver_infeasible_cache_seconds=0,
+                   group='solver_scheduler')
         self.pulp_solver = pulp_solver.PulpSolver()
         self.fake_hosts = [host_manager.SolverSchedulerHostState(
                 'fake_host%s' % x, 'fake-node') for x in xrange(1, 5)]
@@ -285,3 +310,858 @@ class PulpSolverTestCase(test.NoDBTestCase):
             self.assertEqual(expected_result, result)
             #self.assertEqual(exception.SolverFailed,
             #        self.pulp_solver.solve, hosts, filter_properties)
+
+    def test_solve_identical_hosts_collapsed_into_one_class(self):
+        self.pulp_solver.cost_classes = [FakeCostClass3]
+        self.pulp_solver.constraint_classes = [constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 3,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
+                'request_spec': {}}
+
+        with mock.patch.object(pulp_solver.pulp, 'LpVariable',
+                wraps=pulp_solver.pulp.LpVariable) as lp_variable:
+            result = self.pulp_solver.solve(hosts, filter_properties)
+            # one variable per instance count of the single host class
+            self.assertEqual(3, lp_variable.call_count)
+
+        # ties inside a class are broken by (host, nodename)
+        expected_result = [
+                (hosts[0], 'fake_uuid_0'),
+                (hosts[1], 'fake_uuid_1'),
+                (hosts[2], 'fake_uuid_2')]
+        self.assertEqual(expected_result, result)
+
+    def test_solve_host_class_presolve_same_as_flat_model(self):
+        self.pulp_solver.cost_classes = [FakeCostClass1, FakeCostClass2]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts
+        filter_properties = {
+                'num_instances': 4,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(4)],
+                'request_spec': {}}
+
+        result = self.pulp_solver.solve(hosts, filter_properties)
+        self.flags(pulp_solver_host_class_presolve=False,
+                   group='solver_scheduler')
+        flat_result = self.pulp_solver.solve(hosts, filter_properties)
+        self.assertEqual(set(flat_result), set(result))
+
+    def test_solve_lp_relaxation(self):
+        self.pulp_solver.cost_classes = [FakeCostClass1, FakeCostClass2]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts
+        filter_properties = {
+                'num_instances': 4,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(4)],
+                'request_spec': {}}
+
+        self.flags(pulp_solver_lp_relaxation_threshold=32,
+                   group='solver_scheduler')
+        with mock.patch.object(self.pulp_solver, '_solve_hosts') as (
+                                                            solve_hosts):
+            relaxed_result = self.pulp_solver.solve(hosts, filter_properties)
+            self.assertFalse(solve_hosts.called)
+        self.assertEqual(4, len(relaxed_result))
+        placement_problem = self.pulp_solver._get_placement_problem(
+                                                hosts, filter_properties)
+        host_counts = [len([host for (host, uuid) in relaxed_result
+                            if host is hosts[i]])
+                       for i in xrange(len(hosts))]
+        self.assertTrue(placement_problem.is_feasible(host_counts))
+
+    def test_solve_lp_relaxation_rounding_failed(self):
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+        self.flags(pulp_solver_lp_relaxation_threshold=1,
+                   group='solver_scheduler')
+
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 3,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
+                'request_spec': {}}
+        with mock.patch.object(problem.PlacementProblem,
+                               'round_solution') as round_solution:
+            round_solution.return_value = None
+            result = self.pulp_solver.solve(hosts, filter_properties)
+            self.assertTrue(round_solution.called)
+        self.flags(pulp_solver_lp_relaxation_threshold=0,
+                   group='solver_scheduler')
+        self.assertEqual(set(self.pulp_solver.solve(hosts,
+                                                    filter_properties)),
+                         set(result))
+
+    def _get_placement_cost(self, hosts, filter_properties, result):
+        placement_problem = self.pulp_solver._get_placement_problem(
+                                                hosts, filter_properties)
+        host_counts = [0 for host in hosts]
+        for host, instance_uuid in result:
+            host_counts[hosts.index(host)] += 1
+        return placement_problem.get_cost(host_counts)
+
+    def _solve_single_instance(self, hosts, filter_properties):
+        with mock.patch.object(pulp_solver.pulp.LpProblem,
+                               'solve') as lp_solve:
+            result = self.pulp_solver.solve(hosts, filter_properties)
+            self.assertFalse(lp_solve.called)
+        self.flags(pulp_solver_single_instance_fast_path=False,
+                   group='solver_scheduler')
+        lp_result = self.pulp_solver.solve(hosts, filter_properties)
+        self.flags(pulp_solver_single_instance_fast_path=True,
+                   group='solver_scheduler')
+        return result, lp_result
+
+    def test_solve_single_instance_fast_path(self):
+        self.pulp_solver.cost_classes = [FakeCostClass1, FakeCostClass2]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+
+        result, lp_result = self._solve_single_instance(hosts,
+                                                        filter_properties)
+        self.assertEqual([(hosts[1], 'fake_uuid_0')], result)
+        self.assertEqual(1, len(lp_result))
+        self.assertEqual(
+                self._get_placement_cost(hosts, filter_properties,
+                                         lp_result),
+                self._get_placement_cost(hosts, filter_properties, result))
+
+    def test_solve_single_instance_fast_path_ties(self):
+        self.pulp_solver.cost_classes = [FakeCostClass3]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = list(reversed(self.fake_hosts))
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+
+        result, lp_result = self._solve_single_instance(hosts,
+                                                        filter_properties)
+        # all costs are equal, so the tie between the hosts not excluded
+        # by FakeConstraintClass1 is broken by (host, nodename), while the
+        # LP solver may pick any of them
+        self.assertEqual([(self.fake_hosts[0], 'fake_uuid_0')], result)
+        self.assertEqual(1, len(lp_result))
+        self.assertEqual(
+                self._get_placement_cost(hosts, filter_properties,
+                                         lp_result),
+                self._get_placement_cost(hosts, filter_properties, result))
+
+    def test_solve_single_instance_fast_path_infeasible(self):
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass2,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+
+        result, lp_result = self._solve_single_instance(self.fake_hosts,
+                                                        filter_properties)
+        self.assertEqual([], result)
+        self.assertEqual(lp_result, result)
+
+    def test_solve_multi_shares_host_resources(self):
+        self.flags(ram_allocation_ratio=1.0)
+        self.pulp_solver.cost_classes = [FakeCostClass2]
+        self.pulp_solver.constraint_classes = [
+                constraints.ram_constraint.RamConstraint,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:2]
+        for host in hosts:
+            host.total_usable_ram_mb = 4096
+            host.free_ram_mb = 4096
+        filter_properties_list = [
+                {'num_instances': 2,
+                 'instance_uuids': ['fake_uuid_0', 'fake_uuid_1'],
+                 'instance_type': {'memory_mb': 1024},
+                 'request_spec': {}},
+                {'num_instances': 1,
+                 'instance_uuids': ['fake_uuid_2'],
+                 'instance_type': {'memory_mb': 3072},
+                 'request_spec': {}}]
+
+        results = self.pulp_solver.solve_multi(hosts, filter_properties_list)
+
+        self.assertEqual(['fake_uuid_0', 'fake_uuid_1'],
+                         sorted(uuid for (host, uuid) in results[0]))
+        self.assertEqual(['fake_uuid_2'],
+                         [uuid for (host, uuid) in results[1]])
+        # each request alone fits on the first host, but not together
+        for host in hosts:
+            used_ram = sum(
+                    filter_properties['instance_type']['memory_mb']
+                    for filter_properties, result in zip(
+                            filter_properties_list, results)
+                    for (result_host, uuid) in result if result_host is host)
+            self.assertTrue(used_ram <= 4096)
+
+    def test_solve_multi_infeasible(self):
+        self.flags(ram_allocation_ratio=1.0)
+        self.pulp_solver.cost_classes = [FakeCostClass2]
+        self.pulp_solver.constraint_classes = [
+                constraints.ram_constraint.RamConstraint,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:1]
+        hosts[0].total_usable_ram_mb = 4096
+        hosts[0].free_ram_mb = 4096
+        filter_properties_list = [
+                {'num_instances': 1,
+                 'instance_uuids': ['fake_uuid_0'],
+                 'instance_type': {'memory_mb': 2048},
+                 'request_spec': {}},
+                {'num_instances': 1,
+                 'instance_uuids': ['fake_uuid_1'],
+                 'instance_type': {'memory_mb': 3072},
+                 'request_spec': {}}]
+
+        results = self.pulp_solver.solve_multi(hosts, filter_properties_list)
+        self.assertEqual([[], []], results)
+
+    def test_solve_with_alternates(self):
+        self.pulp_solver.cost_classes = [FakeCostClass2]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+
+        result, alternates = self.pulp_solver.solve_with_alternates(hosts,
+                                                    filter_properties, 2)
+        # hosts[0] is excluded and costs grow with the host index
+        self.assertEqual([(hosts[1], 'fake_uuid_0')], result)
+        self.assertEqual([hosts[2], hosts[3]], alternates)
+
+    def test_solve_with_alternates_infeasible(self):
+        self.pulp_solver.cost_classes = [FakeCostClass2]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass2,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+
+        self.assertEqual(([], []), self.pulp_solver.solve_with_alternates(
+                                self.fake_hosts, filter_properties, 2))
+
+    def _solve_flat(self, num_instances):
+        self.flags(pulp_solver_host_class_presolve=False,
+                   pulp_solver_single_instance_fast_path=False,
+                   group='solver_scheduler')
+        self.pulp_solver.cost_classes = [FakeCostClass1, FakeCostClass2]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+        filter_properties = {
+                'num_instances': num_instances,
+                'instance_uuids': ['fake_uuid_%s' % x
+                                   for x in range(num_instances)],
+                'request_spec': {}}
+        return self.pulp_solver.solve(self.fake_hosts[0:4],
+                                      filter_properties)
+
+    def test_solve_warm_start_bounds_cost(self):
+        result = self._solve_flat(3)
+
+        with mock.patch.object(self.pulp_solver, '_solve_problem',
+                wraps=self.pulp_solver._solve_problem) as solve_problem:
+            self.assertEqual(set(result), set(self._solve_flat(3)))
+            prob = solve_problem.call_args[0][0]
+            self.assertIn('Incumbent_Cost', prob.constraints)
+
+        # a request for another number of instances has no incumbent
+        with mock.patch.object(self.pulp_solver, '_solve_problem',
+                wraps=self.pulp_solver._solve_problem) as solve_problem:
+            self._solve_flat(2)
+            prob = solve_problem.call_args[0][0]
+            self.assertNotIn('Incumbent_Cost', prob.constraints)
+
+    def test_solve_warm_start_kept_by_subproblem_hosts(self):
+        self.flags(pulp_solver_host_class_presolve=False,
+                   pulp_solver_single_instance_fast_path=False,
+                   group='solver_scheduler')
+        placement_problem = problem.PlacementProblem(self.fake_hosts, 2)
+        variables = [(i, j) for i in xrange(len(self.fake_hosts))
+                     for j in xrange(2)]
+        placement_problem.add_row('count', variables,
+                                  [j + 1 for i, j in variables], 2, '==')
+        filter_properties = {'num_instances': 2, 'request_spec': {}}
+        partitions = [[0, 1], [2, 3]]
+        for partition in partitions:
+            subproblem = placement_problem.get_subproblem(partition, 2)
+            self.pulp_solver._solve_placement_problem(
+                    subproblem.hosts, filter_properties, subproblem)
+        # the partitions placing the same number of instances of the same
+        # request do not share a warm start
+        self.assertEqual(2, len(pulp_solver._warm_starts))
+        for partition in partitions:
+            subproblem = placement_problem.get_subproblem(partition, 2)
+            key = self.pulp_solver._get_warm_start_key(filter_properties,
+                                                       subproblem.hosts)
+            self.assertIsNotNone(self.pulp_solver._get_incumbent(subproblem,
+                                                                 key))
+
+    def test_solve_warm_start_used_on_solver_failure(self):
+        result = self._solve_flat(3)
+
+        with mock.patch.object(self.pulp_solver, '_solve_problem',
+                side_effect=exception.SolverFailed(reason='Not Solved')):
+            self.assertEqual(result, self._solve_flat(3))
+            self.assertRaises(exception.SolverFailed, self._solve_flat, 2)
+
+    def test_solve_reuses_persistent_model(self):
+        self._solve_flat(4)
+
+        with contextlib.nested(
+                mock.patch.object(self.pulp_solver, '_build_host_model',
+                                  wraps=self.pulp_solver._build_host_model),
+                mock.patch.object(FakeCostClass2, 'cost_multiplier',
+                                  return_value=-0.5)) as (
+                build_model, fake_cost_2_multiplier):
+            result = self._solve_flat(4)
+            self.assertFalse(build_model.called)
+
+        # the patched model gives the same solution as a new one
+        expected_result = [
+                (self.fake_hosts[1], 'fake_uuid_0'),
+                (self.fake_hosts[1], 'fake_uuid_1'),
+                (self.fake_hosts[2], 'fake_uuid_2'),
+                (self.fake_hosts[3], 'fake_uuid_3')]
+        self.assertEqual(set(expected_result), set(result))
+
+    def test_solve_persistent_model_kept_by_shape(self):
+        self._solve_flat(2)
+        self.assertEqual(1, len(pulp_solver._host_models))
+
+        # other hosts of the same number reuse the model
+        filter_properties = {'num_instances': 2, 'request_spec': {}}
+        with mock.patch.object(self.pulp_solver, '_build_host_model',
+                wraps=self.pulp_solver._build_host_model) as build_model:
+            self.pulp_solver.solve(self.fake_hosts[4:8], filter_properties)
+            self.assertFalse(build_model.called)
+            self._solve_flat(3)
+            self.assertEqual(1, build_model.call_count)
+        self.assertEqual(2, len(pulp_solver._host_models))
+
+    def test_patch_host_model_rebinds_changed_hosts_only(self):
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        placement_problem = problem.PlacementProblem(self.fake_hosts[0:2], 2)
+        placement_problem.cost_matrix = [[1, 2], [3, 4]]
+        model = self.pulp_solver._build_host_model(placement_problem)
+        var_matrix = model['var_matrix']
+        var_matrix[0][0].upBound = None
+
+        new_problem = problem.PlacementProblem(self.fake_hosts[0:2], 2)
+        new_problem.cost_matrix = [[1, 2], [5, 6]]
+        new_problem.add_row('exclusion', [(1, 1)], [1], 0, '==')
+        new_problem.add_row('coupling', [(0, 0), (1, 0)], [1, 1], 1, '<=')
+        self.pulp_solver._patch_host_model(model, new_problem)
+
+        # host0 did not change, so its variables are left as they were
+        self.assertIsNone(var_matrix[0][0].upBound)
+        self.assertEqual([1, 0], [var.upBound for var in var_matrix[1]])
+        self.assertEqual(5, model['prob'].objective[var_matrix[1][0]])
+        self.assertEqual(['coupling'], model['coupling_rows'])
+        self.assertIn('coupling', model['prob'].constraints)
+
+    def test_solve_structural_expressions_built_once(self):
+        with mock.patch.object(self.pulp_solver, '_add_row',
+                               wraps=self.pulp_solver._add_row) as add_row:
+            self._solve_flat(4)
+            # the instance count row and a row per host
+            self.assertEqual(5, add_row.call_count)
+            add_row.reset_mock()
+            self._solve_flat(4)
+            self.assertFalse(add_row.called)
+
+    def test_solve_lp_relaxation_reuses_persistent_model(self):
+        self.flags(pulp_solver_lp_relaxation_threshold=1,
+                   group='solver_scheduler')
+        with mock.patch.object(self.pulp_solver, '_build_host_model',
+                wraps=self.pulp_solver._build_host_model) as build_model:
+            self._solve_flat(3)
+            self._solve_flat(3)
+            self.assertEqual(1, build_model.call_count)
+        model = pulp_solver._host_models._data.values()[0]
+        self.assertFalse(model['busy'])
+        for row in model['var_matrix']:
+            for var in row:
+                self.assertEqual(constants.LpInteger, var.cat)
+
+    def test_solve_persistent_model_in_use_not_shared(self):
+        self._solve_flat(2)
+        model = pulp_solver._host_models._data.values()[0]
+        model['busy'] = True
+
+        with mock.patch.object(self.pulp_solver, '_build_host_model',
+                wraps=self.pulp_solver._build_host_model) as build_model:
+            self._solve_flat(2)
+            self.assertEqual(1, build_model.call_count)
+        self.assertIs(model, pulp_solver._host_models._data.values()[0])
+
+    def test_structural_rows_reused_by_shape(self):
+        valid_solution_cls = (
+                constraints.valid_solution_constraint.ValidSolutionConstraint)
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass1,
+                constraints.non_trivial_solution_constraint.\
+                NonTrivialSolutionConstraint, valid_solution_cls]
+        filter_properties = {'num_instances': 3, 'request_spec': {}}
+
+        with mock.patch.object(valid_solution_cls, 'get_components',
+                wraps=valid_solution_cls().get_components) as get_components:
+            problem1 = self.pulp_solver._get_placement_problem(
+                                    self.fake_hosts[0:4], filter_properties)
+            problem2 = self.pulp_solver._get_placement_problem(
+                                    self.fake_hosts[4:8], filter_properties)
+            self.assertEqual(1, get_components.call_count)
+
+        self.assertEqual(problem1.structural_rows, problem2.structural_rows)
+        self.assertIs(problem1.structural_rows[0][1],
+                      problem2.structural_rows[0][1])
+        self.assertTrue(problem2.is_separable)
+        self.assertEqual([False, False, False], problem2.allowed[0])
+
+        # another shape is evaluated again
+        problem3 = self.pulp_solver._get_placement_problem(
+                                    self.fake_hosts[0:3], filter_properties)
+        self.assertEqual(4, len(problem3.structural_rows))
+
+    def test_solve_solution_cache(self):
+        self.flags(scheduler_solver_solution_cache_size=4,
+                   group='solver_scheduler')
+        self.pulp_solver = pulp_solver.PulpSolver()
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 3,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
+                'request_spec': {}}
+        result = self.pulp_solver.solve(hosts, filter_properties)
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem',
+                wraps=self.pulp_solver._get_placement_problem) as (
+                                                    get_placement_problem):
+            # the same request for other instances reuses the solution
+            filter_properties['instance_uuids'] = [
+                    'other_uuid_%s' % x for x in range(3)]
+            other_result = self.pulp_solver.solve(hosts, filter_properties)
+            self.assertFalse(get_placement_problem.called)
+            self.assertEqual([host for (host, uuid) in result],
+                             [host for (host, uuid) in other_result])
+            self.assertEqual(['other_uuid_%s' % x for x in range(3)],
+                             [uuid for (host, uuid) in other_result])
+
+            # a host state changed
+            hosts[0].generation += 1
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertTrue(get_placement_problem.called)
+
+        self.assertEqual(1, self.pulp_solver.solution_cache.hits)
+        self.assertEqual(2, self.pulp_solver.solution_cache.misses)
+
+    def _get_cached_solver(self):
+        self.flags(scheduler_solver_solution_cache_size=4,
+                   group='solver_scheduler')
+        solver = pulp_solver.PulpSolver()
+        solver.cost_classes = [FakeCostClass1]
+        solver.constraint_classes = [constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+        return solver
+
+    def test_solve_solution_cache_retried_request(self):
+        self.pulp_solver = self._get_cached_solver()
+        hosts = self.fake_hosts[0:4]
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=0, vcpus=0,
+                        project_id='fake', vm_state='building',
+                        task_state=None, os_type='Linux', uuid='fake-uuid')
+        filter_properties = {
+                'num_instances': 3,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(3)],
+                'request_spec': {'instance_properties': instance}}
+        result = self.pulp_solver.solve(hosts, filter_properties)
+        # the scheduler consumes the placed instances
+        for host, instance_uuid in result:
+            host.consume_from_instance(instance)
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem',
+                wraps=self.pulp_solver._get_placement_problem) as (
+                                                    get_placement_problem):
+            # a retry of the same instances is answered as before
+            self.assertEqual(result, self.pulp_solver.solve(
+                                            hosts, filter_properties))
+            self.assertFalse(get_placement_problem.called)
+
+            # other instances need the capacity consumed by the first ones
+            filter_properties['instance_uuids'] = [
+                    'other_uuid_%s' % x for x in range(3)]
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertTrue(get_placement_problem.called)
+
+    def test_solve_solution_cache_expires(self):
+        self.flags(scheduler_solver_solution_cache_seconds=30,
+                   group='solver_scheduler')
+        self.pulp_solver = self._get_cached_solver()
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.pulp_solver.solve(hosts, filter_properties)
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem',
+                wraps=self.pulp_solver._get_placement_problem) as (
+                                                    get_placement_problem):
+            timeutils.advance_time_seconds(29)
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertFalse(get_placement_problem.called)
+
+            timeutils.advance_time_seconds(1)
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertTrue(get_placement_problem.called)
+
+    def _get_solution_cache_key(self, hosts, filter_properties):
+        return self.pulp_solver._get_solution_cache_key(hosts,
+                filter_properties, self.pulp_solver._get_candidate_state(
+                                            hosts, filter_properties))
+
+    def test_solution_cache_key_service_and_aggregates(self):
+        self.pulp_solver = self._get_cached_solver()
+        hosts = self.fake_hosts[0:2]
+        for host in hosts:
+            host.service = {'host': host.host, 'disabled': False}
+        aggregates = [{'id': 1, 'hosts': ['fake_host1', 'other_host'],
+                       'metadetails': {'ram_allocation_ratio': '1.5'}}]
+        filter_properties = {'num_instances': 1,
+                             'context': mock.Mock(),
+                             'request_spec': {}}
+
+        with contextlib.nested(
+                mock.patch.object(self.pulp_solver.servicegroup_api,
+                                  'service_is_up', return_value=True),
+                mock.patch('nova.db.aggregate_get_all',
+                           return_value=aggregates)) as (
+                                        service_is_up, aggregate_get_all):
+            key = self._get_solution_cache_key(hosts, filter_properties)
+            self.assertEqual(key, self._get_solution_cache_key(
+                                            hosts, filter_properties))
+
+            # a service went down
+            service_is_up.return_value = False
+            down_key = self._get_solution_cache_key(hosts,
+                                                    filter_properties)
+            self.assertNotEqual(key, down_key)
+
+            # the metadata of an aggregate of a candidate host changed
+            aggregates[0]['metadetails']['ram_allocation_ratio'] = '2.0'
+            self.assertNotEqual(down_key, self._get_solution_cache_key(
+                                            hosts, filter_properties))
+
+    def test_solve_infeasible_cache(self):
+        self.flags(scheduler_solver_infeasible_cache_seconds=30,
+                   group='solver_scheduler')
+        self.pulp_solver = pulp_solver.PulpSolver()
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [ram_constraint.RamConstraint,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+        self.flags(ram_allocation_ratio=1.0)
+
+        hosts = self.fake_hosts[0:4]
+        for host in hosts:
+            host.total_usable_ram_mb = 2048
+            host.free_ram_mb = 1024
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'instance_type': {'memory_mb': 4096},
+                'request_spec': {}}
+        self.assertEqual([], self.pulp_solver.solve(hosts, filter_properties))
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem',
+                wraps=self.pulp_solver._get_placement_problem) as (
+                                                    get_placement_problem):
+            # the same request is rejected without solving
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertFalse(get_placement_problem.called)
+
+            # a host state changed, but not its capacity
+            hosts[1].generation += 1
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertFalse(get_placement_problem.called)
+
+            # capacity changed
+            hosts[2].total_usable_ram_mb = 8192
+            hosts[2].free_ram_mb = 8192
+            self.assertEqual([(hosts[2], 'fake_uuid_0')],
+                             self.pulp_solver.solve(hosts, filter_properties))
+            self.assertTrue(get_placement_problem.called)
+
+    def test_solve_infeasible_cache_service_changed(self):
+        self.flags(scheduler_solver_infeasible_cache_seconds=30,
+                   group='solver_scheduler')
+        self.pulp_solver = pulp_solver.PulpSolver()
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [ram_constraint.RamConstraint,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+        self.flags(ram_allocation_ratio=1.0)
+
+        hosts = self.fake_hosts[0:2]
+        for host in hosts:
+            host.total_usable_ram_mb = 2048
+            host.free_ram_mb = 1024
+            host.service = {'host': host.host, 'disabled': False}
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'instance_type': {'memory_mb': 4096},
+                'request_spec': {}}
+
+        with contextlib.nested(
+                mock.patch.object(self.pulp_solver.servicegroup_api,
+                                  'service_is_up', return_value=True),
+                mock.patch.object(self.pulp_solver, '_presolve_capacity',
+                        wraps=self.pulp_solver._presolve_capacity)) as (
+                                        service_is_up, presolve_capacity):
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertEqual(1, presolve_capacity.call_count)
+
+            # a service went down, which the cached proof did not see
+            service_is_up.return_value = False
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertEqual(2, presolve_capacity.call_count)
+
+    def test_solve_infeasible_cache_heuristic_not_recorded(self):
+        self.flags(scheduler_solver_infeasible_cache_seconds=30,
+                   group='solver_scheduler')
+        self.pulp_solver = pulp_solver.PulpSolver()
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 2,
+                'instance_uuids': ['fake_uuid_0', 'fake_uuid_1'],
+                'request_spec': {}}
+
+        # as with a greedy placement which found none
+        with mock.patch.object(self.pulp_solver, '_solve_placement_problem',
+                               return_value=None) as solve_placement:
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertEqual(2, solve_placement.call_count)
+
+    def test_solve_infeasible_cache_lp_proof_needs_same_hosts(self):
+        self.flags(scheduler_solver_infeasible_cache_seconds=30,
+                   pulp_solver_host_class_presolve=False,
+                   pulp_solver_single_instance_fast_path=False,
+                   group='solver_scheduler')
+        self.pulp_solver = pulp_solver.PulpSolver()
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass2,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+        self.assertEqual([], self.pulp_solver.solve(hosts, filter_properties))
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem',
+                wraps=self.pulp_solver._get_placement_problem) as (
+                                                    get_placement_problem):
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertFalse(get_placement_problem.called)
+
+            # the solver proved it for these host states only
+            hosts[1].generation += 1
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertTrue(get_placement_problem.called)
+
+    def test_solve_infeasible_cache_expires(self):
+        self.flags(scheduler_solver_infeasible_cache_seconds=30,
+                   pulp_solver_host_class_presolve=False,
+                   pulp_solver_single_instance_fast_path=False,
+                   group='solver_scheduler')
+        self.pulp_solver = pulp_solver.PulpSolver()
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [FakeConstraintClass2,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        filter_properties = {
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'request_spec': {}}
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual([], self.pulp_solver.solve(hosts, filter_properties))
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem',
+                wraps=self.pulp_solver._get_placement_problem) as (
+                                                    get_placement_problem):
+            timeutils.advance_time_seconds(29)
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertFalse(get_placement_problem.called)
+
+            timeutils.advance_time_seconds(1)
+            self.pulp_solver.solve(hosts, filter_properties)
+            self.assertTrue(get_placement_problem.called)
+
+    def _presolve_capacity(self, hosts, filter_properties):
+        return self.pulp_solver._presolve_capacity(filter_properties,
+                self.pulp_solver._get_host_capacities(hosts,
+                                                      filter_properties))
+
+    def test_presolve_capacity(self):
+        self.flags(ram_allocation_ratio=1.0, max_instances_per_host=2)
+        self.pulp_solver.constraint_classes = [
+                constraints.num_instances_constraint.NumInstancesConstraint,
+                ram_constraint.RamConstraint,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:3]
+        for host in hosts:
+            host.num_instances = 0
+            host.total_usable_ram_mb = 4096
+            host.free_ram_mb = 3072
+        # RAM fits 1 instance on each host, at most 2 instances per host
+        filter_properties = {'num_instances': 3,
+                             'instance_type': {'memory_mb': 2048}}
+        self.assertIsNone(self._presolve_capacity(hosts, filter_properties))
+
+        filter_properties['num_instances'] = 4
+        self.assertEqual('RamConstraint',
+                         self._presolve_capacity(hosts, filter_properties))
+
+        filter_properties['num_instances'] = 7
+        self.assertEqual('NumInstancesConstraint',
+                         self._presolve_capacity(hosts, filter_properties))
+
+        # requests which do not consume a resource are not limited by it
+        filter_properties = {'num_instances': 6, 'instance_type': {}}
+        self.assertIsNone(self._presolve_capacity(hosts, filter_properties))
+
+    @mock.patch('nova.db.aggregate_host_get_by_metadata_key')
+    def test_solve_looks_up_aggregates_once(self, agg_mock):
+        self.flags(ram_allocation_ratio=1.0)
+        agg_mock.return_value = {'fake_host1': set(['2.0'])}
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [
+                aggregate_ram.AggregateRamConstraint,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        for host in hosts:
+            host.total_usable_ram_mb = 2048
+            host.free_ram_mb = 1024
+        filter_properties = {
+                'context': mock.Mock(),
+                'num_instances': 1,
+                'instance_uuids': ['fake_uuid_0'],
+                'instance_type': {'memory_mb': 2048},
+                'request_spec': {}}
+        self.assertEqual([(hosts[0], 'fake_uuid_0')],
+                         self.pulp_solver.solve(hosts, filter_properties))
+        # once for the presolve, once for the problem, not once per host
+        self.assertEqual(2, agg_mock.call_count)
+
+    def test_solve_presolve_capacity_infeasible(self):
+        self.flags(ram_allocation_ratio=1.0)
+        self.pulp_solver.cost_classes = [FakeCostClass1]
+        self.pulp_solver.constraint_classes = [ram_constraint.RamConstraint,
+                constraints.\
+                non_trivial_solution_constraint.NonTrivialSolutionConstraint,
+                constraints.valid_solution_constraint.ValidSolutionConstraint]
+
+        hosts = self.fake_hosts[0:4]
+        for host in hosts:
+            host.total_usable_ram_mb = 2048
+            host.free_ram_mb = 2048
+        filter_properties = {
+                'num_instances': 5,
+                'instance_uuids': ['fake_uuid_%s' % x for x in range(5)],
+                'instance_type': {'memory_mb': 2048},
+                'request_spec': {}}
+
+        with mock.patch.object(self.pulp_solver, '_get_placement_problem') as (
+                                                    get_placement_problem):
+            self.assertEqual([], self.pulp_solver.solve(hosts,
+                                                        filter_properties))
+            self.assertEqual([[]], self.pulp_solver.solve_multi(hosts,
+                                                    [filter_properties]))
+            self.assertFalse(get_placement_problem.called)
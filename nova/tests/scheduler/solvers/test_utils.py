@@ -0,0 +1,100 @@
+# Copyright (c) 2014 Cisco Systems, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Tests for utility methods of scheduler solvers.
+"""
+
+from nova.scheduler.solvers import utils
+from nova import test
+
+
+class LRUCacheTestCase(test.NoDBTestCase):
+
+    def test_get_and_put(self):
+        cache = utils.LRUCache(2)
+        cache.put('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('default', cache.get('b', 'default'))
+
+    def test_evicts_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(2, len(cache))
+
+    def test_peek_does_not_mark_used(self):
+        cache = utils.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.peek('a'))
+        cache.put('c', 3)
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.peek('a'))
+
+
+class CountingLRUCacheTestCase(test.NoDBTestCase):
+
+    def test_counts_hits_and_misses(self):
+        cache = utils.CountingLRUCache(2)
+        self.assertEqual(0.0, cache.hit_rate)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.get('a')
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertAlmostEqual(2.0 / 3, cache.hit_rate)
+
+    def test_peek_is_not_counted(self):
+        cache = utils.CountingLRUCache(2)
+        cache.put('a', 1)
+        cache.peek('a')
+        cache.peek('b')
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(0, cache.misses)
+
+
+class RequestSignatureTestCase(test.NoDBTestCase):
+
+    def _get_request_spec(self, memory_mb, num_instances=1):
+        return {'instance_type': {'memory_mb': memory_mb},
+                'instance_properties': {'project_id': 1,
+                                        'memory_mb': memory_mb},
+                'num_instances': num_instances}
+
+    def test_signature_ignores_number_of_instances(self):
+        self.assertEqual(
+                utils.get_request_signature(self._get_request_spec(512), {}),
+                utils.get_request_signature(self._get_request_spec(512, 3),
+                                            {}))
+
+    def test_signature_ignore_flavor(self):
+        request_spec1 = self._get_request_spec(512)
+        request_spec2 = self._get_request_spec(1024)
+        self.assertNotEqual(
+                utils.get_request_signature(request_spec1, {}),
+                utils.get_request_signature(request_spec2, {}))
+        self.assertEqual(
+                utils.get_request_signature(request_spec1, {},
+                                            ignore_flavor=True),
+                utils.get_request_signature(request_spec2, {},
+                                            ignore_flavor=True))
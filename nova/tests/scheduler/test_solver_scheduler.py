@@ -17,6 +17,8 @@ Tests For Solver Scheduler.
 """
 
 import contextlib
+
+import eventlet
 import mock
 
 from nova.compute import utils as compute_utils
@@ -24,11 +26,14 @@ from nova.compute import vm_states
 from nova import context
 from nova import db
 from nova import exception
+from nova.openstack.common import timeutils
 from nova.scheduler import driver
+from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
 from nova.scheduler import solver_scheduler
 from nova.scheduler import weights
 from nova import solver_scheduler_exception
+from nova import test
 from nova.tests.scheduler import solver_scheduler_fakes as fakes
 from nova.tests.scheduler import test_scheduler
 
@@ -386,6 +391,535 @@ class SolverSchedulerTestCase(test_scheduler.SchedulerTestCase):
             self.assertTrue(host is not None)
             self.assertTrue(node is not None)
 
+    def test_schedule_consumes_selected_hosts(self):
+        self.flags(scheduler_solver_constraints=[
+                    'NonTrivialSolutionConstraint',
+                    'ValidSolutionConstraint'], group='solver_scheduler')
+
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        request_spec = {'instance_type': {'memory_mb': 512, 'root_gb': 1,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'num_instances': 1}
+
+        with mock.patch.object(db, 'compute_node_get_all') as get_all:
+            get_all.return_value = fakes.COMPUTE_NODES
+            hosts = sched._schedule(fake_context, request_spec, {})
+
+        self.assertEqual(1, len(hosts))
+        host_state = hosts[0].obj
+        compute = [node for node in fakes.COMPUTE_NODES
+                   if node['hypervisor_hostname'] == host_state.nodename][0]
+        # the instance is consumed from the cached host state right away
+        self.assertEqual(compute['free_ram_mb'] - 512,
+                         host_state.free_ram_mb)
+        self.assertEqual(1, host_state.num_instances)
+        self.assertEqual(2, host_state.generation)
+
+    def test_schedule_fallback_uses_fetched_hosts(self):
+        self.flags(enable_fallback_scheduler=True, group='solver_scheduler')
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        request_spec = {'instance_type': {'memory_mb': 512, 'root_gb': 1,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'num_instances': 2}
+        filter_properties = {}
+
+        fallback_schedule = filter_scheduler.FilterScheduler._schedule
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.hosts_solver, 'solve_with_alternates'),
+                mock.patch.object(filter_scheduler.FilterScheduler,
+                                  '_schedule', autospec=True,
+                                  side_effect=fallback_schedule),
+                mock.patch.object(sched.fallback_scheduler.host_manager,
+                                  'get_filtered_hosts'),
+                mock.patch.object(sched.fallback_scheduler.host_manager,
+                                  'get_weighed_hosts')) as (
+                get_all, solve_with_alternates, fallback_schedule,
+                get_filtered_hosts, get_weighed_hosts):
+            get_all.return_value = fakes.COMPUTE_NODES
+            solve_with_alternates.side_effect = (
+                    solver_scheduler_exception.SolverFailed(reason=''))
+            get_filtered_hosts.side_effect = (
+                    lambda hosts, filter_properties, index: hosts)
+            get_weighed_hosts.side_effect = (
+                    lambda hosts, filter_properties:
+                    [weights.WeighedHost(host, 1) for host in hosts])
+            selected_hosts = sched._schedule(fake_context, request_spec,
+                                             filter_properties)
+
+            self.assertEqual(2, len(selected_hosts))
+            get_all.assert_called_once_with(mock.ANY)
+            # the fallback scheduler schedules a copy of the prepared
+            # request, over the host states fetched for the solver
+            fallback_schedule.assert_called_once_with(mock.ANY,
+                    fake_context, request_spec, mock.ANY, None)
+            fallback_filter_properties = fallback_schedule.call_args[0][3]
+            self.assertIsNot(filter_properties, fallback_filter_properties)
+            self.assertEqual(1, fallback_filter_properties['retry'][
+                                                        'num_attempts'])
+            solver_hosts = solve_with_alternates.call_args[0][0]
+            fallback_hosts = get_filtered_hosts.call_args_list[0][0][0]
+            self.assertEqual(solver_hosts, fallback_hosts)
+            self.assertEqual(1, solver_hosts[0].num_instances)
+        # the request is prepared once for each scheduler
+        self.assertEqual(1, filter_properties['retry']['num_attempts'])
+
+    def test_schedule_fallback_copy_only_on_fallback(self):
+        self.flags(enable_fallback_scheduler=True, group='solver_scheduler')
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        request_spec = {'instance_type': {'memory_mb': 512, 'root_gb': 1,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'num_instances': 1}
+        filter_properties = {'retry': {'num_attempts': 1, 'hosts': []},
+                             'scheduler_hints': {'foo': ['bar']}}
+
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.hosts_solver, 'solve_with_alternates'),
+                mock.patch.object(sched, '_get_fallback_filter_properties')
+                ) as (get_all, solve_with_alternates,
+                      get_fallback_filter_properties):
+            get_all.return_value = fakes.COMPUTE_NODES
+            solve_with_alternates.side_effect = (
+                    lambda hosts, filter_properties, num_alternates:
+                    ([(hosts[0], 'fake-uuid1')], []))
+            selected_hosts = sched._schedule(fake_context, request_spec,
+                                             filter_properties)
+
+        self.assertEqual(1, len(selected_hosts))
+        # the request is only copied for the fallback scheduler
+        self.assertFalse(get_fallback_filter_properties.called)
+        self.assertEqual(2, filter_properties['retry']['num_attempts'])
+
+    def test_get_fallback_filter_properties(self):
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        request_spec = {'instance_properties': {}, 'num_instances': 1}
+        unprepared_filter_properties = {
+                'retry': {'num_attempts': 1, 'hosts': []},
+                'scheduler_hints': {'group': 'fake-group'}}
+        filter_properties = {'context': fake_context,
+                             'request_spec': request_spec,
+                             'retry': {'num_attempts': 2, 'hosts': []},
+                             'scheduler_hints': {'group': 'fake-group'},
+                             'group_hosts': set(['host1'])}
+
+        fallback_filter_properties = sched._get_fallback_filter_properties(
+                filter_properties, unprepared_filter_properties)
+
+        # the prepared request is copied, with the retry state as passed
+        self.assertEqual(1, fallback_filter_properties['retry'][
+                                                        'num_attempts'])
+        self.assertEqual(set(['host1']),
+                         fallback_filter_properties['group_hosts'])
+        self.assertIsNot(filter_properties['group_hosts'],
+                         fallback_filter_properties['group_hosts'])
+        self.assertIsNot(unprepared_filter_properties['retry'],
+                         fallback_filter_properties['retry'])
+        # the values preparing the request replaces are shared
+        self.assertIs(fake_context, fallback_filter_properties['context'])
+        self.assertIs(request_spec,
+                      fallback_filter_properties['request_spec'])
+
+        # a request passed without retry state gets it from the fallback
+        del unprepared_filter_properties['retry']
+        fallback_filter_properties = sched._get_fallback_filter_properties(
+                filter_properties, unprepared_filter_properties)
+        self.assertNotIn('retry', fallback_filter_properties)
+
+    def test_schedule_fallback_updates_group_hosts(self):
+        self.flags(enable_fallback_scheduler=True, group='solver_scheduler')
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        request_spec = {'instance_properties': {}, 'num_instances': 1}
+        filter_properties = {'context': fake_context,
+                             'request_spec': request_spec,
+                             'instance_uuids': ['fake-uuid1'],
+                             'group_hosts': set()}
+        fallback_filter_properties = {}
+
+        def fake_schedule(context, request_spec, filter_properties,
+                          instance_uuids):
+            filter_properties['group_hosts'] = set(['host1'])
+            return ['fake_host']
+
+        with mock.patch.object(sched.fallback_scheduler, '_schedule',
+                               side_effect=fake_schedule):
+            self.assertEqual(['fake_host'],
+                             sched._get_fallback_selected_hosts([],
+                                filter_properties,
+                                fallback_filter_properties))
+        self.assertEqual(set(['host1']), filter_properties['group_hosts'])
+
+        # requests outside of instance groups are left as they are
+        filter_properties = {'context': fake_context,
+                             'request_spec': request_spec,
+                             'instance_uuids': ['fake-uuid1']}
+        with mock.patch.object(sched.fallback_scheduler, '_schedule',
+                               return_value=['fake_host']):
+            sched._get_fallback_selected_hosts([], filter_properties, {})
+        self.assertNotIn('group_hosts', filter_properties)
+
+    def _get_speculative_request(self):
+        self.flags(enable_fallback_scheduler=True,
+                   speculative_fallback_deadline_ms=10,
+                   group='solver_scheduler')
+        request_spec = {'instance_type': {'memory_mb': 512, 'root_gb': 1,
+                                          'ephemeral_gb': 0,
+                                          'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'num_instances': 1}
+        return request_spec
+
+    def test_schedule_speculative_fallback_solver_in_time(self):
+        request_spec = self._get_speculative_request()
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.hosts_solver,
+                                  'solve_with_alternates'),
+                mock.patch.object(sched, '_schedule_fallback')) as (
+                get_all, solve_with_alternates, schedule_fallback):
+            get_all.return_value = fakes.COMPUTE_NODES
+            solve_with_alternates.side_effect = (
+                    lambda hosts, filter_properties, num_alternates:
+                    ([(hosts[1], 'fake-uuid1')], []))
+            schedule_fallback.side_effect = (
+                    lambda hosts, filter_properties,
+                    fallback_filter_properties:
+                    [weights.WeighedHost(hosts[0], 1)])
+            selected_hosts = sched._schedule(fake_context, request_spec, {})
+
+            hosts = solve_with_alternates.call_args[0][0]
+            self.assertEqual([hosts[1]],
+                             [host.obj for host in selected_hosts])
+            # only the solution is consumed from the host states
+            self.assertEqual(1, hosts[1].num_instances)
+            self.assertEqual(0, hosts[0].num_instances)
+
+    def test_schedule_speculative_fallback_solver_too_slow(self):
+        request_spec = self._get_speculative_request()
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        solves = []
+
+        def fake_solve_with_alternates(hosts, filter_properties,
+                                       num_alternates):
+            eventlet.sleep(0.2)
+            solves.append(hosts)
+            return [(hosts[1], 'fake-uuid1')], []
+
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.hosts_solver,
+                                  'solve_with_alternates'),
+                mock.patch.object(sched.fallback_scheduler.host_manager,
+                                  'get_filtered_hosts'),
+                mock.patch.object(sched.fallback_scheduler.host_manager,
+                                  'get_weighed_hosts'),
+                mock.patch.object(sched.solver_circuit_breaker, 'record')) as (
+                get_all, solve_with_alternates, get_filtered_hosts,
+                get_weighed_hosts, record):
+            get_all.return_value = fakes.COMPUTE_NODES
+            solve_with_alternates.side_effect = fake_solve_with_alternates
+            get_filtered_hosts.side_effect = (
+                    lambda hosts, filter_properties, index: hosts)
+            get_weighed_hosts.side_effect = (
+                    lambda hosts, filter_properties:
+                    [weights.WeighedHost(host, 1) for host in hosts])
+            selected_hosts = sched._schedule(fake_context, request_spec, {})
+
+            hosts = solve_with_alternates.call_args[0][0]
+            # the fallback worked on copies of the host states, and its
+            # choice is consumed from the host states themselves
+            self.assertEqual([hosts[0]],
+                             [host.obj for host in selected_hosts])
+            fallback_hosts = get_filtered_hosts.call_args[0][0]
+            self.assertNotIn(hosts[0], fallback_hosts)
+            self.assertEqual(1, hosts[0].num_instances)
+
+            # the solver is killed rather than left running
+            eventlet.sleep(0.3)
+            self.assertEqual([], solves)
+            record.assert_called_once_with(False, 10)
+
+    def test_schedule_speculative_fallback_leaves_host_states(self):
+        request_spec = self._get_speculative_request()
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        def fake_solve_with_alternates(hosts, filter_properties,
+                                       num_alternates):
+            # let the fallback run before the solution is used
+            eventlet.sleep(0.001)
+            return [(hosts[1], 'fake-uuid1')], []
+
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.hosts_solver,
+                                  'solve_with_alternates'),
+                mock.patch.object(sched.fallback_scheduler.host_manager,
+                                  'get_filtered_hosts'),
+                mock.patch.object(sched.fallback_scheduler.host_manager,
+                                  'get_weighed_hosts')) as (
+                get_all, solve_with_alternates, get_filtered_hosts,
+                get_weighed_hosts):
+            get_all.return_value = fakes.COMPUTE_NODES
+            solve_with_alternates.side_effect = fake_solve_with_alternates
+            get_filtered_hosts.side_effect = (
+                    lambda hosts, filter_properties, index: hosts)
+            get_weighed_hosts.side_effect = (
+                    lambda hosts, filter_properties:
+                    [weights.WeighedHost(host, 1) for host in hosts])
+            selected_hosts = sched._schedule(fake_context, request_spec, {})
+
+            hosts = solve_with_alternates.call_args[0][0]
+            self.assertEqual([hosts[1]],
+                             [host.obj for host in selected_hosts])
+            # the fallback lost, and what it consumed from its copy of the
+            # host state is not seen on the host state itself
+            fallback_hosts = get_filtered_hosts.call_args[0][0]
+            self.assertEqual({1: 1},
+                             fallback_hosts[0].num_instances_by_project)
+            self.assertEqual({}, hosts[0].num_instances_by_project)
+            self.assertEqual({}, hosts[0].vm_states)
+            self.assertEqual(0, hosts[0].num_instances)
+
+    def test_schedule_circuit_breaker_open(self):
+        request_spec = self._get_speculative_request()
+        self.flags(speculative_fallback_deadline_ms=0,
+                   group='solver_scheduler')
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.hosts_solver,
+                                  'solve_with_alternates'),
+                mock.patch.object(sched.solver_circuit_breaker,
+                                  'allow_request'),
+                mock.patch.object(sched, '_get_fallback_selected_hosts')) as (
+                get_all, solve_with_alternates, allow_request,
+                fallback_selected_hosts):
+            get_all.return_value = fakes.COMPUTE_NODES
+            allow_request.return_value = False
+            fallback_selected_hosts.return_value = ['fake_host']
+            selected_hosts = sched._schedule(fake_context, request_spec, {})
+
+            self.assertEqual(['fake_host'], selected_hosts)
+            self.assertFalse(solve_with_alternates.called)
+
+    def test_schedule_records_solver_outcomes(self):
+        self.flags(scheduler_solver_constraints=[
+                    'NonTrivialSolutionConstraint',
+                    'ValidSolutionConstraint'], group='solver_scheduler')
+        request_spec = self._get_speculative_request()
+        self.flags(enable_fallback_scheduler=False,
+                   group='solver_scheduler')
+        sched = fakes.FakeSolverScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        self.stubs.Set(sched.host_manager,
+                       'get_hosts_stripping_ignored_and_forced',
+                       fake_get_hosts_stripping_ignored_and_forced)
+
+        with contextlib.nested(
+                mock.patch.object(db, 'compute_node_get_all'),
+                mock.patch.object(sched.solver_circuit_breaker, 'record')) as (
+                get_all, record):
+            get_all.return_value = fakes.COMPUTE_NODES
+            sched._schedule(fake_context, request_spec, {})
+            record.assert_called_once_with(True, mock.ANY)
+
+            get_all.return_value = []
+            self.assertRaises(solver_scheduler_exception.SolverFailed,
+                              sched._schedule, fake_context,
+                              request_spec, {})
+            record.assert_called_with(False, mock.ANY)
+
+    def _get_reschedule_request(self):
+        request_spec = {'instance_type': {'memory_mb': 512, 'root_gb': 1,
+                                          'ephemeral_gb': 0, 'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 1,
+                                                'memory_mb': 512,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'},
+                        'instance_uuids': ['fake-uuid1'],
+                        'num_instances': 1}
+        alternates = [host_manager.HostState('host2', 'node2'),
+                      host_manager.HostState('host3', 'node3')]
+        for host_state in alternates:
+            host_state.generation = 1
+            self.driver.host_manager.host_state_map[
+                    (host_state.host, host_state.nodename)] = host_state
+        self.driver._record_alternates(alternates,
+                {'request_spec': request_spec,
+                 'instance_uuids': ['fake-uuid1']})
+        filter_properties = {'retry': {'num_attempts': 1,
+                                       'hosts': [['host1', 'node1']]}}
+        return request_spec, filter_properties, alternates
+
+    def _select_alternate_destinations(self, request_spec,
+                                       filter_properties, services=None):
+        services = services or {}
+
+        def fake_service_get_by_compute_host(context, host):
+            return services.get(host) or {'host': host, 'disabled': False}
+
+        with contextlib.nested(
+                mock.patch.object(db, 'service_get_by_compute_host',
+                                  side_effect=(
+                                        fake_service_get_by_compute_host)),
+                mock.patch.object(self.driver.servicegroup_api,
+                                  'service_is_up',
+                                  side_effect=lambda service:
+                                        service.get('up', True)),
+                mock.patch.object(self.driver, '_schedule')) as (
+                service_get, service_is_up, schedule_mock):
+            dests = self.driver.select_destinations(self.context,
+                    request_spec, filter_properties)
+            self.assertFalse(schedule_mock.called)
+        return dests
+
+    def test_select_destinations_reschedule_to_alternate(self):
+        self.flags(scheduler_max_attempts=3)
+        request_spec, filter_properties, alternates = (
+                self._get_reschedule_request())
+        alternates[0].generation = 2
+
+        dests = self._select_alternate_destinations(request_spec,
+                                                    filter_properties)
+        # host2 changed since the solve, so host3 is used
+        self.assertEqual([dict(host='host3', nodename='node3', limits={})],
+                         dests)
+        self.assertEqual(2, filter_properties['retry']['num_attempts'])
+        self.assertEqual(1, alternates[1].num_instances)
+
+    def test_select_destinations_reschedule_skips_dead_alternate(self):
+        self.flags(scheduler_max_attempts=3)
+        request_spec, filter_properties, alternates = (
+                self._get_reschedule_request())
+
+        # host2 stopped reporting, so its generation did not change
+        dests = self._select_alternate_destinations(request_spec,
+                filter_properties,
+                services={'host2': {'host': 'host2', 'disabled': False,
+                                    'up': False}})
+        self.assertEqual([dict(host='host3', nodename='node3', limits={})],
+                         dests)
+        self.assertEqual(0, alternates[0].num_instances)
+
+    def test_select_destinations_reschedule_skips_disabled_alternate(self):
+        self.flags(scheduler_max_attempts=3)
+        request_spec, filter_properties, alternates = (
+                self._get_reschedule_request())
+
+        dests = self._select_alternate_destinations(request_spec,
+                filter_properties,
+                services={'host2': {'host': 'host2', 'disabled': True}})
+        self.assertEqual([dict(host='host3', nodename='node3', limits={})],
+                         dests)
+
+    def test_select_destinations_reschedule_skips_removed_alternate(self):
+        self.flags(scheduler_max_attempts=3)
+        request_spec, filter_properties, alternates = (
+                self._get_reschedule_request())
+        del self.driver.host_manager.host_state_map[('host2', 'node2')]
+
+        dests = self._select_alternate_destinations(request_spec,
+                                                    filter_properties)
+        self.assertEqual([dict(host='host3', nodename='node3', limits={})],
+                         dests)
+
+    def test_select_destinations_reschedule_without_alternate(self):
+        self.flags(scheduler_max_attempts=3)
+        request_spec, filter_properties, alternates = (
+                self._get_reschedule_request())
+        filter_properties['retry']['hosts'].append(['host3', 'node3'])
+        alternates[0].generation = 2
+
+        with mock.patch.object(self.driver, '_schedule',
+                               return_value=[]) as schedule_mock:
+            self.assertRaises(exception.NoValidHost,
+                              self.driver.select_destinations, self.context,
+                              request_spec, filter_properties)
+            self.assertTrue(schedule_mock.called)
+
     def test_select_destinations_no_valid_host(self):
 
         def _return_no_host(*args, **kwargs):
@@ -396,6 +930,140 @@ class SolverSchedulerTestCase(test_scheduler.SchedulerTestCase):
                           self.driver.select_destinations, self.context,
                           {'num_instances': 1}, {})
 
+    def test_select_destinations_coalesced(self):
+        self.flags(request_coalescing_window_ms=10, group='solver_scheduler')
+        instance_properties = {'project_id': 1, 'os_type': 'Linux'}
+        request_spec1 = {'instance_type': {'memory_mb': 512},
+                         'instance_properties': instance_properties,
+                         'instance_uuids': ['fake-uuid1', 'fake-uuid2'],
+                         'num_instances': 2}
+        request_spec2 = {'instance_type': {'memory_mb': 512},
+                         'instance_properties': instance_properties,
+                         'instance_uuids': ['fake-uuid3'],
+                         'num_instances': 1}
+        dests = [dict(host='host%s' % i, nodename='node%s' % i, limits={})
+                 for i in range(3)]
+
+        with mock.patch.object(self.driver, '_select_destinations',
+                               return_value=dests) as select_mock:
+            thread1 = eventlet.spawn(self.driver.select_destinations,
+                                     self.context, request_spec1, {})
+            thread2 = eventlet.spawn(self.driver.select_destinations,
+                                     self.context, request_spec2, {})
+            self.assertEqual(dests[0:2], thread1.wait())
+            self.assertEqual(dests[2:3], thread2.wait())
+
+            self.assertEqual(1, select_mock.call_count)
+            merged_spec = select_mock.call_args[0][1]
+            self.assertEqual(3, merged_spec['num_instances'])
+            self.assertEqual(['fake-uuid1', 'fake-uuid2', 'fake-uuid3'],
+                             merged_spec['instance_uuids'])
+
+    def test_select_destinations_coalesced_incompatible(self):
+        self.flags(request_coalescing_window_ms=10, group='solver_scheduler')
+        request_spec1 = {'instance_type': {'memory_mb': 512},
+                         'instance_properties': {'project_id': 1},
+                         'num_instances': 1}
+        request_spec2 = {'instance_type': {'memory_mb': 512},
+                         'instance_properties': {'project_id': 2},
+                         'num_instances': 1}
+
+        with mock.patch.object(self.driver, '_select_destinations',
+                               return_value=['dest']) as select_mock:
+            thread1 = eventlet.spawn(self.driver.select_destinations,
+                                     self.context, request_spec1, {})
+            thread2 = eventlet.spawn(self.driver.select_destinations,
+                                     self.context, request_spec2, {})
+            thread1.wait()
+            thread2.wait()
+            self.assertEqual(2, select_mock.call_count)
+
+    def test_select_destinations_coalesced_multiple_flavors(self):
+        self.flags(request_coalescing_window_ms=10, group='solver_scheduler')
+        request_spec1 = {'instance_type': {'memory_mb': 512},
+                         'instance_properties': {'project_id': 1},
+                         'instance_uuids': ['fake-uuid1', 'fake-uuid2'],
+                         'num_instances': 2}
+        request_spec2 = {'instance_type': {'memory_mb': 1024},
+                         'instance_properties': {'project_id': 1},
+                         'instance_uuids': ['fake-uuid3'],
+                         'num_instances': 1}
+        request_spec3 = {'instance_type': {'memory_mb': 512},
+                         'instance_properties': {'project_id': 1},
+                         'instance_uuids': ['fake-uuid4'],
+                         'num_instances': 1}
+        dests_list = [[dict(host='host%s' % i, nodename='node%s' % i,
+                            limits={}) for i in range(3)],
+                      [dict(host='host3', nodename='node3', limits={})]]
+
+        with contextlib.nested(
+                mock.patch.object(self.driver, '_select_destinations'),
+                mock.patch.object(self.driver, '_select_destinations_multi',
+                                  return_value=dests_list)) as (
+                select_mock, select_multi_mock):
+            threads = [eventlet.spawn(self.driver.select_destinations,
+                                      self.context, request_spec, {})
+                       for request_spec in (request_spec1, request_spec2,
+                                            request_spec3)]
+            self.assertEqual(dests_list[0][0:2], threads[0].wait())
+            self.assertEqual(dests_list[1], threads[1].wait())
+            self.assertEqual(dests_list[0][2:3], threads[2].wait())
+
+            self.assertFalse(select_mock.called)
+            self.assertEqual(1, select_multi_mock.call_count)
+            request_specs = select_multi_mock.call_args[0][1]
+            self.assertEqual(['fake-uuid1', 'fake-uuid2', 'fake-uuid4'],
+                             request_specs[0]['instance_uuids'])
+            self.assertEqual(['fake-uuid3'],
+                             request_specs[1]['instance_uuids'])
+
+    def test_select_destinations_multi(self):
+        host1 = host_manager.HostState('host1', 'node1')
+        host2 = host_manager.HostState('host2', 'node2')
+        request_specs = [{'num_instances': 1}, {'num_instances': 2}]
+        selected_hosts_list = [[weights.WeighedHost(host1, 1)],
+                               [weights.WeighedHost(host1, 1),
+                                weights.WeighedHost(host2, 1)]]
+
+        with mock.patch.object(self.driver, '_schedule_multi',
+                               return_value=selected_hosts_list):
+            dests_list = self.driver._select_destinations_multi(
+                    self.context, request_specs, [{}, {}])
+        self.assertEqual([['host1'], ['host1', 'host2']],
+                         [[dest['host'] for dest in dests]
+                          for dests in dests_list])
+
+        selected_hosts_list[1].pop()
+        with mock.patch.object(self.driver, '_schedule_multi',
+                               return_value=selected_hosts_list):
+            self.assertRaises(exception.NoValidHost,
+                              self.driver._select_destinations_multi,
+                              self.context, request_specs, [{}, {}])
+
+    def test_select_destinations_coalesced_no_valid_host(self):
+        self.flags(request_coalescing_window_ms=10, group='solver_scheduler')
+        request_spec = {'instance_type': {'memory_mb': 512},
+                        'instance_properties': {'project_id': 1},
+                        'num_instances': 1}
+
+        def fake_select_destinations(context, request_spec,
+                                     filter_properties):
+            if request_spec['num_instances'] > 1:
+                raise exception.NoValidHost(reason='')
+            return ['dest']
+
+        with mock.patch.object(self.driver, '_select_destinations',
+                               side_effect=fake_select_destinations) as (
+                                                            select_mock):
+            thread1 = eventlet.spawn(self.driver.select_destinations,
+                                     self.context, dict(request_spec), {})
+            thread2 = eventlet.spawn(self.driver.select_destinations,
+                                     self.context, dict(request_spec), {})
+            self.assertEqual(['dest'], thread1.wait())
+            self.assertEqual(['dest'], thread2.wait())
+            # one joint attempt, then each request on its own
+            self.assertEqual(3, select_mock.call_count)
+
     def test_handles_deleted_instance(self):
         """Test instance deletion while being scheduled."""
 
@@ -420,3 +1088,68 @@ class SolverSchedulerTestCase(test_scheduler.SchedulerTestCase):
         sched._provision_resource(fake_context, selected_host,
                                   request_spec, filter_properties,
                                   None, None, None, None)
+
+
+class SolverCircuitBreakerTestCase(test.NoDBTestCase):
+    """Test case for the solver circuit breaker."""
+
+    def setUp(self):
+        super(SolverCircuitBreakerTestCase, self).setUp()
+        self.flags(solver_circuit_breaker_window=4,
+                   solver_circuit_breaker_failure_ratio=0.5,
+                   solver_circuit_breaker_cooldown_seconds=30,
+                   group='solver_scheduler')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.breaker = solver_scheduler.SolverCircuitBreaker()
+
+    def _open_breaker(self):
+        for success in (True, False, True, False):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record(success, 10)
+        self.assertEqual(self.breaker.OPEN, self.breaker.state)
+
+    def test_opens_on_failures(self):
+        for success in (False, False, True):
+            self.breaker.record(success, 10)
+        # the window is not full yet
+        self.assertEqual(self.breaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record(True, 10)
+        self.assertEqual(self.breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_slow_solves_count_as_failures(self):
+        self.flags(solver_circuit_breaker_slow_solve_ms=100,
+                   group='solver_scheduler')
+        for duration_ms in (10, 200, 10, 200):
+            self.breaker.record(True, duration_ms)
+        self.assertEqual(self.breaker.OPEN, self.breaker.state)
+
+    def test_half_open_probe_succeeds(self):
+        self._open_breaker()
+        timeutils.advance_time_seconds(29)
+        self.assertFalse(self.breaker.allow_request())
+        timeutils.advance_time_seconds(2)
+        # one probe at a time
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record(True, 10)
+        self.assertEqual(self.breaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_half_open_probe_fails(self):
+        self._open_breaker()
+        timeutils.advance_time_seconds(31)
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record(False, 10)
+        self.assertEqual(self.breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_disabled(self):
+        self.flags(solver_circuit_breaker_window=0, group='solver_scheduler')
+        self.breaker = solver_scheduler.SolverCircuitBreaker()
+        for i in xrange(10):
+            self.breaker.record(False, 10)
+        self.assertTrue(self.breaker.allow_request())
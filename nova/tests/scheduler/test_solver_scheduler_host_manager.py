@@ -15,6 +15,9 @@
 """
 Tests For SolverSchedulerHostManager
 """
+import datetime
+
+from nova.compute import vm_states
 from nova.openstack.common import timeutils
 from nova.scheduler import solver_scheduler_host_manager as host_manager
 from nova import test
@@ -176,5 +179,63 @@ class SolverSchedulerHostManagerChangedNodesTestCase(test.NoDBTestCase):
 class SolverSchedulerHostStateTestCase(test.NoDBTestCase):
     """Test case for SolverSchedulerHostState class."""
 
-    # reserved for future uses
-    pass
+    def setUp(self):
+        super(SolverSchedulerHostStateTestCase, self).setUp()
+        self.host_state = host_manager.SolverSchedulerHostState(
+                'host1', 'node1')
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _get_compute(self, updated_at):
+        compute = dict(fakes.COMPUTE_NODES[0])
+        compute['updated_at'] = updated_at
+        return compute
+
+    def test_consume_from_instance_bumps_generation(self):
+        self.host_state.update_from_compute_node(self._get_compute(None))
+        generation = self.host_state.generation
+        free_ram_mb = self.host_state.free_ram_mb
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=256, vcpus=1,
+                        project_id='12345', vm_state=vm_states.BUILDING,
+                        task_state=None, os_type='Linux', uuid='fake-uuid')
+
+        self.host_state.consume_from_instance(instance)
+        self.assertEqual(generation + 1, self.host_state.generation)
+        self.assertEqual(free_ram_mb - 256, self.host_state.free_ram_mb)
+        self.assertEqual(1, self.host_state.num_instances)
+
+    def test_update_from_compute_node_bumps_generation_once(self):
+        now = timeutils.utcnow()
+        self.host_state.update_from_compute_node(self._get_compute(now))
+        generation = self.host_state.generation
+        # the same report again does not change the host state
+        self.host_state.update_from_compute_node(self._get_compute(now))
+        self.assertEqual(generation, self.host_state.generation)
+
+        self.host_state.update_from_compute_node(self._get_compute(
+                now + datetime.timedelta(seconds=5)))
+        self.assertEqual(generation + 1, self.host_state.generation)
+
+    def test_update_from_compute_node_without_timestamp(self):
+        self.host_state.update_from_compute_node(self._get_compute(None))
+        generation = self.host_state.generation
+        # a node which never reports a timestamp is not seen as changed
+        self.host_state.update_from_compute_node(self._get_compute(None))
+        self.assertEqual(generation, self.host_state.generation)
+
+    def test_update_from_compute_node_skips_reports_older_than_consume(self):
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.host_state.update_from_compute_node(self._get_compute(
+                now - datetime.timedelta(seconds=10)))
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=256, vcpus=1,
+                        project_id='12345', vm_state=vm_states.BUILDING,
+                        task_state=None, os_type='Linux', uuid='fake-uuid')
+        self.host_state.consume_from_instance(instance)
+        generation = self.host_state.generation
+        free_ram_mb = self.host_state.free_ram_mb
+
+        # a report sent before the instance was placed does not undo it
+        self.host_state.update_from_compute_node(self._get_compute(
+                now - datetime.timedelta(seconds=5)))
+        self.assertEqual(generation, self.host_state.generation)
+        self.assertEqual(free_ram_mb, self.host_state.free_ram_mb)